@@ -0,0 +1,199 @@
+import hashlib
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from flask.json import JSONEncoder
+from sqlalchemy import func
+from models import db, Artist, JobState, Venue, Show
+from counters import JOB_NAME as COUNTERS_JOB
+from recommendations import JOB_NAME as RECOMMENDATIONS_JOB
+from exporter import EXPORT_TABLES, FORMATS, iter_export, parse_since
+from geo import get_nearby_venues, parse_nearby_args
+from queries import (get_venues_by_cities, get_venue_details, get_artists, get_artist_details,
+                     get_shows_listing, parse_shows_args, get_calendar, parse_calendar_args)
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+class ApiJSONEncoder(JSONEncoder):
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return JSONEncoder.default(self, o)
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+api.json_encoder = ApiJSONEncoder
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+def count_and_max(model, *criteria):
+    # a row version of the matching rows: inserts and deletes change the
+    # count, updates the max(updated_at)
+    return (db.session.query(func.count(model.id)).filter(*criteria).as_scalar(),
+            db.session.query(func.max(model.updated_at)).filter(*criteria).as_scalar())
+
+
+def row_versions(*columns):
+    # all the scalar subqueries in a single round trip
+    return tuple(db.session.query(*columns).one())
+
+
+def conditional_json(versions, build):
+    # strong ETag and Last-Modified from the row versions; a matching
+    # If-None-Match answers 304 before build() runs. If-Modified-Since is
+    # not trusted on its own: a delete lowers a count but not the latest
+    # updated_at, only the ETag sees it.
+    etag = hashlib.sha1(repr((request.full_path,) + versions).encode()).hexdigest()
+    last_modified = max((value for value in versions if isinstance(value, datetime)), default=None)
+
+    not_modified = bool(request.if_none_match) and request.if_none_match.contains(etag)
+    response = Response(status=304) if not_modified else jsonify(build())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def recommendations_version():
+    # the similar venues and artists change with every run of the job
+    return db.session.query(JobState.updated_at).\
+        filter(JobState.name == RECOMMENDATIONS_JOB).as_scalar()
+
+
+def get_past_limit():
+    limit = request.args.get('past_limit', current_app.config['PAST_SHOWS_LIMIT'], type=int)
+    return max(0, limit)
+
+#----------------------------------------------------------------------------#
+# Endpoints.
+#----------------------------------------------------------------------------#
+
+@api.route('/venues')
+def venues():
+    genre = request.args.get('genre')
+    # the upcoming counters move when the rollover job runs, its watermark
+    # is part of the version too
+    watermark = db.session.query(JobState.watermark).filter(JobState.name == COUNTERS_JOB).as_scalar()
+    versions = row_versions(*count_and_max(Venue), *count_and_max(Show), watermark)
+    return conditional_json(versions, lambda: {'data': get_venues_by_cities(genre)})
+
+
+@api.route('/venues/nearby')
+def venues_nearby():
+    try:
+        latitude, longitude, radius, limit = parse_nearby_args(request.args, current_app.config)
+    except (KeyError, ValueError):
+        abort(400)
+    versions = row_versions(*count_and_max(Venue))
+    return conditional_json(versions, lambda: {
+        'data': get_nearby_venues(latitude, longitude, radius, limit)})
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    now = datetime.now()
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)
+    versions = row_versions(*count_and_max(Venue, Venue.id == venue_id),
+                            *count_and_max(Show, Show.venue_id == venue_id),
+                            *count_and_max(Show, Show.venue_id == venue_id, Show.start_time >= now),
+                            *count_and_max(Artist, Artist.id.in_(artist_ids)),
+                            recommendations_version())
+    if not versions[0]:
+        abort(404)
+    return conditional_json(versions, lambda: get_venue_details(venue_id, now, get_past_limit()))
+
+
+@api.route('/artists')
+def artists():
+    genre = request.args.get('genre')
+    versions = row_versions(*count_and_max(Artist))
+    return conditional_json(versions, lambda: {'data': get_artists(genre)})
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    now = datetime.now()
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id)
+    versions = row_versions(*count_and_max(Artist, Artist.id == artist_id),
+                            *count_and_max(Show, Show.artist_id == artist_id),
+                            *count_and_max(Show, Show.artist_id == artist_id, Show.start_time >= now),
+                            *count_and_max(Venue, Venue.id.in_(venue_ids)),
+                            recommendations_version())
+    if not versions[0]:
+        abort(404)
+    return conditional_json(versions, lambda: get_artist_details(artist_id, now, get_past_limit()))
+
+
+@api.route('/shows')
+def shows():
+    try:
+        after, limit, filters = parse_shows_args(request.args,
+                                                 current_app.config['SHOWS_PAGE_SIZE'],
+                                                 current_app.config['SHOWS_MAX_PAGE_SIZE'])
+    except ValueError:
+        abort(400)
+
+    def build():
+        data, next_cursor = get_shows_listing(after, limit, **filters)
+        return {'data': data, 'next_cursor': next_cursor}
+
+    versions = row_versions(*count_and_max(Show), *count_and_max(Venue), *count_and_max(Artist))
+    return conditional_json(versions, build)
+
+
+@api.route('/calendar')
+def calendar():
+    try:
+        bucket, start, end, filters = parse_calendar_args(request.args,
+                                                          current_app.config['CALENDAR_MAX_BUCKETS'])
+    except ValueError:
+        abort(400)
+    now = datetime.now()
+
+    def build():
+        return {
+            'bucket': bucket,
+            'start': start,
+            'end': end,
+            'data': get_calendar(bucket, start, end, now=now,
+                                 past_ttl=current_app.config['CALENDAR_PAST_TTL'], **filters),
+        }
+
+    # which buckets are past moves with the clock
+    criteria = [Show.start_time >= start, Show.start_time < end] + \
+        [getattr(Show, name) == value for name, value in filters.items() if value is not None]
+    versions = row_versions(*count_and_max(Show, *criteria)) + (now.date(),)
+    return conditional_json(versions, build)
+
+
+@api.route('/export/<kind>')
+def export(kind):
+    if kind not in EXPORT_TABLES:
+        abort(404)
+    format = request.args.get('format', 'jsonl')
+    compress = request.args.get('compress') == 'gzip'
+    if format not in FORMATS:
+        abort(400)
+    try:
+        since = parse_since(request.args.get('since'))
+    except (ValueError, OverflowError):
+        abort(400)
+
+    chunks = iter_export(kind, format, since, compress, current_app.config['EXPORT_BATCH_SIZE'])
+    filename = '{}.{}{}'.format(kind, format, '.gz' if compress else '')
+    response = Response(stream_with_context(chunks),
+                        mimetype='application/gzip' if compress else
+                        'text/csv' if format == 'csv' else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename={}'.format(filename)
+    return response
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({'error': error.name, 'status': error.code}), error.code
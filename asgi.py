@@ -0,0 +1,261 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import asyncpg
+from flask import render_template
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import HTMLResponse
+from starlette.routing import Mount, Route
+
+from wsgi import app as flask_app
+from cache import cache
+from queries import artist_details, group_venues_by_city, similar_details, venue_details
+
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#----------------------------------------------------------------------------#
+
+# an optional way to serve the app (see requirements-asgi.txt):
+#
+#   uvicorn asgi:app --workers 4
+#
+# the venue and artist directories and detail pages are served by async
+# views on asyncpg, reading from a replica when DB_REPLICA_URLS is set, and
+# run their queries concurrently. everything else, and every request of a
+# client with flashed messages or inside its read-your-writes window, goes
+# to the unchanged Flask app.
+
+#----------------------------------------------------------------------------#
+# Database.
+#----------------------------------------------------------------------------#
+
+def asyncpg_dsn(url):
+    # asyncpg takes plain postgresql:// urls, without a SQLAlchemy driver
+    return 'postgresql://' + url.split('://', 1)[1]
+
+
+class Database(object):
+
+    def __init__(self):
+        self.pools = []
+
+    async def connect(self):
+        config = flask_app.config
+        options = {
+            'min_size': config['ASYNC_DB_POOL_MIN_SIZE'],
+            'max_size': config['ASYNC_DB_POOL_MAX_SIZE'],
+        }
+        if config['DB_PGBOUNCER']:
+            # PgBouncer in transaction mode cannot keep prepared statements
+            options['statement_cache_size'] = 0
+        elif config['DB_STATEMENT_TIMEOUT']:
+            options['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}
+        urls = config['DB_REPLICA_URLS'] or [config['SQLALCHEMY_DATABASE_URI']]
+        self.pools = [await asyncpg.create_pool(asyncpg_dsn(url), **options) for url in urls]
+
+    async def close(self):
+        await asyncio.gather(*[pool.close() for pool in self.pools])
+
+    def pool(self):
+        return random.choice(self.pools)
+
+
+database = Database()
+
+
+def as_object(record):
+    return SimpleNamespace(**dict(record)) if record is not None else None
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+GENRE_FILTER = '''
+    EXISTS (SELECT 1 FROM {association} a JOIN "Genre" g ON g.id = a.genre_id
+            WHERE a.{key} = {table}.id AND g.name = $1)'''
+
+DETAIL_QUERIES = {
+    'venue': {
+        'entity': 'SELECT * FROM "Venue" WHERE id = $1',
+        'genres': '''SELECT g.name FROM venue_genres a JOIN "Genre" g ON g.id = a.genre_id
+                     WHERE a.venue_id = $1 ORDER BY g.name''',
+        'shows': '''SELECT c.id, c.name, c.image_link, s.start_time
+                    FROM "Show" s JOIN "Artist" c ON c.id = s.artist_id
+                    WHERE s.venue_id = $1 AND {where}''',
+        'past_count': 'SELECT count(*) FROM "Show" WHERE venue_id = $1 AND start_time < $2',
+        'similar': '''SELECT c.id, c.name, c.image_link, s.shared
+                      FROM venue_similarities s JOIN "Venue" c ON c.id = s.similar_id
+                      WHERE s.venue_id = $1 ORDER BY s.rank''',
+    },
+    'artist': {
+        'entity': 'SELECT * FROM "Artist" WHERE id = $1',
+        'genres': '''SELECT g.name FROM artist_genres a JOIN "Genre" g ON g.id = a.genre_id
+                     WHERE a.artist_id = $1 ORDER BY g.name''',
+        'shows': '''SELECT c.id, c.name, c.image_link, s.start_time
+                    FROM "Show" s JOIN "Venue" c ON c.id = s.venue_id
+                    WHERE s.artist_id = $1 AND {where}''',
+        'past_count': 'SELECT count(*) FROM "Show" WHERE artist_id = $1 AND start_time < $2',
+        'similar': '''SELECT c.id, c.name, c.image_link, s.shared
+                      FROM artist_similarities s JOIN "Artist" c ON c.id = s.similar_id
+                      WHERE s.artist_id = $1 ORDER BY s.rank''',
+    },
+}
+
+UPCOMING = 's.start_time >= $2 ORDER BY s.start_time, s.id'
+PAST = 's.start_time < $2 ORDER BY s.start_time DESC, s.id DESC LIMIT $3'
+
+
+async def fetch_venues_by_cities(genre=None):
+    sql = 'SELECT city, state, id, name, upcoming_shows_count FROM "Venue"'
+    args = []
+    if genre:
+        sql += ' WHERE' + GENRE_FILTER.format(association='venue_genres', key='venue_id', table='"Venue"')
+        args.append(genre)
+    rows = await database.pool().fetch(sql + ' ORDER BY city, state, id', *args)
+    return group_venues_by_city([tuple(row) for row in rows])
+
+
+async def fetch_artists(genre=None):
+    sql = 'SELECT id, name FROM "Artist"'
+    args = []
+    if genre:
+        sql += ' WHERE' + GENRE_FILTER.format(association='artist_genres', key='artist_id', table='"Artist"')
+        args.append(genre)
+    return [{'id': row['id'], 'name': row['name']} for row in await database.pool().fetch(sql, *args)]
+
+
+async def fetch_details(kind, entity_id, now, past_limit):
+    # the entity, its genres, its upcoming and past shows, the number of
+    # past shows and the similar entities: six queries on six pooled
+    # connections, all at once
+    pool = database.pool()
+    queries = DETAIL_QUERIES[kind]
+    entity, genres, upcoming, past, past_count, similar = await asyncio.gather(
+        pool.fetchrow(queries['entity'], entity_id),
+        pool.fetch(queries['genres'], entity_id),
+        pool.fetch(queries['shows'].format(where=UPCOMING), entity_id, now),
+        pool.fetch(queries['shows'].format(where=PAST), entity_id, now, past_limit),
+        pool.fetchval(queries['past_count'], entity_id, now),
+        pool.fetch(queries['similar'], entity_id),
+    )
+    if entity is None:
+        return None
+
+    def pairs(rows):
+        return [(as_object(row), SimpleNamespace(start_time=row['start_time'])) for row in rows]
+
+    build = venue_details if kind == 'venue' else artist_details
+    data = build(as_object(entity), [row['name'] for row in genres],
+                 pairs(past), pairs(upcoming), past_count)
+    data['similar_{}s'.format(kind)] = similar_details([tuple(row) for row in similar])
+    return data
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+def flask_session(request):
+    # the Flask session of the request, read only
+    cookie = request.cookies.get(flask_app.session_cookie_name)
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return {}
+    try:
+        return serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def render(request, template, **context):
+    # Flask templates need a Flask request context for url_for and
+    # request.endpoint
+    path = request.url.path
+    with flask_app.test_request_context(path, query_string=request.url.query):
+        return render_template(template, **context)
+
+
+class ReadView(object):
+    # an ASGI endpoint that renders a cached page from async queries, or
+    # hands the request over to Flask. starlette routes every method to a
+    # class endpoint, only GET and HEAD are read here.
+
+    def __init__(self, name, template, tag, fetch):
+        self.name = name
+        self.template = template
+        self.tag = tag
+        self.fetch = fetch
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] not in ('GET', 'HEAD'):
+            await wsgi_app(scope, receive, send)
+            return
+        request = Request(scope, receive)
+        session = flask_session(request)
+        if session.get('_flashes') or time.time() < session.get('_db_primary_until', 0):
+            await wsgi_app(scope, receive, send)
+            return
+
+        async def build():
+            context = await self.fetch(request)
+            if context is None:
+                return None
+            return render(request, self.template, **context)
+
+        # the key and tags of Flask's cached_view, the two share the cache
+        key = 'view:{}?{}'.format(request.url.path, request.url.query)
+        html = await cache.get_or_set_async(key, [self.tag.format(**request.path_params)],
+                                            build, namespace=self.name)
+        if html is None:
+            await wsgi_app(scope, receive, send)
+            return
+        await HTMLResponse(html)(scope, receive, send)
+
+
+def past_limit(request):
+    try:
+        limit = int(request.query_params.get('past_limit', flask_app.config['PAST_SHOWS_LIMIT']))
+    except ValueError:
+        limit = flask_app.config['PAST_SHOWS_LIMIT']
+    return max(0, limit)
+
+
+async def venues(request):
+    return {'areas': await fetch_venues_by_cities(request.query_params.get('genre'))}
+
+
+async def artists(request):
+    return {'artists': await fetch_artists(request.query_params.get('genre'))}
+
+
+async def show_venue(request):
+    venue = await fetch_details('venue', request.path_params['venue_id'], datetime.now(), past_limit(request))
+    return {'venue': venue} if venue else None
+
+
+async def show_artist(request):
+    artist = await fetch_details('artist', request.path_params['artist_id'], datetime.now(), past_limit(request))
+    return {'artist': artist} if artist else None
+
+
+app = Starlette(
+    routes=[
+        Route('/venues', ReadView('venues', 'pages/venues.html', 'venues', venues)),
+        Route('/venues/{venue_id:int}', ReadView('show_venue', 'pages/show_venue.html',
+                                                 'venue:{venue_id}', show_venue)),
+        Route('/artists', ReadView('artists', 'pages/artists.html', 'artists', artists)),
+        Route('/artists/{artist_id:int}', ReadView('show_artist', 'pages/show_artist.html',
+                                                   'artist:{artist_id}', show_artist)),
+        Mount('/', wsgi_app),
+    ],
+    on_startup=[database.connect],
+    on_shutdown=[database.close],
+)
@@ -0,0 +1,170 @@
+"""Throughput and latency of the read pages under many concurrent clients,
+sync (WSGI) against async (ASGI) deployments of the same database.
+
+    gunicorn -w 4 -b :8000 wsgi:app
+    uvicorn asgi:app --workers 4 --port 8001
+    python -m benchmarks.asgi_throughput --sync-url http://localhost:8000 \\
+        --async-url http://localhost:8001 --clients 500 --out bench/asgi.json
+
+Each client is a keep-alive HTTP/1.1 connection requesting the venue and
+artist directories and detail pages back to back, without think time. Run
+with CACHE_TYPE=null on both servers to compare the database paths, and
+with an open file limit above the number of clients.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import urllib.parse
+from datetime import datetime
+
+from benchmarks.load import percentile
+from benchmarks.routes import git_revision
+
+# (name, weight, path template)
+PAGES = [
+    ('venues', 1, '/venues'),
+    ('artists', 1, '/artists'),
+    ('show_venue', 4, '/venues/{venue}'),
+    ('show_artist', 4, '/artists/{artist}'),
+]
+
+
+class Client(object):
+    # one keep-alive connection, reopened after an error or a close
+
+    def __init__(self, url, venues, artists, rng):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.venues = venues
+        self.artists = artists
+        self.rng = rng
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write('GET {} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(path, self.host).encode())
+        await self.writer.drain()
+        version, status = (await self.reader.readline()).split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.read()
+            await self.close()
+        # HTTP/1.0 servers, e.g. werkzeug's, close unless told otherwise
+        keep_alive = 'close' if version == b'HTTP/1.0' else 'keep-alive'
+        if headers.get('connection', keep_alive).lower() == 'close':
+            await self.close()
+        return int(status)
+
+    async def run(self, measure_from, deadline, samples):
+        weights = [weight for _, weight, _ in PAGES]
+        while time.monotonic() < deadline:
+            name, _, template = self.rng.choices(PAGES, weights=weights)[0]
+            path = template.format(venue=self.rng.randint(1, self.venues),
+                                   artist=self.rng.randint(1, self.artists))
+            started = time.perf_counter()
+            try:
+                ok = await self.get(path) < 400
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                await self.close()
+                ok = False
+            if time.monotonic() >= measure_from:
+                samples.append((name, (time.perf_counter() - started) * 1000, ok))
+        await self.close()
+
+
+async def hammer(url, clients, duration, warmup, venues, artists, seed):
+    # warmup seconds of traffic first, then duration seconds measured
+    samples = []
+    measure_from = time.monotonic() + warmup
+    await asyncio.gather(*[
+        Client(url, venues, artists, random.Random(seed + i)).run(measure_from, measure_from + duration, samples)
+        for i in range(clients)])
+    return summarize(samples, duration)
+
+
+def summarize(samples, duration):
+    timings = sorted(elapsed for _, elapsed, _ in samples) or [0]
+    return {
+        'requests': len(samples),
+        'failures': sum(1 for _, _, ok in samples if not ok),
+        'rps': round(len(samples) / duration, 1),
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'max_ms': round(timings[-1], 2),
+    }
+
+
+def print_report(report):
+    print('{:<8}{:>10}{:>10}{:>9}{:>11}{:>9}{:>9}{:>9}'.format(
+        'server', 'requests', 'failures', 'rps', 'median ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for name, row in report.items():
+        print('{:<8}{:>10}{:>10}{:>9.1f}{:>11.1f}{:>9.1f}{:>9.1f}{:>9.1f}'.format(
+            name, row['requests'], row['failures'], row['rps'], row['median_ms'],
+            row['p95_ms'], row['p99_ms'], row['max_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sync-url', help='a running WSGI server')
+    parser.add_argument('--async-url', help='a running ASGI server')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds')
+    parser.add_argument('--venues', type=int, default=500, help='ids 1..venues are requested')
+    parser.add_argument('--artists', type=int, default=1000, help='ids 1..artists are requested')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    args = parser.parse_args()
+    if not args.sync_url and not args.async_url:
+        parser.error('give --sync-url, --async-url or both')
+
+    report = {}
+    for name, url in (('sync', args.sync_url), ('async', args.async_url)):
+        if url:
+            report[name] = asyncio.run(hammer(url, args.clients, args.duration, args.warmup,
+                                              args.venues, args.artists, args.seed))
+    print_report(report)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'created': datetime.utcnow().isoformat(),
+                'clients': args.clients,
+                'duration': args.duration,
+                'servers': report,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
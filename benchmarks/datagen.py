@@ -0,0 +1,166 @@
+"""Seeded synthetic catalog: venues, artists and shows with skewed city,
+genre and venue popularity distributions.
+
+    python -m benchmarks.datagen --database-url sqlite:////tmp/bench.db --shows 100000
+
+The same seed always produces the same catalog. The target database is
+dropped and recreated, never point it at real data.
+"""
+import argparse
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from counters import rollover
+from models import db, Artist, Genre, Show, Venue, artist_genres, venue_genres
+from geo import encode
+from scheduling import IntervalIndex
+
+# roughly by number of live music venues, the first cities get most rows
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'),
+          ('Chicago', 'IL'), ('Seattle', 'WA'), ('Nashville', 'TN'),
+          ('New Orleans', 'LA'), ('Portland', 'OR'), ('Denver', 'CO'),
+          ('Boston', 'MA')]
+
+# city centres, venues are spread up to CITY_SPREAD degrees around them
+CITY_CENTRES = {'San Francisco': (37.7749, -122.4194), 'New York': (40.7128, -74.0060),
+                'Austin': (30.2672, -97.7431), 'Chicago': (41.8781, -87.6298),
+                'Seattle': (47.6062, -122.3321), 'Nashville': (36.1627, -86.7816),
+                'New Orleans': (29.9511, -90.0715), 'Portland': (45.5152, -122.6784),
+                'Denver': (39.7392, -104.9903), 'Boston': (42.3601, -71.0589)}
+CITY_SPREAD = 0.15
+
+GENRES = ['Rock n Roll', 'Pop', 'Alternative', 'Hip-Hop', 'Jazz', 'Electronic',
+          'Country', 'R&B', 'Folk', 'Blues', 'Punk', 'Heavy Metal', 'Soul',
+          'Funk', 'Reggae', 'Classical', 'Instrumental', 'Musical Theatre', 'Other']
+
+NAME_WORDS = ['Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Red', 'Silver',
+              'Wild', 'Broken', 'Neon', 'Lucky', 'Hollow', 'Echo', 'Stone', 'River']
+VENUE_KINDS = ['Hall', 'Room', 'Lounge', 'Theatre', 'Club', 'Tavern', 'Ballroom', 'Cafe']
+ARTIST_KINDS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Brothers', 'Quartet', 'Project']
+
+
+def zipf_weights(count, exponent=1.0):
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+class Generator(object):
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.city_weights = list(itertools.accumulate(zipf_weights(len(CITIES))))
+        self.genre_weights = list(itertools.accumulate(zipf_weights(len(GENRES), 0.8)))
+        self.popularity = {}
+        self.bookings = IntervalIndex()
+        # its own stream, coordinates do not change the rest of the catalog
+        self.geo_rng = random.Random(seed)
+
+    def name(self, kinds, number):
+        return '{} {} {} {}'.format(self.rng.choice(NAME_WORDS), self.rng.choice(NAME_WORDS),
+                                    self.rng.choice(kinds), number)
+
+    def city(self):
+        return self.rng.choices(CITIES, cum_weights=self.city_weights)[0]
+
+    def genres(self):
+        count = self.rng.choice((1, 1, 2, 2, 3))
+        return sorted({genre for genre in self.rng.choices(GENRES, cum_weights=self.genre_weights, k=count)})
+
+    def phone(self):
+        return '{}-{}-{}'.format(self.rng.randint(200, 999), self.rng.randint(200, 999),
+                                 self.rng.randint(1000, 9999))
+
+    def venue(self, id):
+        city, state = self.city()
+        venue = {
+            'id': id,
+            'name': self.name(VENUE_KINDS, id),
+            'city': city,
+            'state': state,
+            'address': '{} {} St'.format(self.rng.randint(1, 2000), self.rng.choice(NAME_WORDS)),
+            'phone': self.phone(),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(id),
+            'seeking_talent': self.rng.random() < 0.3,
+        }
+        latitude, longitude = CITY_CENTRES[city]
+        venue['latitude'] = latitude + self.geo_rng.uniform(-CITY_SPREAD, CITY_SPREAD)
+        venue['longitude'] = longitude + self.geo_rng.uniform(-CITY_SPREAD, CITY_SPREAD)
+        venue['geohash'] = encode(venue['latitude'], venue['longitude'])
+        return venue
+
+    def artist(self, id):
+        city, state = self.city()
+        return {
+            'id': id,
+            'name': self.name(ARTIST_KINDS, id),
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(id),
+            'seeking_venue': self.rng.random() < 0.3,
+        }
+
+    def popular(self, count):
+        # ids 1..count, the lower ids get more shows
+        if count not in self.popularity:
+            self.popularity[count] = list(itertools.accumulate(zipf_weights(count, 0.7)))
+        return self.rng.choices(range(1, count + 1), cum_weights=self.popularity[count])[0]
+
+    def show(self, venues, artists, now):
+        # evenings only, three years back and one year ahead, one to three
+        # hours long. draws that would double-book the venue or the artist
+        # are drawn again, the shows never conflict.
+        while True:
+            day = now.date() - timedelta(days=self.rng.randint(-365, 365 * 3))
+            start = datetime(day.year, day.month, day.day, self.rng.randint(18, 23),
+                             self.rng.choice((0, 30)))
+            end = start + timedelta(minutes=self.rng.choice((60, 90, 120, 120, 180)))
+            venue_id, artist_id = self.popular(venues), self.popular(artists)
+            if self.bookings.book(venue_id, artist_id, start, end) is None:
+                return {
+                    'venue_id': venue_id,
+                    'artist_id': artist_id,
+                    'start_time': start,
+                    'end_time': end,
+                }
+
+
+def seed(engine, venues, artists, shows, seed_value=0, batch_size=10000):
+    # returns nothing, the ids are 1..venues and 1..artists
+    generator = Generator(seed_value)
+    now = datetime.now()
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Genre.__table__.insert(), [{'id': i + 1, 'name': name} for i, name in enumerate(GENRES)])
+        genre_ids = {name: i + 1 for i, name in enumerate(GENRES)}
+        for model, association, fk, count, build in (
+                (Venue, venue_genres, 'venue_id', venues, generator.venue),
+                (Artist, artist_genres, 'artist_id', artists, generator.artist)):
+            for offset in range(0, count, batch_size):
+                rows = [build(id) for id in range(offset + 1, min(offset + batch_size, count) + 1)]
+                conn.execute(model.__table__.insert(), rows)
+                conn.execute(association.insert(), [
+                    {fk: row['id'], 'genre_id': genre_ids[name]}
+                    for row in rows for name in generator.genres()])
+        for offset in range(0, shows, batch_size):
+            conn.execute(Show.__table__.insert(), [
+                generator.show(venues, artists, now) for _ in range(min(batch_size, shows - offset))])
+        rollover(conn, now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/fyyur_bench.db')
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    seed(create_engine(args.database_url), args.venues, args.artists, args.shows, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Micro-benchmark of the `datetime` Jinja filter over a /shows-like load.
+
+    python -m benchmarks.datetime_filter --shows 100000
+
+The legacy path is what the filter did before: the view formats start_time
+with strftime and the filter parses it back with dateutil before handing it
+to babel.dates.format_datetime.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime, get_datetime_pattern, DATETIME_FORMATS
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format))
+
+
+def start_times(count, seed=0):
+    # shows start on the hour or half hour, so values repeat like they do
+    # on a real listing
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, 18)
+    return [start + timedelta(days=rng.randint(0, 365 * 3), minutes=30 * rng.randint(0, 10))
+            for _ in range(count)]
+
+
+def timed(fn, values):
+    started = time.perf_counter()
+    for value in values:
+        fn(value, 'full')
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    values = start_times(args.shows, args.seed)
+    for value in values[:100]:
+        assert format_datetime(value, 'full') == \
+            legacy_format_datetime(value.strftime("%m/%d/%Y, %H:%M"), 'full')
+
+    legacy = timed(lambda value, format: legacy_format_datetime(
+        value.strftime("%m/%d/%Y, %H:%M"), format), values)
+
+    format_datetime.cache_clear()
+    get_datetime_pattern.cache_clear()
+    uncached = timed(format_datetime.__wrapped__, values)
+    memoized = timed(format_datetime, values)
+    info = format_datetime.cache_info()
+
+    print('{} shows, {} distinct start times'.format(len(values), len(set(values))))
+    print('{:<28}{:>10}{:>14}{:>10}'.format('path', 'total (s)', 'per call (us)', 'speedup'))
+    for label, seconds in (('legacy (strftime + parse)', legacy),
+                           ('datetime, no memo', uncached),
+                           ('datetime, memoized', memoized)):
+        print('{:<28}{:>10.3f}{:>14.2f}{:>9.1f}x'.format(
+            label, seconds, seconds / len(values) * 1e6, legacy / seconds))
+    print('memo cache: {} hits, {} misses'.format(info.hits, info.misses))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Cold start of a web worker: `python -X importtime` summary of importing
+the WSGI entry point, which builds the app.
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --module wsgi --top 30 --out bench/importtime.json
+    python -m benchmarks.importtime --compare bench/importtime.json
+
+Every run starts a fresh interpreter and the fastest of --repeat runs is
+reported, as the self time of each module summed per top-level package.
+--compare exits with 1 when the total grew by more than --tolerance or a
+third-party package that was not imported before now is. Run it from the
+repository root.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+from benchmarks.routes import git_revision
+
+TOLERANCE = 0.2
+
+
+def parse(stderr):
+    # [(module, self us, cumulative us, depth)] in import order
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile(module, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    return parse(result.stderr)
+
+
+def summarize(runs):
+    # the run with the least total self time, per module and summed per
+    # top-level package
+    rows = min(runs, key=lambda rows: sum(self_us for _, self_us, _, _ in rows))
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        'total_ms': round(sum(self_us for _, self_us, _, _ in rows) / 1000, 1),
+        'modules': len(rows),
+        'packages': {name: round(us / 1000, 1) for name, us in packages.items()},
+        'self': {name: self_us for name, self_us, _, _ in rows},
+    }
+
+
+def print_report(report, top, baseline=None):
+    old = (baseline or {}).get('packages', {})
+    print('{} modules, {:.1f} ms'.format(report['modules'], report['total_ms']))
+    print('\n{:<40}{:>10}{:>10}'.format('package', 'ms', 'was ms' if baseline else ''))
+    for name, ms in sorted(report['packages'].items(), key=lambda item: -item[1])[:top]:
+        print('{:<40}{:>10.1f}{:>10}'.format(name, ms, '{:.1f}'.format(old.get(name, 0)) if baseline else ''))
+    if baseline:
+        for name in sorted(set(old) - set(report['packages']), key=lambda name: -old[name])[:top]:
+            print('{:<40}{:>10}{:>10.1f}'.format(name, '-', old[name]))
+        print('\nwas {} modules, {:.1f} ms'.format(baseline['modules'], baseline['total_ms']))
+    print('\n{:<40}{:>10}'.format('slowest modules', 'self ms'))
+    for name, us in sorted(report['self'].items(), key=lambda item: -item[1])[:top]:
+        print('{:<40}{:>10.1f}'.format(name, us / 1000))
+
+
+def regressions(baseline, report, tolerance):
+    # the entry point itself and first-party modules may move around, a
+    # new third-party package is what slows a cold start down
+    found = []
+    if report['total_ms'] > baseline['total_ms'] * (1 + tolerance):
+        found.append('{:.1f} ms, was {:.1f} ms'.format(report['total_ms'], baseline['total_ms']))
+    first_party = {os.path.splitext(name)[0] for name in os.listdir(os.getcwd())}
+    for name in sorted(set(report['packages']) - set(baseline['packages']) - first_party):
+        found.append('{} is now imported'.format(name))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='wsgi', help='the module a worker imports')
+    parser.add_argument('--database-url', default='sqlite:////tmp/fyyur_bench.db',
+                        help='only configures the app, nothing is queried')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='import time growth allowed by --compare, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    report = summarize([profile(args.module, args.database_url) for _ in range(args.repeat)])
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['report']
+    print_report(report, args.top, baseline)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'created': datetime.utcnow().isoformat(),
+                'module': args.module,
+                'python': sys.version.split()[0],
+                'report': report,
+            }, f, indent=2)
+
+    if baseline:
+        found = regressions(baseline, report, args.tolerance)
+        for line in found:
+            print('regression: ' + line)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Locust-style HTTP load scenario: simulated visitors browse the venue and
+artist directories, open detail pages, search and list shows, with think
+time between requests.
+
+    python -m benchmarks.load --users 20 --duration 30 --out bench/load.json
+    python -m benchmarks.load --host http://localhost:5000 --users 50
+
+Without --host a synthetic catalog is seeded and the app is served on a
+local threaded werkzeug server; the target database is dropped and
+recreated, never point it at real data. With --host, --venues and
+--artists are the id ranges requested.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from werkzeug.serving import make_server
+
+from benchmarks.datagen import NAME_WORDS, seed
+from benchmarks.routes import create_bench_app, git_revision
+
+
+class Visitor(object):
+    # one simulated user; tasks are picked by weight, like locust's @task
+
+    def __init__(self, host, venues, artists, think, rng):
+        self.host = host
+        self.venues = venues
+        self.artists = artists
+        self.think = think
+        self.rng = rng
+        self.tasks = [
+            (3, 'venues', self.venue_directory),
+            (3, 'artists', self.artist_directory),
+            (4, 'show_venue', self.venue_page),
+            (4, 'show_artist', self.artist_page),
+            (2, 'search_venues', self.search_venues),
+            (2, 'search_artists', self.search_artists),
+            (2, 'shows', self.shows),
+            (1, 'api_shows', self.api_shows),
+        ]
+        self.weights = [weight for weight, _, _ in self.tasks]
+
+    def request(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        with urllib.request.urlopen(self.host + path, data=body, timeout=30) as response:
+            response.read()
+            return response.status
+
+    def venue_directory(self):
+        return self.request('/venues')
+
+    def artist_directory(self):
+        return self.request('/artists')
+
+    def venue_page(self):
+        return self.request('/venues/{}'.format(self.rng.randint(1, self.venues)))
+
+    def artist_page(self):
+        return self.request('/artists/{}'.format(self.rng.randint(1, self.artists)))
+
+    def search_venues(self):
+        return self.request('/venues/search', {'search_term': self.rng.choice(NAME_WORDS)})
+
+    def search_artists(self):
+        return self.request('/artists/search', {'search_term': self.rng.choice(NAME_WORDS)})
+
+    def shows(self):
+        return self.request('/shows')
+
+    def api_shows(self):
+        return self.request('/api/v1/shows')
+
+    def run(self, deadline, stats, lock):
+        while time.monotonic() < deadline:
+            _, name, task = self.rng.choices(self.tasks, weights=self.weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = task() < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                stats[name].append((elapsed, ok))
+            time.sleep(self.rng.uniform(0, self.think))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(stats, duration):
+    report = {}
+    for name, samples in sorted(stats.items()):
+        timings = sorted(elapsed for elapsed, _ in samples)
+        report[name] = {
+            'requests': len(samples),
+            'failures': sum(1 for _, ok in samples if not ok),
+            'rps': round(len(samples) / duration, 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(timings[-1], 2),
+        }
+    return report
+
+
+def print_report(report):
+    print('{:<16}{:>9}{:>9}{:>8}{:>11}{:>9}{:>9}{:>9}'.format(
+        'task', 'requests', 'failures', 'rps', 'median ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for name, row in report.items():
+        print('{:<16}{:>9}{:>9}{:>8.1f}{:>11.1f}{:>9.1f}{:>9.1f}{:>9.1f}'.format(
+            name, row['requests'], row['failures'], row['rps'], row['median_ms'],
+            row['p95_ms'], row['p99_ms'], row['max_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', help='a running server, by default the app is served locally')
+    parser.add_argument('--database-url', default='sqlite:////tmp/fyyur_bench.db')
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', default='simple', help='CACHE_TYPE of the local app')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--think', type=float, default=0.5, help='maximum think time in seconds')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    server = None
+    host = args.host
+    if not host:
+        seed(create_engine(args.database_url), args.venues, args.artists, args.shows, args.seed)
+        server = make_server('127.0.0.1', 0, create_bench_app(args.database_url, args.cache), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    stats = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    visitors = [threading.Thread(target=Visitor(host.rstrip('/'), args.venues, args.artists, args.think,
+                                                random.Random(args.seed + i)).run,
+                                 args=(deadline, stats, lock))
+                for i in range(args.users)]
+    for visitor in visitors:
+        visitor.start()
+    for visitor in visitors:
+        visitor.join()
+    if server:
+        server.shutdown()
+
+    report = summarize(stats, args.duration)
+    print_report(report)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'created': datetime.utcnow().isoformat(),
+                'host': args.host or 'local',
+                'users': args.users,
+                'duration': args.duration,
+                'tasks': report,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
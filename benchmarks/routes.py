@@ -0,0 +1,239 @@
+"""Latency, query count and peak memory of every route of app.py, measured
+in process with the Flask test client against a synthetic catalog.
+
+    python -m benchmarks.routes --out bench/HEAD.json
+    python -m benchmarks.routes --compare bench/base.json --out bench/HEAD.json
+    python -m benchmarks.routes --check
+
+--compare prints the change against an earlier run and exits with 1 on a
+regression. --check requests every route once with the SQL profiler on and
+app.testing set, so a route over its query budget fails the run. The
+target database is dropped and recreated, never point it at real data.
+
+The tests of tests/test_routes.py run the same routes under pytest, each
+held to its query budget and to LATENCY_BUDGET_MS.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+from benchmarks.datagen import seed
+
+# (name, method, path, form data); the writes run last
+ROUTES = [
+    ('index', 'GET', '/', None),
+    ('venues', 'GET', '/venues', None),
+    ('venues_by_genre', 'GET', '/venues?genre=Jazz', None),
+    ('search_venues', 'POST', '/venues/search', {'search_term': 'Blue'}),
+    ('show_venue', 'GET', '/venues/1', None),
+    ('venues_nearby', 'GET', '/venues/nearby?lat=37.77&lon=-122.42&radius=10', None),
+    ('create_venue_form', 'GET', '/venues/create', None),
+    ('edit_venue', 'GET', '/venues/1/edit', None),
+    ('artists', 'GET', '/artists', None),
+    ('search_artists', 'POST', '/artists/search', {'search_term': 'Band'}),
+    ('show_artist', 'GET', '/artists/1', None),
+    ('create_artist_form', 'GET', '/artists/create', None),
+    ('edit_artist', 'GET', '/artists/1/edit', None),
+    ('shows', 'GET', '/shows', None),
+    ('create_shows', 'GET', '/shows/create', None),
+    ('calendar', 'GET', '/calendar?bucket=month&start=2019-01-01&end=2021-01-01', None),
+    ('calendar_venue', 'GET', '/calendar?bucket=day&venue_id=1', None),
+    ('api_venues', 'GET', '/api/v1/venues', None),
+    ('api_venue', 'GET', '/api/v1/venues/1', None),
+    ('api_venues_nearby', 'GET', '/api/v1/venues/nearby?lat=40.71&lon=-74.01&limit=5', None),
+    ('api_artists', 'GET', '/api/v1/artists', None),
+    ('api_artist', 'GET', '/api/v1/artists/1', None),
+    ('api_shows', 'GET', '/api/v1/shows', None),
+    ('api_calendar', 'GET', '/api/v1/calendar?bucket=week', None),
+    ('healthz_db', 'GET', '/healthz/db', None),
+    ('create_venue_submission', 'POST', '/venues/create', {
+        'name': 'Bench Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+        'phone': '512-555-0100', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/bench'}),
+    ('edit_venue_submission', 'POST', '/venues/1/edit', {
+        'name': 'Bench Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+        'phone': '512-555-0100', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/bench'}),
+    ('create_artist_submission', 'POST', '/artists/create', {
+        'name': 'Bench Band', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0101',
+        'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/benchband'}),
+    ('edit_artist_submission', 'POST', '/artists/1/edit', {
+        'name': 'Bench Band', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0101',
+        'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/benchband'}),
+    ('create_show_submission', 'POST', '/shows/create', {
+        'venue_id': '1', 'artist_id': '1',
+        'start_time': (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')}),
+]
+
+# best time allowed per route by tests/test_routes.py on its small catalog;
+# far above the usual times, it catches a route gone quadratic, not noise
+LATENCY_BUDGET_MS = 250
+
+# a best time this much slower than the baseline is a regression, above a
+# floor where timer noise dominates. min_ms is steadier than the median on
+# a shared machine.
+LATENCY_TOLERANCE = 0.2
+LATENCY_FLOOR_MS = 1.0
+MEMORY_TOLERANCE = 0.2
+
+
+def create_bench_app(database_url, cache='null', profiler=False):
+    # the app reads its configuration from the environment at import time
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['CACHE_TYPE'] = cache
+    os.environ['SQL_PROFILER'] = '1' if profiler else ''
+    from app import create_app
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.testing = profiler
+    return app
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self.incr)
+
+    def incr(self, *args):
+        self.count += 1
+
+
+def request(client, method, path, data):
+    response = client.open(path, method=method, data=data)
+    response.get_data()
+    response.close()
+    return response.status_code
+
+
+def measure(client, counter, method, path, data, repeat):
+    request(client, method, path, data)
+    timings = []
+    counter.count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        status = request(client, method, path, data)
+        timings.append((time.perf_counter() - started) * 1000)
+    queries = counter.count // repeat
+
+    tracemalloc.start()
+    request(client, method, path, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'status': status,
+        'queries': queries,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def regressions(baseline, results, tolerance=LATENCY_TOLERANCE):
+    found = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if result['queries'] > old['queries']:
+            found.append('{}: {} queries, was {}'.format(name, result['queries'], old['queries']))
+        if result['min_ms'] > max(old['min_ms'] * (1 + tolerance), LATENCY_FLOOR_MS):
+            found.append('{}: best {:.2f}ms, was {:.2f}ms'.format(name, result['min_ms'], old['min_ms']))
+        if result['peak_kib'] > old['peak_kib'] * (1 + MEMORY_TOLERANCE):
+            found.append('{}: peak {:.0f}KiB, was {:.0f}KiB'.format(name, result['peak_kib'], old['peak_kib']))
+    return found
+
+
+def print_report(results, baseline=None):
+    print('{:<26}{:>7}{:>9}{:>12}{:>10}{:>11}{:>10}'.format(
+        'route', 'status', 'queries', 'median ms', 'p95 ms', 'peak KiB', 'change'))
+    for name, result in results.items():
+        old = (baseline or {}).get(name)
+        change = '{:+.0%}'.format(result['median_ms'] / old['median_ms'] - 1) if old and old['median_ms'] else ''
+        print('{:<26}{:>7}{:>9}{:>12.2f}{:>10.2f}{:>11.1f}{:>10}'.format(
+            name, result['status'], result['queries'], result['median_ms'], result['p95_ms'],
+            result['peak_kib'], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/fyyur_bench.db')
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cache', default='null', help='CACHE_TYPE, null measures the database paths')
+    parser.add_argument('--check', action='store_true', help='every route once, with the query budgets')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=LATENCY_TOLERANCE,
+                        help='latency change allowed by --compare, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    seed(create_engine(args.database_url), args.venues, args.artists, args.shows, args.seed)
+    app = create_bench_app(args.database_url, args.cache, profiler=args.check)
+    client = app.test_client()
+
+    if args.check:
+        failed = False
+        for name, method, path, data in ROUTES:
+            try:
+                status = request(client, method, path, data)
+            except AssertionError as e:
+                print('{:<26} {}'.format(name, e))
+                failed = True
+                continue
+            print('{:<26} {}'.format(name, status))
+            failed = failed or status >= 500
+        sys.exit(1 if failed else 0)
+
+    counter = QueryCounter()
+    results = {}
+    for name, method, path, data in ROUTES:
+        results[name] = measure(client, counter, method, path, data, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+    print_report(results, baseline)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'created': datetime.utcnow().isoformat(),
+                'dataset': {'venues': args.venues, 'artists': args.artists, 'shows': args.shows,
+                            'seed': args.seed, 'database': args.database_url.split(':')[0]},
+                'routes': results,
+            }, f, indent=2)
+
+    if baseline:
+        found = regressions(baseline, results, args.tolerance)
+        for line in found:
+            print('regression: ' + line)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Seed a synthetic catalog and report query plans and timings of the Show
+hot paths without and with the indexes of migration 8a4e61c0d2f5.
+
+    python -m benchmarks.show_indexes --database-url sqlite:////tmp/bench.db
+    python -m benchmarks.show_indexes --database-url postgresql://.../benchdb
+
+The target database is dropped and recreated, never point it at real data.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, create_engine, text
+
+from benchmarks.datagen import CITIES, seed
+from models import Venue, Show
+
+HOT_PATH_INDEXES = ('ix_show_venue_id_start_time', 'ix_show_artist_id_start_time',
+                    'ix_show_start_time_id', 'ix_venue_city_state')
+
+QUERIES = {
+    'venue_directory': '''
+        SELECT v.city, v.state, v.id, v.name, count(s.id)
+        FROM "Venue" v LEFT OUTER JOIN "Show" s
+          ON s.venue_id = v.id AND s.start_time >= :now
+        GROUP BY v.id ORDER BY v.city, v.state, v.id''',
+    'venues_in_city': '''
+        SELECT v.id, v.name FROM "Venue" v
+        WHERE v.city = :city AND v.state = :state''',
+    'venue_shows': '''
+        SELECT a.id, a.name, s.start_time FROM "Artist" a
+        JOIN "Show" s ON s.artist_id = a.id
+        WHERE s.venue_id = :venue_id
+        ORDER BY s.start_time DESC, s.id DESC''',
+    'artist_shows': '''
+        SELECT v.id, v.name, s.start_time FROM "Venue" v
+        JOIN "Show" s ON s.venue_id = v.id
+        WHERE s.artist_id = :artist_id
+        ORDER BY s.start_time DESC, s.id DESC''',
+    'venue_upcoming_count': '''
+        SELECT count(s.id) FROM "Show" s
+        WHERE s.venue_id = :venue_id AND s.start_time >= :now''',
+    'shows_page': '''
+        SELECT s.id, s.start_time FROM "Show" s
+        WHERE s.start_time > :now
+        ORDER BY s.start_time, s.id LIMIT 30''',
+}
+
+def set_indexes(engine, present):
+    for table in (Show.__table__, Venue.__table__):
+        for index in table.indexes:
+            if index.name not in HOT_PATH_INDEXES:
+                continue
+            if present:
+                index.create(engine)
+            else:
+                index.drop(engine)
+    with engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+
+
+def statement(sql):
+    return text(sql).bindparams(bindparam('now', type_=DateTime)) if ':now' in sql else text(sql)
+
+
+def explain(conn, sql, params):
+    if conn.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    rows = conn.execute(statement(prefix + sql), params).fetchall()
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def measure(engine, repeat, params):
+    report = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(statement(sql), params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            report[name] = {
+                'min_ms': round(min(timings), 3),
+                'median_ms': round(statistics.median(timings), 3),
+                'plan': explain(conn, sql, params),
+            }
+    return report
+
+
+def print_report(before, after):
+    print('{:<24}{:>14}{:>14}{:>10}'.format('query', 'before (ms)', 'after (ms)', 'speedup'))
+    for name in QUERIES:
+        old, new = before[name]['median_ms'], after[name]['median_ms']
+        print('{:<24}{:>14.3f}{:>14.3f}{:>9.1f}x'.format(name, old, new, old / new if new else 0))
+    for label, report in (('before', before), ('after', after)):
+        print('\n--- plans {} ---'.format(label))
+        for name in QUERIES:
+            print('{}:'.format(name))
+            for line in report[name]['plan']:
+                print('    ' + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/fyyur_bench.db')
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    seed(engine, args.venues, args.artists, args.shows, args.seed)
+    params = {'now': datetime.now(), 'venue_id': 1, 'artist_id': 1,
+              'city': CITIES[0][0], 'state': CITIES[0][1]}
+
+    set_indexes(engine, present=False)
+    before = measure(engine, args.repeat, params)
+    set_indexes(engine, present=True)
+    after = measure(engine, args.repeat, params)
+
+    print_report(before, after)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'before': before, 'after': after}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
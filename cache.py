@@ -0,0 +1,197 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from flask import request, session
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class NullCache(object):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_versions(self, tags):
+        return [0 for tag in tags]
+
+    def bump_version(self, tag):
+        pass
+
+
+class SimpleCache(object):
+    # in-process LRU with a per entry TTL. tag versions live outside of the
+    # LRU so they are never evicted.
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_versions(self, tags):
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump_version(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class RedisCache(object):
+    # works with any client exposing the redis-py get/set/mget/incr calls,
+    # so a local stand-in (e.g. fakeredis) can replace a real server.
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl))
+
+    def get_versions(self, tags):
+        keys = [self.prefix + 'tag:' + tag for tag in tags]
+        versions = self.client.mget(keys)
+        missing = [key for key, version in zip(keys, versions) if version is None]
+        if missing:
+            # a tag version that got evicted restarts from the clock, never
+            # from a value older entries were stored under.
+            for key in missing:
+                self.client.set(key, int(time.time() * 1000), nx=True)
+            versions = self.client.mget(keys)
+        return [int(version) for version in versions]
+
+    def bump_version(self, tag):
+        self.get_versions([tag])
+        self.client.incr(self.prefix + 'tag:' + tag)
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+class Cache(object):
+    # every cached value is stored under the current versions of its tags,
+    # invalidating a tag bumps its version so the old entries are never read
+    # again and age out of the backend.
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.default_ttl = 60
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_TYPE', 'simple')
+        if backend == 'simple':
+            if not app.config.get('JOBS_INLINE', True):
+                raise ValueError('the simple cache is not shared with the job workers, '
+                                 'set JOBS_INLINE or use the redis cache')
+            if app.config.get('CALENDAR_PAST_TTL', 0) > app.config.get('CACHE_DEFAULT_TTL', 60):
+                raise ValueError('the simple cache is not invalidated by the other workers, '
+                                 'CALENDAR_PAST_TTL must not exceed CACHE_DEFAULT_TTL')
+            self.backend = SimpleCache(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif backend == 'redis':
+            client = app.config.get('CACHE_REDIS_CLIENT')
+            if client is None:
+                import redis
+                client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            self.backend = RedisCache(client, app.config.get('CACHE_KEY_PREFIX', 'fyyur:'))
+        elif backend == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError('unknown CACHE_TYPE {!r}'.format(backend))
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+        app.extensions['cache'] = self
+
+    def _key(self, key, tags):
+        versions = self.backend.get_versions(tags)
+        return '{}|{}'.format(key, ','.join('{}={}'.format(tag, version)
+                                            for tag, version in zip(tags, versions)))
+
+    def _count(self, namespace, hit):
+        with self._stats_lock:
+            self._stats[namespace]['hits' if hit else 'misses'] += 1
+
+    def get_or_set(self, key, tags, fn, ttl=None, namespace=None):
+        versioned_key = self._key(key, tags)
+        value = self.backend.get(versioned_key)
+        self._count(namespace or key.split(':', 1)[0], value is not None)
+        if value is None:
+            value = fn()
+            self.backend.set(versioned_key, value, ttl or self.default_ttl)
+        return value
+
+    async def get_or_set_async(self, key, tags, fn, ttl=None, namespace=None):
+        # get_or_set for the ASGI views, fn is a coroutine function. the
+        # backend calls stay synchronous: in process, or one redis round trip.
+        # None, e.g. for a missing venue, is not cached.
+        versioned_key = self._key(key, tags)
+        value = self.backend.get(versioned_key)
+        self._count(namespace or key.split(':', 1)[0], value is not None)
+        if value is None:
+            value = await fn()
+            if value is not None:
+                self.backend.set(versioned_key, value, ttl or self.default_ttl)
+        return value
+
+    def invalidate(self, *tags):
+        for tag in set(tags):
+            self.backend.bump_version(tag)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {namespace: dict(counts) for namespace, counts in self._stats.items()}
+        stats['total'] = {
+            'hits': sum(counts['hits'] for counts in stats.values()),
+            'misses': sum(counts['misses'] for counts in stats.values()),
+        }
+        return stats
+
+    def cached_view(self, *tags, ttl=None):
+        # caches the rendered page of a GET view. tags are formatted with the
+        # view arguments, e.g. 'venue:{venue_id}'. pages are not cached while
+        # the user has flashed messages pending.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+                return self.get_or_set('view:' + request.full_path,
+                                       [tag.format(**kwargs) for tag in tags],
+                                       lambda: view(**kwargs), ttl,
+                                       namespace=view.__name__)
+            return wrapper
+        return decorator
+
+
+cache = Cache()
@@ -0,0 +1,286 @@
+from datetime import datetime
+
+import click
+import dateutil.parser
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, bindparam, case, event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from cache import cache
+from jobs import enqueue, task
+from models import db, Artist, JobState, Show, Venue
+from tasks import invalidate_on_commit, payload_key
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count and past_shows_count. a show
+# is upcoming when it starts at or after the watermark of the show_counters
+# job, past otherwise; the rollover job moves the watermark forward and the
+# shows it passes from one counter to the other. writes read the watermark
+# with FOR SHARE and the job updates it with FOR UPDATE, so a show is never
+# counted against a watermark that is being moved.
+#
+# with JOBS_INLINE a write updates the counters of its shows in its own
+# transaction. otherwise a 'counters.recount' job recounts those of the
+# venues and artists concerned once it has committed; a recount is exact
+# whatever ran in between, rollovers included.
+
+JOB_NAME = 'show_counters'
+
+# (model, Show column pointing at it)
+COUNTED = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+def get_watermark(conn, for_update=False, name=JOB_NAME):
+    # None before the first rollover (first run of the job name)
+    table = JobState.__table__
+    query = select([table.c.watermark]).where(table.c.name == name)
+    if conn.dialect.name == 'postgresql':
+        query = query.with_for_update(read=not for_update)
+    return conn.execute(query).scalar()
+
+
+def apply_deltas(conn, deltas):
+    # deltas is {(model, id): (upcoming, past)}, one executemany per model.
+    # updated_at moves as well, the API ETags are built from it.
+    now = datetime.utcnow()
+    for model, _ in COUNTED:
+        table = model.__table__
+        rows = [{'_id': id, '_upcoming': upcoming, '_past': past}
+                for (delta_model, id), (upcoming, past) in deltas.items()
+                if delta_model is model and (upcoming or past)]
+        if rows:
+            conn.execute(table.update().where(table.c.id == bindparam('_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + bindparam('_upcoming'),
+                past_shows_count=table.c.past_shows_count + bindparam('_past'),
+                updated_at=now,
+            ), rows)
+
+
+def count_shows(conn, shows, sign=1, watermark=None):
+    # adds (sign=1) or removes (sign=-1) shows given as (venue_id,
+    # artist_id, start_time) tuples from the counters
+    shows = list(shows)
+    if not shows:
+        return
+    watermark = watermark or get_watermark(conn) or datetime.now()
+    deltas = {}
+    for venue_id, artist_id, start_time in shows:
+        if isinstance(start_time, str):
+            # as submitted by the show form, before the database parsed it
+            start_time = dateutil.parser.parse(start_time)
+        upcoming = start_time >= watermark
+        for model, id in ((Venue, venue_id), (Artist, artist_id)):
+            old_upcoming, old_past = deltas.get((model, id), (0, 0))
+            deltas[(model, id)] = (old_upcoming + sign * upcoming, old_past + sign * (not upcoming))
+    apply_deltas(conn, deltas)
+
+
+def actual_counts(conn, key, watermark):
+    # {id: (upcoming, past)} counted from the shows
+    upcoming = func.sum(case([(Show.start_time >= watermark, 1)], else_=0))
+    query = select([key, upcoming, func.count(Show.id)]).group_by(key)
+    return {id: (up, total - up) for id, up, total in conn.execute(query)}
+
+
+def recount(conn, watermark, ids=None):
+    # recomputes every counter, used when there is no watermark yet, or
+    # those of ids ({model: ids}). only the rows whose counts change are
+    # written, with a new updated_at.
+    now = datetime.utcnow()
+    for model, key in COUNTED:
+        table = model.__table__
+        shows = Show.__table__
+        upcoming = select([func.count(shows.c.id)]).where(and_(
+            key == table.c.id, shows.c.start_time >= watermark)).as_scalar()
+        past = select([func.count(shows.c.id)]).where(and_(
+            key == table.c.id, shows.c.start_time < watermark)).as_scalar()
+        update = table.update().where(or_(table.c.upcoming_shows_count != upcoming,
+                                          table.c.past_shows_count != past))
+        if ids is not None:
+            if not ids.get(model):
+                continue
+            update = update.where(table.c.id.in_(ids[model]))
+        conn.execute(update.values(upcoming_shows_count=upcoming, past_shows_count=past, updated_at=now))
+
+
+def set_watermark(conn, watermark, name=JOB_NAME):
+    table = JobState.__table__
+    values = {'watermark': watermark, 'updated_at': datetime.utcnow()}
+    if conn.execute(table.update().where(table.c.name == name).values(**values)).rowcount == 0:
+        conn.execute(table.insert().values(name=name, **values))
+
+
+def rollover(conn, now=None):
+    # moves the shows that started since the last run from upcoming to
+    # past; returns the number of shows moved, None after a full recount
+    now = now or datetime.now()
+    watermark = get_watermark(conn, for_update=True)
+    if watermark is None:
+        recount(conn, now)
+        set_watermark(conn, now)
+        return None
+    if now <= watermark:
+        return 0
+    moved = 0
+    for model, key in COUNTED:
+        rows = conn.execute(select([key, func.count(Show.id)])
+                            .where(and_(Show.start_time >= watermark, Show.start_time < now))
+                            .group_by(key)).fetchall()
+        apply_deltas(conn, {(model, id): (-count, count) for id, count in rows})
+        if model is Venue:
+            moved = sum(count for _, count in rows)
+    set_watermark(conn, now)
+    return moved
+
+
+def check(conn, repair=False):
+    # [(model name, id, stored, actual)] of the drifted counters, fixed in
+    # place with repair
+    watermark = get_watermark(conn, for_update=True) or datetime.now()
+    drift = []
+    for model, key in COUNTED:
+        table = model.__table__
+        actual = actual_counts(conn, key, watermark)
+        stored = conn.execute(select([table.c.id, table.c.upcoming_shows_count, table.c.past_shows_count]))
+        deltas = {}
+        for id, upcoming, past in stored:
+            expected = actual.get(id, (0, 0))
+            if (upcoming, past) != expected:
+                drift.append((model.__name__, id, (upcoming, past), expected))
+                deltas[(model, id)] = (expected[0] - upcoming, expected[1] - past)
+        if repair:
+            apply_deltas(conn, deltas)
+    return drift
+
+#----------------------------------------------------------------------------#
+# ORM hooks.
+#----------------------------------------------------------------------------#
+
+def keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# load the old value when one of these is set on an expired show, so that
+# show_key can still tell what the show was counted with
+for attribute in (Show.venue_id, Show.artist_id, Show.start_time):
+    event.listen(attribute, 'set', keep_old_value, active_history=True)
+
+
+def show_key(show):
+    # the (venue_id, artist_id, start_time) a show was counted with
+    state = inspect(show)
+    values = []
+    for name in ('venue_id', 'artist_id', 'start_time'):
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if history.deleted else getattr(show, name))
+    return tuple(values)
+
+
+@event.listens_for(Session, 'before_flush')
+def count_cascaded_shows(session, flush_context, instances):
+    # a deleted venue takes its shows along through ON DELETE CASCADE, the
+    # artists that played there lose them, and the other way around. shows
+    # loaded in the session are deleted by the ORM and counted below.
+    deleted_ids = [show.id for show in session.deleted if isinstance(show, Show)]
+    cascaded = {}
+    for model, key in COUNTED:
+        ids = [obj.id for obj in session.deleted if isinstance(obj, model)]
+        if not ids:
+            continue
+        query = select([Show.id, Show.venue_id, Show.artist_id, Show.start_time]).where(key.in_(ids))
+        if deleted_ids:
+            query = query.where(~Show.id.in_(deleted_ids))
+        for id, venue_id, artist_id, start_time in session.connection(mapper=inspect(Show)).execute(query):
+            cascaded[id] = (venue_id, artist_id, start_time)
+    if not cascaded:
+        return
+    if current_app.config['JOBS_INLINE']:
+        count_shows(session.connection(mapper=inspect(Show)), cascaded.values(), sign=-1)
+    else:
+        recount_later(cascaded.values(), session)
+
+
+@event.listens_for(Session, 'after_flush')
+def count_flushed_shows(session, flush_context):
+    added = [(show.venue_id, show.artist_id, show.start_time)
+             for show in session.new if isinstance(show, Show)]
+    removed = [show_key(show) for show in session.deleted if isinstance(show, Show)]
+    for show in session.dirty:
+        if isinstance(show, Show) and session.is_modified(show):
+            old = show_key(show)
+            new = (show.venue_id, show.artist_id, show.start_time)
+            if old != new:
+                removed.append(old)
+                added.append(new)
+    if not added and not removed:
+        return
+    if not current_app.config['JOBS_INLINE']:
+        recount_later(added + removed, session)
+        return
+    conn = session.connection(mapper=inspect(Show))
+    watermark = get_watermark(conn) or datetime.now()
+    count_shows(conn, removed, sign=-1, watermark=watermark)
+    count_shows(conn, added, watermark=watermark)
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+
+def recount_later(shows, session=None):
+    # a job recounting the venues and artists of the shows, given as
+    # (venue_id, artist_id, start_time) tuples, in the session's transaction
+    shows = list(shows)
+    payload = {'venues': sorted({int(show[0]) for show in shows}),
+               'artists': sorted({int(show[1]) for show in shows})}
+    enqueue('counters.recount', payload, key=payload_key('counters.recount', payload), session=session)
+
+
+@task('counters.recount')
+def recount_task(venues=(), artists=()):
+    conn = db.session.connection()
+    recount(conn, get_watermark(conn) or datetime.now(), {Venue: venues, Artist: artists})
+    invalidate_on_commit('venues', 'artists')
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.group('counters')
+def counters_command():
+    """Upcoming/past show counters of venues and artists."""
+
+
+@counters_command.command('rollover')
+@with_appcontext
+def rollover_command():
+    """Move the shows that have started since the last run to past.
+
+    Run it periodically, e.g. from cron every few minutes; the listings
+    are as fresh as its last run.
+    """
+    with db.engine.begin() as conn:
+        moved = rollover(conn)
+    cache.invalidate('venues', 'artists')
+    click.echo('counters recomputed' if moved is None else '{} shows moved to past'.format(moved))
+
+
+@counters_command.command('check')
+@click.option('--repair', is_flag=True, help='Fix the drifted counters.')
+@with_appcontext
+def check_command(repair):
+    """Compare the counters with the shows, exits with 1 on drift."""
+    with db.engine.begin() as conn:
+        drift = check(conn, repair)
+    for name, id, stored, actual in drift:
+        click.echo('{} {}: upcoming/past {}/{}, counted {}/{}'.format(name, id, *stored, *actual))
+    if not drift:
+        click.echo('counters are consistent')
+    elif repair:
+        cache.invalidate('venues', 'artists')
+        click.echo('{} counters repaired'.format(len(drift)))
+    else:
+        raise click.exceptions.Exit(1)
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+
+import click
+import dateutil.parser
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from models import db, Artist, Genre, Show, Venue, artist_genres, venue_genres
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# (model, genre association table, fk column of the association table)
+EXPORT_TABLES = {
+    'venues': (Venue, venue_genres, 'venue_id'),
+    'artists': (Artist, artist_genres, 'artist_id'),
+    'shows': (Show, None, None),
+}
+
+FORMATS = ('jsonl', 'csv')
+
+
+def parse_since(value):
+    # a naive UTC datetime like updated_at; a timestamp without an offset
+    # is taken as UTC. raises ValueError on a malformed timestamp
+    if not value:
+        return None
+    since = dateutil.parser.parse(value)
+    if since.tzinfo:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def genre_names(model, association, fk):
+    # the comma joined genre names as a correlated subquery, so that rows
+    # stream without an eager load per batch
+    if db.engine.dialect.name == 'postgresql':
+        joined = func.string_agg(Genre.name, ',')
+    else:
+        joined = func.group_concat(Genre.name, ',')
+    return db.session.query(joined) \
+        .select_from(association) \
+        .join(Genre, Genre.id == association.c.genre_id) \
+        .filter(association.c[fk] == model.id) \
+        .as_scalar().label('genres')
+
+
+def export_columns(kind):
+    model, association, fk = EXPORT_TABLES[kind]
+    columns = list(model.__table__.columns)
+    if association is not None:
+        columns.append(genre_names(model, association, fk))
+    return model, columns
+
+
+def iter_rows(kind, since=None, batch_size=1000):
+    # yield_per streams with a server-side cursor on Postgres: only one
+    # batch of rows is held in memory at a time
+    model, columns = export_columns(kind)
+    query = db.session.query(*columns)
+    if since:
+        query = query.filter(model.updated_at >= since)
+    return query.order_by(model.id).yield_per(batch_size)
+
+
+def serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_export(kind, format='jsonl', since=None, compress=False, batch_size=1000):
+    # the export as chunks of bytes, one chunk per batch of rows
+    _, columns = export_columns(kind)
+    names = [column.name for column in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    if format == 'csv':
+        writer.writerow(names)
+    count = 0
+    for row in iter_rows(kind, since, batch_size):
+        if format == 'csv':
+            writer.writerow([serialize(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(names, map(serialize, row)))) + '\n')
+        count += 1
+        if count % batch_size == 0:
+            chunk = flush()
+            if chunk:
+                yield chunk
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+#----------------------------------------------------------------------------#
+# Command.
+#----------------------------------------------------------------------------#
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_TABLES)))
+@click.option('--format', 'format', type=click.Choice(FORMATS), default='jsonl', show_default=True)
+@click.option('--since', help='Only rows changed at or after this timestamp, UTC unless it has an offset.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--batch-size', type=int, help='Rows fetched per round trip.')
+@click.option('-o', '--output', type=click.File('wb'), default='-', help='Defaults to stdout.')
+@with_appcontext
+def export_command(kind, format, since, compress, batch_size, output):
+    """Stream the venues, artists or shows as JSONL or CSV."""
+    try:
+        since = parse_since(since)
+    except (ValueError, OverflowError):
+        raise click.BadParameter('not a timestamp', param_hint='--since')
+    batch_size = batch_size or current_app.config['EXPORT_BATCH_SIZE']
+    for chunk in iter_export(kind, format, since, compress, batch_size):
+        output.write(chunk)
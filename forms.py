@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional
+from models import MAX_SHOW_DURATION
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +16,12 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        # minutes
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=int(MAX_SHOW_DURATION.total_seconds()) // 60)],
+        default=120
+    )
 
 class VenueForm(Form):
     name = StringField(
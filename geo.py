@@ -0,0 +1,267 @@
+import csv
+import math
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, bindparam, or_, select
+
+from cache import cache
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Geohash.
+#----------------------------------------------------------------------------#
+
+# venues carry a latitude, a longitude and the geohash of the point. a
+# geohash prefix is a cell of the map, and the venues of a cell are one
+# range scan on the geohash index: a point's nearest venues are found in
+# its cell and the eight around it, at the finest precision that covers
+# the search.
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    ranges = ([-180.0, 180.0], [-90.0, 90.0])
+    chars, bit, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (ranges[0], longitude) if even else (ranges[1], latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            bit = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (height, width) of a cell in degrees
+    return 180.0 / 2 ** (5 * precision // 2), 360.0 / 2 ** ((5 * precision + 1) // 2)
+
+
+def neighbourhood(latitude, longitude, precision):
+    # the geohashes of the cell holding the point and of the cells around it
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        if not -90 <= latitude + dlat <= 90:
+            continue
+        for dlon in (-width, 0, width):
+            cells.add(encode(latitude + dlat, (longitude + dlon + 180) % 360 - 180, precision))
+    return cells
+
+
+def covered_radius(latitude, precision):
+    # km from the point to the edge of its neighbourhood, at least. cells
+    # narrow towards the poles, the width is taken one cell further out.
+    height, width = cell_size(precision)
+    edge = min(90.0, abs(latitude) + height)
+    return KM_PER_DEGREE * min(height, width * math.cos(math.radians(edge)))
+
+
+def distance(lat1, lon1, lat2, lon2):
+    # great-circle distance in km
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+NEARBY_COLUMNS = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+                  Venue.image_link, Venue.latitude, Venue.longitude)
+
+
+def parse_nearby_args(args, config):
+    # (latitude, longitude, radius, limit), ValueError on a missing or
+    # malformed point or a radius beyond NEARBY_MAX_RADIUS_KM
+    latitude = float(args['lat'])
+    longitude = float(args['lon'])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError((latitude, longitude))
+    radius = args.get('radius', config['NEARBY_DEFAULT_RADIUS_KM'], type=float)
+    if not 0 < radius <= config['NEARBY_MAX_RADIUS_KM']:
+        raise ValueError(radius)
+    limit = max(1, min(args.get('limit', config['NEARBY_LIMIT'], type=int), config['NEARBY_MAX_LIMIT']))
+    return latitude, longitude, radius, limit
+
+
+def venues_in_cells(cells):
+    query = db.session.query(*NEARBY_COLUMNS)
+    if cells:
+        # '~' sorts after every geohash character
+        query = query.filter(or_(*[and_(Venue.geohash >= cell, Venue.geohash < cell + '~')
+                                   for cell in sorted(cells)]))
+    else:
+        query = query.filter(Venue.geohash.isnot(None))
+    return query.all()
+
+
+def get_nearby_venues(latitude, longitude, radius, limit):
+    # the limit venues nearest to the point within radius km, nearest first,
+    # as dicts. the neighbourhood is searched one precision finer than the
+    # coarsest one covering the radius first, and widened to that one only
+    # when fewer than limit venues are certainly the nearest.
+    coarsest = 0
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if covered_radius(latitude, precision) >= radius:
+            coarsest = precision
+            break
+    for precision in range(min(coarsest + 1, GEOHASH_PRECISION), coarsest - 1, -1):
+        cells = neighbourhood(latitude, longitude, precision) if precision else None
+        reach = radius if precision == coarsest else min(radius, covered_radius(latitude, precision))
+        found = []
+        for row in venues_in_cells(cells):
+            km = distance(latitude, longitude, row.latitude, row.longitude)
+            if km <= reach:
+                found.append((km, row))
+        if len(found) >= limit or precision == coarsest:
+            break
+    found.sort(key=lambda item: (item[0], item[1].id))
+    return [{
+        "id": row.id,
+        "name": row.name,
+        "city": row.city,
+        "state": row.state,
+        "address": row.address,
+        "image_link": row.image_link,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "distance_km": round(km, 3),
+    } for km, row in found[:limit]]
+
+#----------------------------------------------------------------------------#
+# Gazetteer.
+#----------------------------------------------------------------------------#
+
+# geocoding is offline, from a local gazetteer of places: a GeoNames dump
+# (e.g. cities1000.txt from https://download.geonames.org/export/dump/,
+# tab separated) or a CSV file with city, state, latitude and longitude
+# columns. places are matched on city and state; GeoNames places on the
+# admin1 code, which is the two-letter state for the US.
+
+GEONAMES_NAME, GEONAMES_ASCIINAME, GEONAMES_LATITUDE, GEONAMES_LONGITUDE = 1, 2, 4, 5
+GEONAMES_COUNTRY, GEONAMES_ADMIN1, GEONAMES_POPULATION = 8, 10, 14
+
+_gazetteers = {}
+
+
+def place_key(city, state):
+    # 'St. Louis' and 'st louis' are the same place
+    return (' '.join((city or '').casefold().replace('.', ' ').split()),
+            (state or '').strip().upper())
+
+
+def read_gazetteer(path, country='US'):
+    # {place key: (latitude, longitude)}. of several GeoNames places of the
+    # same name the most populous one wins, of several CSV rows the first.
+    places = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                key = place_key(row['city'], row['state'])
+                places.setdefault(key, (float(row['latitude']), float(row['longitude'])))
+            return places
+        population = {}
+        for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if len(row) <= GEONAMES_POPULATION or (country and row[GEONAMES_COUNTRY] != country):
+                continue
+            size = int(row[GEONAMES_POPULATION] or 0)
+            point = (float(row[GEONAMES_LATITUDE]), float(row[GEONAMES_LONGITUDE]))
+            for name in {row[GEONAMES_NAME], row[GEONAMES_ASCIINAME]}:
+                key = place_key(name, row[GEONAMES_ADMIN1])
+                if size > population.get(key, -1):
+                    population[key] = size
+                    places[key] = point
+    return places
+
+
+def gazetteer():
+    # the configured gazetteer, read once per process; None without one
+    path = current_app.config['GAZETTEER_PATH']
+    if not path:
+        return None
+    if path not in _gazetteers:
+        _gazetteers[path] = read_gazetteer(path, current_app.config['GAZETTEER_COUNTRY'])
+    return _gazetteers[path]
+
+
+def locate(venue):
+    # sets the coordinates of a venue from the gazetteer, clears them when
+    # its city is not found
+    point = (gazetteer() or {}).get(place_key(venue.city, venue.state))
+    venue.latitude, venue.longitude = point or (None, None)
+    venue.geohash = encode(*point) if point else None
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.group('geo')
+def geo_command():
+    """Venue coordinates."""
+
+
+@geo_command.command('geocode')
+@click.option('--gazetteer', 'path', help='GeoNames dump or CSV file, GAZETTEER_PATH by default.')
+@click.option('--country', help='GeoNames country code, GAZETTEER_COUNTRY by default.')
+@click.option('--all', 'everything', is_flag=True, help='Geocode located venues again too.')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@with_appcontext
+def geocode_command(path, country, everything, batch_size):
+    """Set the coordinates of venues from a local gazetteer."""
+    path = path or current_app.config['GAZETTEER_PATH']
+    if not path:
+        raise click.UsageError('give --gazetteer or set GAZETTEER_PATH')
+    places = read_gazetteer(path, country or current_app.config['GAZETTEER_COUNTRY'])
+    click.echo('{} places in {}'.format(len(places), path))
+
+    table = Venue.__table__
+    update = table.update().where(table.c.id == bindparam('venue_id')).values(
+        latitude=bindparam('lat'), longitude=bindparam('lon'),
+        geohash=bindparam('hash'), updated_at=bindparam('now'))
+    query = select([table.c.id, table.c.city, table.c.state,
+                    table.c.latitude, table.c.longitude]).order_by(table.c.id)
+    if not everything:
+        query = query.where(table.c.latitude.is_(None))
+
+    located, missing, moved = 0, Counter(), []
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        rows = conn.execute(query).fetchall()
+        for i in range(0, len(rows), batch_size):
+            params = []
+            for venue_id, city, state, latitude, longitude in rows[i:i + batch_size]:
+                point = places.get(place_key(city, state))
+                if point is None:
+                    missing[(city, state)] += 1
+                    continue
+                located += 1
+                # venues already at their place keep their row and pages
+                if point != (latitude, longitude):
+                    params.append({'venue_id': venue_id, 'lat': point[0], 'lon': point[1],
+                                   'hash': encode(*point), 'now': now})
+            if params:
+                conn.execute(update, params)
+                moved.extend(param['venue_id'] for param in params)
+    if moved:
+        cache.invalidate('venues', *['venue:{}'.format(venue_id) for venue_id in moved])
+
+    click.echo('{} venues located, {} not found'.format(located, sum(missing.values())))
+    for (city, state), count in missing.most_common(10):
+        click.echo('  {}, {}: {} venues'.format(city, state, count))
@@ -0,0 +1,362 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import click
+import dateutil.parser
+from flask.cli import with_appcontext
+from sqlalchemy import and_
+from werkzeug.datastructures import MultiDict
+
+from cache import cache
+from counters import count_shows
+from forms import ArtistForm, ShowForm, VenueForm
+from models import (db, Artist, Genre, ImportState, Show, Venue, artist_genres, import_ids,
+                    venue_genres, MAX_SHOW_DURATION)
+from scheduling import IntervalIndex, load_bookings, show_end_time
+
+#----------------------------------------------------------------------------#
+# Reading.
+#----------------------------------------------------------------------------#
+
+def read_rows(path, format):
+    # yields (line number, row dict); genres are a list or, as exported,
+    # comma joined
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            rows = enumerate(csv.DictReader(f), start=2)
+        else:
+            rows = ((number, json.loads(line)) for number, line in enumerate(f, start=1) if line.strip())
+        for number, row in rows:
+            if isinstance(row.get('genres'), str):
+                row['genres'] = [name for name in row['genres'].split(',') if name.strip()]
+            yield number, row
+
+
+def as_formdata(row):
+    items = []
+    for key, value in row.items():
+        if isinstance(value, list):
+            items.extend((key, str(item).strip()) for item in value)
+        elif value is not None:
+            items.append((key, str(value)))
+    return MultiDict(items)
+
+
+def as_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+#----------------------------------------------------------------------------#
+# Validation.
+#----------------------------------------------------------------------------#
+
+class RowError(Exception):
+
+    def __init__(self, errors):
+        Exception.__init__(self, errors)
+        self.errors = errors
+
+
+def validate(form_class, row):
+    # the same rules as the web forms, without CSRF
+    form = form_class(formdata=as_formdata(row), meta={'csrf': False})
+    if not form.validate():
+        raise RowError(form.errors)
+    return form
+
+
+def venue_values(row):
+    form = validate(VenueForm, row)
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'address': form.address.data,
+        'phone': form.phone.data,
+        'image_link': form.image_link.data,
+        'facebook_link': form.facebook_link.data,
+        'website_link': row.get('website_link'),
+        'seeking_talent': as_bool(row.get('seeking_talent')),
+        'seeking_description': row.get('seeking_description'),
+    }, form.genres.data
+
+
+def artist_values(row):
+    form = validate(ArtistForm, row)
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'phone': form.phone.data,
+        'image_link': form.image_link.data,
+        'facebook_link': form.facebook_link.data,
+        'website_link': row.get('website_link'),
+        'seeking_venue': as_bool(row.get('seeking_venue')),
+        'seeking_description': row.get('seeking_description'),
+    }, form.genres.data
+
+
+# the format of the ShowForm DateTimeField
+SHOW_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_time(value):
+    # the form's format or ISO 8601 as exported ('T' separator,
+    # microseconds), None when neither
+    try:
+        value = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+    return value if value.tzinfo is None else None
+
+
+def show_values(row, importer):
+    start_time = parse_time(row.get('start_time'))
+    if start_time is not None:
+        # the form validates the rest of the row, the parsed time is kept
+        row = dict(row, start_time=start_time.strftime(SHOW_TIME_FORMAT))
+    form = validate(ShowForm, row)
+    errors = {}
+    venue_id = importer.resolve('venues', form.venue_id.data)
+    artist_id = importer.resolve('artists', form.artist_id.data)
+    if venue_id is None:
+        errors['venue_id'] = ['Unknown venue {!r}.'.format(form.venue_id.data)]
+    if artist_id is None:
+        errors['artist_id'] = ['Unknown artist {!r}.'.format(form.artist_id.data)]
+    if errors:
+        raise RowError(errors)
+    start_time = start_time or form.start_time.data
+    try:
+        # exported shows carry their end time, new ones a duration or none
+        end_time = dateutil.parser.parse(row['end_time']) if row.get('end_time') \
+            else show_end_time(start_time, form.duration.data)
+    except (ValueError, OverflowError):
+        raise RowError({'end_time': ['Not a valid datetime value.']})
+    if end_time <= start_time:
+        raise RowError({'end_time': ['The show ends before it starts.']})
+    if end_time - start_time > MAX_SHOW_DURATION:
+        raise RowError({'end_time': ['The show is longer than {}.'.format(MAX_SHOW_DURATION)]})
+    # against the shows in the database and the rows accepted so far
+    conflict = importer.bookings.book(venue_id, artist_id, start_time, end_time)
+    if conflict:
+        raise RowError({'start_time': [str(conflict).capitalize() + '.']})
+    return {
+        'venue_id': venue_id,
+        'artist_id': artist_id,
+        'start_time': start_time,
+        'end_time': end_time,
+    }, None
+
+#----------------------------------------------------------------------------#
+# Importer.
+#----------------------------------------------------------------------------#
+
+ENTITIES = {
+    'venues': (Venue.__table__, venue_values, venue_genres, 'venue_id'),
+    'artists': (Artist.__table__, artist_values, artist_genres, 'artist_id'),
+    'shows': (Show.__table__, show_values, None, None),
+}
+
+
+class Importer(object):
+    # inserts validated rows in batches, one transaction per batch. the
+    # import_state row of the file records the last line of the batch in
+    # the same transaction, so that a failed import resumes after the last
+    # committed batch; import_ids maps the ids of the source rows to the
+    # database ids, across files and runs.
+
+    def __init__(self, kind, path, errors_path, batch_size=1000):
+        self.kind = kind
+        self.table, self.values, self.genre_table, self.genre_key = ENTITIES[kind]
+        self.path = os.path.abspath(path)
+        self.errors_path = errors_path
+        self.batch_size = batch_size
+        self.state = {'line': 0, 'inserted': 0, 'rejected': 0}
+        self.id_map = {'venues': {}, 'artists': {}}
+        self.existing = {}
+        self.genre_ids = {}
+        self.bookings = None
+
+    def load(self, resume):
+        state = ImportState.query.get(self.path) if resume else None
+        if state is not None:
+            self.state = {'line': state.line, 'inserted': state.inserted, 'rejected': state.rejected}
+        self.truncate_errors()
+        for kind, source_id, id in db.session.query(import_ids):
+            self.id_map[kind][source_id] = id
+        if self.kind == 'shows':
+            self.existing = {
+                'venues': {id for id, in db.session.query(Venue.id)},
+                'artists': {id for id, in db.session.query(Artist.id)},
+            }
+            # the bookings of a venue or artist are read on its first row
+            self.bookings = IntervalIndex(load_bookings(db.engine))
+        else:
+            self.genre_ids = dict(db.session.query(Genre.name, Genre.id))
+        db.session.remove()
+
+    def resolve(self, kind, source_id):
+        # an id of the source file first, then an id already in the database
+        source_id = (source_id or '').strip()
+        if source_id in self.id_map[kind]:
+            return self.id_map[kind][source_id]
+        if source_id.isdigit() and int(source_id) in self.existing[kind]:
+            return int(source_id)
+        return None
+
+    def truncate_errors(self):
+        # keeps the rejections of the committed lines, those after them are
+        # read again
+        if not os.path.exists(self.errors_path):
+            return
+        with open(self.errors_path) as f:
+            kept = [line for line in f if json.loads(line)['line'] <= self.state['line']]
+        tmp = self.errors_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.writelines(kept)
+        os.replace(tmp, self.errors_path)
+
+    def save(self, conn):
+        table = ImportState.__table__
+        values = dict(self.state, kind=self.kind, updated_at=datetime.utcnow())
+        if conn.execute(table.update().where(table.c.path == self.path).values(**values)).rowcount == 0:
+            conn.execute(table.insert().values(path=self.path, **values))
+
+    def map_ids(self, conn, ids):
+        # ids is [(source id, database id)] of the batch
+        mapped = {str(source_id): id for source_id, id in ids if source_id not in (None, '')}
+        if not mapped:
+            return
+        conn.execute(import_ids.delete().where(and_(import_ids.c.kind == self.kind,
+                                                    import_ids.c.source_id.in_(list(mapped)))))
+        conn.execute(import_ids.insert(), [{'kind': self.kind, 'source_id': source_id, 'id': id}
+                                           for source_id, id in mapped.items()])
+        self.id_map[self.kind].update(mapped)
+
+    def reject(self, number, row, errors):
+        self.state['rejected'] += 1
+        with open(self.errors_path, 'a') as f:
+            f.write(json.dumps({'line': number, 'errors': errors, 'row': row}, default=str) + '\n')
+
+    def run(self, rows, progress=None):
+        batch = []
+        last = self.state['line']
+        for number, row in rows:
+            if number <= self.state['line']:
+                continue
+            last = number
+            try:
+                values, genres = self.values(row, self) if self.kind == 'shows' else self.values(row)
+            except RowError as e:
+                self.reject(number, row, e.errors)
+                continue
+            values['updated_at'] = datetime.utcnow()
+            batch.append((row.get('id'), values, genres))
+            if len(batch) >= self.batch_size:
+                self.flush(batch, last)
+                batch = []
+                if progress:
+                    progress(self.state)
+        self.flush(batch, last)
+        if progress:
+            progress(self.state)
+
+    def flush(self, batch, last):
+        state = dict(self.state)
+        try:
+            with db.engine.begin() as conn:
+                if self.kind == 'shows':
+                    rows = [values for _, values, _ in batch]
+                    insert_shows(conn, rows)
+                    count_shows(conn, [(row['venue_id'], row['artist_id'], row['start_time']) for row in rows])
+                else:
+                    ids = insert_returning_ids(conn, self.table, [values for _, values, _ in batch])
+                    self.insert_genres(conn, [(id, genres) for id, (_, _, genres) in zip(ids, batch)])
+                    self.map_ids(conn, [(source_id, id) for id, (source_id, _, _) in zip(ids, batch)])
+                self.state['line'] = last
+                self.state['inserted'] += len(batch)
+                self.save(conn)
+        except Exception:
+            # as committed, the batch is read again on --resume
+            self.state = state
+            raise
+
+    def insert_genres(self, conn, rows):
+        names = sorted({name for _, genres in rows for name in genres} - set(self.genre_ids))
+        if names:
+            ids = insert_returning_ids(conn, Genre.__table__, [{'name': name} for name in names])
+            self.genre_ids.update(zip(names, ids))
+        links = [{self.genre_key: id, 'genre_id': self.genre_ids[name]}
+                 for id, genres in rows for name in set(genres)]
+        if links:
+            conn.execute(self.genre_table.insert(), links)
+
+
+def insert_returning_ids(conn, table, rows):
+    if not rows:
+        return []
+    if conn.dialect.name == 'postgresql':
+        # one multi-row INSERT ... RETURNING per batch
+        return [id for id, in conn.execute(table.insert().values(rows).returning(table.c.id))]
+    return [conn.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+
+def insert_shows(conn, rows):
+    if not rows:
+        return
+    if conn.dialect.name != 'postgresql':
+        conn.execute(Show.__table__.insert(), rows)
+        return
+    columns = ('artist_id', 'venue_id', 'start_time', 'end_time', 'updated_at')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    cursor.copy_expert('COPY "Show" ({}) FROM STDIN WITH (FORMAT csv)'.format(', '.join(columns)), buffer)
+
+#----------------------------------------------------------------------------#
+# Command.
+#----------------------------------------------------------------------------#
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--resume', is_flag=True, help='Continue after the last committed batch.')
+@with_appcontext
+def import_command(kind, path, format, batch_size, resume):
+    """Bulk import venues, artists or shows from a CSV or JSONL file.
+
+    Rows are validated with the web forms, rejected rows are written to
+    PATH.errors.jsonl. Shows refer to venues and artists by their id in
+    the imported files, or by their database id.
+    """
+    format = format or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    importer = Importer(kind, path, path + '.errors.jsonl', batch_size)
+    importer.load(resume)
+    if importer.state['line']:
+        click.echo('resuming {} after line {}'.format(path, importer.state['line']))
+
+    started = time.monotonic()
+
+    def progress(state):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        click.echo('{}: line {}, {} inserted, {} rejected, {:.0f} rows/s'.format(
+            kind, state['line'], state['inserted'], state['rejected'], state['inserted'] / elapsed))
+
+    try:
+        importer.run(read_rows(path, format), progress)
+    except Exception as e:
+        raise click.ClickException('import stopped after line {}: {}. Fix the cause and run '
+                                   'again with --resume.'.format(importer.state['line'], e))
+    finally:
+        cache.invalidate('venues', 'artists', 'shows', 'calendar')
+    if importer.state['rejected']:
+        click.echo('{} rows rejected, see {}'.format(importer.state['rejected'], importer.errors_path))
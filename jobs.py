@@ -0,0 +1,236 @@
+import json
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, g, has_request_context
+from flask.cli import with_appcontext
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects import postgresql
+
+from models import db, Job
+
+#----------------------------------------------------------------------------#
+# Job queue.
+#----------------------------------------------------------------------------#
+
+# the write handlers leave their follow-up work (e.g. invalidating a
+# shared cache) to jobs, and `flask jobs work` runs them. a job is inserted
+# in the transaction of the write, so it exists if and only if the write
+# committed.
+#
+# a job runs at least once: a failed one is retried with exponential
+# backoff until max_attempts, and the jobs of a worker that died are
+# claimed again after JOBS_LOCK_TIMEOUT. tasks must be idempotent. a job
+# with an idempotency key is not enqueued while a job with the same key is
+# still queued, that one does the work of both.
+
+TASKS = {}
+
+STATUSES = ('queued', 'retrying', 'running', 'done', 'failed')
+
+
+def task(name, max_attempts=None):
+    # registers fn(**payload) as the handler of the jobs called name
+    def decorator(fn):
+        TASKS[name] = (fn, max_attempts)
+        return fn
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, session=None):
+    # adds a job to the session's transaction, payload is a JSON object
+    if name not in TASKS:
+        raise KeyError('unknown task {!r}'.format(name))
+    session = session or db.session
+    now = datetime.utcnow()
+    table = Job.__table__
+    values = {
+        'task': name,
+        'payload': json.dumps(payload or {}, sort_keys=True),
+        'key': key,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': TASKS[name][1] or current_app.config['JOBS_MAX_ATTEMPTS'],
+        'run_at': now + timedelta(seconds=delay),
+        'created_at': now,
+    }
+    if db.engine.dialect.name == 'postgresql':
+        statement = postgresql.insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=[table.c.key], index_where=table.c.status == 'queued')
+    else:
+        statement = table.insert().values(**values).prefix_with('OR IGNORE', dialect='sqlite')
+    session.execute(statement)
+    if has_request_context():
+        g._db_wrote = True
+
+
+def backoff(attempts):
+    # seconds before the next attempt: doubling from JOBS_BACKOFF_BASE up
+    # to JOBS_BACKOFF_MAX, jittered so that failed jobs do not retry in step
+    config = current_app.config
+    delay = min(config['JOBS_BACKOFF_MAX'], config['JOBS_BACKOFF_BASE'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(conn, worker, limit):
+    # marks up to limit due jobs as running by worker and returns them. on
+    # Postgres SKIP LOCKED lets workers claim side by side without waiting.
+    now = datetime.utcnow()
+    table = Job.__table__
+    stale = now - timedelta(seconds=current_app.config['JOBS_LOCK_TIMEOUT'])
+    due = or_(and_(table.c.status.in_(('queued', 'retrying')), table.c.run_at <= now),
+              and_(table.c.status == 'running', table.c.locked_at < stale))
+    query = select([table.c.id]).where(due).order_by(table.c.run_at, table.c.id).limit(limit)
+    if conn.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    ids = [id for id, in conn.execute(query)]
+    if not ids:
+        return []
+    conn.execute(table.update().where(table.c.id.in_(ids)).values(
+        status='running', locked_at=now, locked_by=worker, attempts=table.c.attempts + 1))
+    return conn.execute(select([table]).where(table.c.id.in_(ids)).order_by(table.c.run_at, table.c.id)).fetchall()
+
+
+def finish(conn, job, worker, error=None):
+    # records the outcome of an attempt, unless the job was claimed again
+    # in the meantime
+    now = datetime.utcnow()
+    table = Job.__table__
+    if error is None:
+        values = {'status': 'done', 'finished_at': now, 'last_error': None}
+    elif job.attempts >= job.max_attempts:
+        values = {'status': 'failed', 'finished_at': now, 'last_error': error}
+    else:
+        values = {'status': 'retrying', 'run_at': now + timedelta(seconds=backoff(job.attempts)),
+                  'last_error': error}
+    conn.execute(table.update().where(and_(table.c.id == job.id, table.c.locked_by == worker,
+                                           table.c.status == 'running')).values(**values))
+
+
+def run(job, worker):
+    # runs one claimed job, returns None or the error
+    error = None
+    try:
+        if job.task not in TASKS:
+            raise LookupError('unknown task {!r}'.format(job.task))
+        TASKS[job.task][0](**json.loads(job.payload))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        current_app.logger.error('job %s (%s) attempt %s failed\n%s', job.id, job.task, job.attempts, error)
+    finally:
+        db.session.remove()
+    with db.engine.begin() as conn:
+        finish(conn, job, worker, error)
+    return error
+
+
+def work(worker, batch_size, poll_interval, once=False):
+    # claims and runs jobs until stopped, or with once until none is due.
+    # SIGTERM lets the current job finish first.
+    stopping = []
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    done = failed = 0
+    try:
+        while not stopping:
+            with db.engine.begin() as conn:
+                claimed = claim(conn, worker, batch_size)
+            if not claimed:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+            for job in claimed:
+                if run(job, worker) is None:
+                    done += 1
+                else:
+                    failed += 1
+                if stopping:
+                    # the rest are claimed again after JOBS_LOCK_TIMEOUT
+                    break
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return done, failed
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.group('jobs')
+def jobs_command():
+    """Background jobs of the write handlers."""
+
+
+@jobs_command.command('work')
+@click.option('--once', is_flag=True, help='Exit when no job is due.')
+@click.option('--batch-size', type=int, default=10, show_default=True, help='Jobs claimed at a time.')
+@click.option('--poll', type=float, help='Seconds between polls, JOBS_POLL_INTERVAL by default.')
+@with_appcontext
+def work_command(once, batch_size, poll):
+    """Run queued jobs.
+
+    Run as many workers as needed, e.g. one per host under a process
+    supervisor; on Postgres they never claim the same job.
+    """
+    import tasks  # registers the handlers
+    worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+    done, failed = work(worker, batch_size, poll or current_app.config['JOBS_POLL_INTERVAL'], once)
+    click.echo('{} jobs done, {} attempts failed'.format(done, failed))
+
+
+@jobs_command.command('status')
+@with_appcontext
+def status_command():
+    """Number of jobs per task and status, and the last failures."""
+    table = Job.__table__
+    with db.engine.connect() as conn:
+        rows = conn.execute(select([table.c.task, table.c.status, func.count(), func.min(table.c.run_at)])
+                            .group_by(table.c.task, table.c.status).order_by(table.c.task)).fetchall()
+        failed = conn.execute(select([table.c.id, table.c.task, table.c.attempts, table.c.last_error])
+                              .where(table.c.status == 'failed')
+                              .order_by(table.c.finished_at.desc()).limit(5)).fetchall()
+    if not rows:
+        click.echo('no jobs')
+    for name, status, count, run_at in rows:
+        due = ', next due {:%Y-%m-%d %H:%M:%S} UTC'.format(run_at) if status in ('queued', 'retrying') else ''
+        click.echo('{:<28} {:<9} {:>8}{}'.format(name, status, count, due))
+    for id, name, attempts, error in failed:
+        click.echo('\njob {} ({}) failed after {} attempts:\n{}'.format(id, name, attempts, error.rstrip()))
+
+
+@jobs_command.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+@click.option('--failed', 'all_failed', is_flag=True, help='Every failed job.')
+@with_appcontext
+def retry_command(ids, all_failed):
+    """Run failed jobs again, with a fresh number of attempts."""
+    if not ids and not all_failed:
+        raise click.UsageError('give job ids or --failed')
+    table = Job.__table__
+    condition = table.c.status == 'failed'
+    if ids:
+        condition = and_(condition, table.c.id.in_(ids))
+    with db.engine.begin() as conn:
+        count = conn.execute(table.update().where(condition).values(
+            status='retrying', attempts=0, run_at=datetime.utcnow(), finished_at=None)).rowcount
+    click.echo('{} jobs to retry'.format(count))
+
+
+@jobs_command.command('purge')
+@click.option('--days', type=int, default=7, show_default=True, help='Keep the jobs of the last days.')
+@with_appcontext
+def purge_command(days):
+    """Delete the done and failed jobs finished before the last days."""
+    table = Job.__table__
+    before = datetime.utcnow() - timedelta(days=days)
+    with db.engine.begin() as conn:
+        count = conn.execute(table.delete().where(and_(table.c.status.in_(('done', 'failed')),
+                                                       table.c.finished_at < before))).rowcount
+    click.echo('{} jobs deleted'.format(count))
@@ -0,0 +1,43 @@
+"""add similarity tables
+
+Revision ID: 3a9c4d7e1f82
+Revises: 8e3f1b6d2c47
+Create Date: 2026-10-18 22:27:51.904113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9c4d7e1f82'
+down_revision = '8e3f1b6d2c47'
+branch_labels = None
+depends_on = None
+
+# (table, entity table, entity column), filled in by `flask recommendations build`
+TABLES = (
+    ('venue_similarities', 'Venue', 'venue_id'),
+    ('artist_similarities', 'Artist', 'artist_id'),
+)
+
+
+def upgrade():
+    for table, entity, column in TABLES:
+        op.create_table(table,
+            sa.Column(column, sa.Integer(), nullable=False),
+            sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('similar_id', sa.Integer(), nullable=False),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.Column('shared', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint([column], ['{}.id'.format(entity)], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['similar_id'], ['{}.id'.format(entity)], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(column, 'rank')
+        )
+        op.create_index(op.f('ix_{}_similar_id'.format(table)), table, ['similar_id'], unique=False)
+
+
+def downgrade():
+    for table, _, _ in reversed(TABLES):
+        op.drop_index(op.f('ix_{}_similar_id'.format(table)), table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,46 @@
+"""add trigram search indexes
+
+Revision ID: 3f1c2a7d9b40
+Revises: ce758147d31c
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b40'
+down_revision = 'ce758147d31c'
+branch_labels = None
+depends_on = None
+
+TRGM_INDEXES = {
+    'Venue': ('name', 'city', 'state', 'geners'),
+    'Artist': ('name', 'city', 'state', 'genres'),
+}
+
+
+def index_name(table, column):
+    return 'ix_{}_{}_trgm'.format(table.lower(), column)
+
+
+def upgrade():
+    # pg_trgm GIN indexes serve ILIKE '%term%' and similarity ranking,
+    # other backends keep scanning.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns in TRGM_INDEXES.items():
+        for column in columns:
+            op.create_index(index_name(table, column), table, [column],
+                            postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, columns in TRGM_INDEXES.items():
+        for column in columns:
+            op.drop_index(index_name(table, column), table_name=table)
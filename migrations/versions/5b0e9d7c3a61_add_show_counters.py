@@ -0,0 +1,53 @@
+"""add show counters
+
+Revision ID: 5b0e9d7c3a61
+Revises: e2b6f04a9c31
+Create Date: 2026-10-18 14:02:37.481920
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e9d7c3a61'
+down_revision = 'e2b6f04a9c31'
+branch_labels = None
+depends_on = None
+
+# (table, Show column pointing at it)
+COUNTED = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    op.create_table('job_state',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('watermark', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    for table, _ in COUNTED:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # count the existing shows against the time of the migration, the
+    # rollover job carries on from there
+    bind = op.get_bind()
+    now = datetime.now()
+    for table, key in COUNTED:
+        bind.execute(sa.text(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" s WHERE s.{key} = "{table}".id AND s.start_time >= :now), '
+            'past_shows_count = (SELECT count(*) FROM "Show" s WHERE s.{key} = "{table}".id AND s.start_time < :now)'
+            .format(table=table, key=key)), now=now)
+    bind.execute(sa.text("INSERT INTO job_state (name, watermark, updated_at) VALUES ('show_counters', :now, :utcnow)"),
+                 now=now, utcnow=datetime.utcnow())
+
+
+def downgrade():
+    for table, _ in reversed(COUNTED):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_table('job_state')
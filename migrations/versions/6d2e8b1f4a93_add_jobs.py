@@ -0,0 +1,47 @@
+"""add jobs
+
+Revision ID: 6d2e8b1f4a93
+Revises: 3a9c4d7e1f82
+Create Date: 2026-10-18 23:41:16.520934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2e8b1f4a93'
+down_revision = '3a9c4d7e1f82'
+branch_labels = None
+depends_on = None
+
+JOB_QUEUED = "status = 'queued'"
+
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task', sa.String(length=64), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('key', sa.String(length=200), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_by', sa.String(length=120), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_status_run_at', 'jobs', ['status', 'run_at'], unique=False)
+    # at most one queued job per idempotency key
+    op.create_index('ix_jobs_queued_key', 'jobs', ['key'], unique=True,
+                    postgresql_where=sa.text(JOB_QUEUED), sqlite_where=sa.text(JOB_QUEUED))
+
+
+def downgrade():
+    op.drop_index('ix_jobs_queued_key', table_name='jobs')
+    op.drop_index('ix_jobs_status_run_at', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,32 @@
+"""add venue coordinates
+
+Revision ID: 8e3f1b6d2c47
+Revises: d41f7a2c9e58
+Create Date: 2026-10-18 21:03:44.518290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f1b6d2c47'
+down_revision = 'd41f7a2c9e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled in by `flask geo geocode`
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_Venue_geohash'), 'Venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Venue_geohash'), table_name='Venue')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,39 @@
+"""add import state
+
+Revision ID: 9c5e3a7b2d14
+Revises: 6d2e8b1f4a93
+Create Date: 2026-10-18 19:52:08.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c5e3a7b2d14'
+down_revision = '6d2e8b1f4a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_state',
+        sa.Column('path', sa.String(length=500), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('line', sa.Integer(), nullable=False),
+        sa.Column('inserted', sa.Integer(), nullable=False),
+        sa.Column('rejected', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('path')
+    )
+    op.create_table('import_ids',
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('source_id', sa.String(length=200), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('kind', 'source_id')
+    )
+
+
+def downgrade():
+    op.drop_table('import_ids')
+    op.drop_table('import_state')
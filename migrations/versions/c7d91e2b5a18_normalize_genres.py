@@ -0,0 +1,109 @@
+"""normalize genres
+
+Revision ID: c7d91e2b5a18
+Revises: 8a4e61c0d2f5
+Create Date: 2026-10-18 11:20:05.318764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d91e2b5a18'
+down_revision = '8a4e61c0d2f5'
+branch_labels = None
+depends_on = None
+
+# (entity table, old comma joined column, association table, fk column)
+GENRE_COLUMNS = (
+    ('Venue', 'geners', 'venue_genres', 'venue_id'),
+    ('Artist', 'genres', 'artist_genres', 'artist_id'),
+)
+
+
+def split_genres(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id', 'venue_genres', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id', 'artist_genres', ['genre_id', 'artist_id'], unique=False)
+
+    # move the comma joined strings over to the association tables
+    bind = op.get_bind()
+    genre = sa.table('Genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+    rows = {}
+    for table, column, _, _ in GENRE_COLUMNS:
+        rows[table] = bind.execute(sa.text('SELECT id, {} FROM "{}"'.format(column, table))).fetchall()
+    names = sorted({name for table_rows in rows.values() for _, value in table_rows
+                    for name in split_genres(value)})
+    if names:
+        op.bulk_insert(genre, [{'name': name} for name in names])
+    genre_ids = {name: id for name, id in bind.execute(sa.select([genre.c.name, genre.c.id]))}
+    for table, _, association, fk in GENRE_COLUMNS:
+        links = sa.table(association, sa.column(fk, sa.Integer), sa.column('genre_id', sa.Integer))
+        values = [{fk: id, 'genre_id': genre_ids[name]}
+                  for id, value in rows[table] for name in set(split_genres(value))]
+        if values:
+            op.bulk_insert(links, values)
+
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_venue_geners_trgm', table_name='Venue')
+        op.drop_index('ix_artist_genres_trgm', table_name='Artist')
+        op.create_index('ix_genre_name_trgm', 'Genre', ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+    # batch mode recreates the tables on SQLite, which older versions need
+    # to drop a column
+    for table, column, _, _ in GENRE_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column(column)
+
+
+def downgrade():
+    op.add_column('Artist', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+    op.add_column('Venue', sa.Column('geners', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+
+    bind = op.get_bind()
+    for table, column, association, fk in GENRE_COLUMNS:
+        joined = {}
+        for id, name in bind.execute(sa.text(
+                'SELECT a.{fk}, g.name FROM {association} a JOIN "Genre" g ON g.id = a.genre_id '
+                'ORDER BY g.name'.format(fk=fk, association=association))):
+            joined.setdefault(id, []).append(name)
+        for id, names in joined.items():
+            bind.execute(sa.text('UPDATE "{}" SET {} = :value WHERE id = :id'.format(table, column)),
+                         value=','.join(names), id=id)
+
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_genre_name_trgm', table_name='Genre')
+        for table, column, _, _ in GENRE_COLUMNS:
+            op.create_index('ix_{}_{}_trgm'.format(table.lower(), column), table, [column],
+                            postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+    op.drop_index('ix_artist_genres_genre_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('Genre')
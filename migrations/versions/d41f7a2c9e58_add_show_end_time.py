@@ -0,0 +1,64 @@
+"""add show end time
+
+Revision ID: d41f7a2c9e58
+Revises: 5b0e9d7c3a61
+Create Date: 2026-10-18 19:12:05.306417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7a2c9e58'
+down_revision = '5b0e9d7c3a61'
+branch_labels = None
+depends_on = None
+
+# (constraint, Show column of the booked venue or artist)
+EXCLUSION_CONSTRAINTS = (
+    ('ex_show_venue_overlap', 'venue_id'),
+    ('ex_show_artist_overlap', 'artist_id'),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # the existing shows get the default duration of two hours
+    if bind.dialect.name == 'postgresql':
+        bind.execute('UPDATE "Show" SET end_time = start_time + interval \'2 hours\'')
+    else:
+        bind.execute('UPDATE "Show" SET end_time = datetime(start_time, \'+2 hours\')')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_show_end_after_start', 'end_time > start_time')
+
+    if bind.dialect.name != 'postgresql':
+        return
+    # the constraints cannot be added over double bookings, list a few of
+    # them rather than failing on the first
+    conflicts = []
+    for _, column in EXCLUSION_CONSTRAINTS:
+        conflicts += ['{} {}: shows {} and {}'.format(column, *row) for row in bind.execute(
+            'SELECT a.{0}, a.id, b.id FROM "Show" a JOIN "Show" b ON a.{0} = b.{0} AND a.id < b.id '
+            'AND a.start_time < b.end_time AND b.start_time < a.end_time LIMIT 20'.format(column))]
+    if conflicts:
+        raise RuntimeError('double bookings, move or delete one show of each pair first:\n' +
+                           '\n'.join(conflicts))
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in EXCLUSION_CONSTRAINTS:
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT {} EXCLUDE USING gist '
+                   '({} WITH =, tsrange(start_time, end_time) WITH &&)'.format(name, column))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for name, _ in reversed(EXCLUSION_CONSTRAINTS):
+            op.drop_constraint(name, 'Show')
+    with op.batch_alter_table('Show') as batch_op:
+        # SQLite rebuilds the table without the unreflected check constraint
+        if dialect != 'sqlite':
+            batch_op.drop_constraint('ck_show_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
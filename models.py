@@ -1,22 +1,43 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_moment import Moment
-from flask_migrate import Migrate
+from datetime import datetime, timedelta
+import dateutil.parser
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import Session
+from routing import RoutingSQLAlchemy
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-db = SQLAlchemy()
-migrate = Migrate(app,db)
+# bound to the app by app.create_app
+db = RoutingSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id')
+)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_city_state', 'city', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -27,12 +48,22 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
 
     # pTODO: implement any missing fields, as a database migration using Flask-Migrate
-    geners = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', lazy=True)
     image_link = db.Column(db.String(500))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean() ,default=False)
     seeking_description = db.Column(db.String(120))
-    venue_events = db.relationship('Show',back_populates='venue',lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # maintained by counters.py, relative to the show_counters watermark
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # WGS84 degrees from the gazetteer, and the geohash of the point for the
+    # nearby search (geo.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+    venue_events = db.relationship('Show', back_populates='venue', lazy=True,
+                                   cascade='all, delete-orphan', passive_deletes=True)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
@@ -42,7 +73,7 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', lazy=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -50,15 +81,141 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean(),default=False)
     seeking_description = db.Column(db.String(120))
-    artist_events = db.relationship('Show',back_populates='artist',lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    artist_events = db.relationship('Show', back_populates='artist', lazy=True,
+                                    cascade='all, delete-orphan', passive_deletes=True)
 
 # pTODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+# a show without an end time books its venue and artist this long
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+# and at most this long: the conflict checks of scheduling.py rely on it
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+def default_end_time(context):
+  start_time = context.get_current_parameters()['start_time']
+  if isinstance(start_time, str):
+    start_time = dateutil.parser.parse(start_time)
+  return start_time + DEFAULT_SHOW_DURATION
+
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    db.CheckConstraint('end_time > start_time', name='ck_show_end_after_start'),
+  )
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
   venue_id = db.Column(db.Integer ,db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
   start_time = db.Column(db.DateTime, nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
   venue = db.relationship('Venue', back_populates='venue_events')
   artist = db.relationship('Artist', back_populates='artist_events')
+
+# on Postgres a venue or an artist cannot be booked twice at the same time.
+# the constraints need btree_gist for the = on the ids; scheduling.py
+# checks first and reports the conflicting show.
+SHOW_EXCLUSION_CONSTRAINTS = (
+  ('ex_show_venue_overlap', 'venue_id'),
+  ('ex_show_artist_overlap', 'artist_id'),
+)
+
+event.listen(Show.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+for name, column in SHOW_EXCLUSION_CONSTRAINTS:
+  event.listen(Show.__table__, 'after_create', DDL(
+    'ALTER TABLE "Show" ADD CONSTRAINT {} EXCLUDE USING gist '
+    '({} WITH =, tsrange(start_time, end_time) WITH &&)'.format(name, column)
+  ).execute_if(dialect='postgresql'))
+
+# precomputed by recommendations.py: the most similar venues of each venue
+# and artists of each artist, rank 0 first. shared is the number of artists
+# (venues) the two have in common.
+venue_similarities = db.Table('venue_similarities',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('similar_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False, index=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Column('shared', db.Integer, nullable=False)
+)
+
+artist_similarities = db.Table('artist_similarities',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('rank', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('similar_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False, index=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Column('shared', db.Integer, nullable=False)
+)
+
+class JobState(db.Model):
+    # progress of the periodic jobs, e.g. the time up to which shows have
+    # been moved from upcoming to past
+    __tablename__ = 'job_state'
+
+    name = db.Column(db.String(64), primary_key=True)
+    watermark = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ImportState(db.Model):
+    # progress of `flask import` per source file, written in the
+    # transaction of each batch so that --resume starts after the last
+    # committed one
+    __tablename__ = 'import_state'
+
+    path = db.Column(db.String(500), primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    line = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# the database ids of the imported venues and artists by their id in the
+# source files, shared between imports
+import_ids = db.Table('import_ids',
+    db.Column('kind', db.String(16), primary_key=True),
+    db.Column('source_id', db.String(200), primary_key=True),
+    db.Column('id', db.Integer, nullable=False)
+)
+
+JOB_QUEUED = "status = 'queued'"
+
+class Job(db.Model):
+    # deferred work of the write handlers, run by `flask jobs work` (jobs.py).
+    # status goes queued -> running -> done, or back to retrying after a
+    # failure and to failed after max_attempts. times are UTC.
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        # at most one queued job per idempotency key
+        db.Index('ix_jobs_queued_key', 'key', unique=True,
+                 postgresql_where=db.text(JOB_QUEUED), sqlite_where=db.text(JOB_QUEUED)),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    key = db.Column(db.String(200))
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(120))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+# updated_at is the row version behind the API ETags. it is bumped here
+# rather than with onupdate so that a change to a relationship only (e.g.
+# the genres of a venue) counts as well.
+@event.listens_for(Session, 'before_flush')
+def touch_updated_at(session, flush_context, instances):
+  now = datetime.utcnow()
+  for obj in session.dirty:
+    if isinstance(obj, (Venue, Artist, Show)) and session.is_modified(obj):
+      obj.updated_at = now
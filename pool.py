@@ -0,0 +1,52 @@
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.pool import Pool, QueuePool
+
+#----------------------------------------------------------------------------#
+# Pool statistics.
+#----------------------------------------------------------------------------#
+
+class PoolStats(object):
+    # process wide counters of the pool events, for /healthz/db
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'connects': 0, 'checkouts': 0, 'checkins': 0, 'invalidated': 0}
+        event.listen(Pool, 'connect', lambda *args: self.incr('connects'))
+        event.listen(Pool, 'checkout', lambda *args: self.incr('checkouts'))
+        event.listen(Pool, 'checkin', lambda *args: self.incr('checkins'))
+        event.listen(Pool, 'invalidate', lambda *args: self.incr('invalidated'))
+
+    def incr(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def status(self, engine):
+        pool = engine.pool
+        status = {'class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            status.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool._timeout,
+            })
+        with self.lock:
+            status.update(self.counts)
+        return status
+
+
+pool_stats = PoolStats()
+
+
+def ping(engine):
+    # round trip time of a SELECT 1 in milliseconds, raises when the
+    # database is unreachable
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    return round((time.perf_counter() - started) * 1000, 2)
@@ -0,0 +1,135 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('sql_profiler')
+
+#----------------------------------------------------------------------------#
+# Fingerprints.
+#----------------------------------------------------------------------------#
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM_LISTS = re.compile(r'\((?:\s*\?\s*,?)+\)|\((?:\s*%\(\w+\)s\s*,?)+\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    # the statement with literals and IN lists collapsed, so that the same
+    # query run for every row of a loop shows up as one repeated statement
+    statement = _LITERALS.sub('?', statement)
+    statement = _PARAM_LISTS.sub('(?)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+#----------------------------------------------------------------------------#
+# Profiler.
+#----------------------------------------------------------------------------#
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+class QueryProfiler(object):
+    # opt-in (SQL_PROFILER): counts the queries and the database time of
+    # every request, adds a Server-Timing header, logs one JSON line per
+    # request and flags statements repeated SQL_PROFILER_REPEAT_THRESHOLD
+    # times or more. SQL_QUERY_BUDGETS caps the queries per endpoint; over
+    # budget is logged, and raises when testing.
+
+    def __init__(self, app=None):
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER', False)
+        app.config.setdefault('SQL_PROFILER_REPEAT_THRESHOLD', 3)
+        app.config.setdefault('SQL_QUERY_BUDGETS', {})
+        if not app.config['SQL_PROFILER']:
+            return
+        # the listeners are on every engine and only count inside a
+        # profiled request, once is enough for any number of apps
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def stats():
+        # the QueryStats of the current request, None outside of one
+        return g.get('_sql_stats') if has_request_context() else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.stats() is not None:
+            conn.info.setdefault('_sql_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.stats()
+        started = conn.info.get('_sql_started')
+        if stats is None or not started:
+            return
+        stats.count += 1
+        stats.duration += time.perf_counter() - started.pop()
+        stats.statements[fingerprint(statement)] += 1
+
+    def _start(self):
+        g._sql_stats = QueryStats()
+
+    def _finish(self, response):
+        stats = g.get('_sql_stats')
+        if stats is None:
+            return response
+        config = current_app.config
+        response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(
+            stats.duration * 1000, stats.count))
+
+        endpoint = request.endpoint
+        method, path = request.method, request.full_path.rstrip('?')
+        status = response.status_code
+
+        def log():
+            # on close, so that streamed responses are counted in full
+            repeated = stats.repeated(config['SQL_PROFILER_REPEAT_THRESHOLD'])
+            logger.log(logging.WARNING if repeated else logging.INFO, json.dumps({
+                'event': 'sql_profile',
+                'method': method,
+                'path': path,
+                'endpoint': endpoint,
+                'status': status,
+                'queries': stats.count,
+                'db_ms': round(stats.duration * 1000, 2),
+                'repeated': [{'statement': statement, 'count': count}
+                             for statement, count in repeated],
+            }))
+
+        response.call_on_close(log)
+
+        budget = config['SQL_QUERY_BUDGETS'].get(endpoint)
+        if budget is not None and stats.count > budget:
+            message = '{} ran {} queries, over its budget of {}'.format(endpoint, stats.count, budget)
+            if current_app.testing:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+profiler = QueryProfiler()
@@ -0,0 +1,489 @@
+from datetime import datetime, timedelta
+import dateutil.parser
+from flask import g, has_request_context, request
+from sqlalchemy import and_, case, distinct, func, or_
+from sqlalchemy.orm import selectinload
+from models import db, Artist, Genre, Venue, Show, artist_similarities, venue_similarities
+from cache import cache
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+def get_or_create_genres(names):
+    # Genre rows for the given names, the missing ones are added to the
+    # session.
+    names = sorted({name.strip() for name in names if name and name.strip()})
+    if not names:
+        return []
+    genres = Genre.query.filter(Genre.name.in_(names)).all()
+    existing = {genre.name for genre in genres}
+    for name in names:
+        if name not in existing:
+            genre = Genre(name=name)
+            db.session.add(genre)
+            genres.append(genre)
+    return sorted(genres, key=lambda genre: genre.name)
+
+
+def has_genre(model, genre):
+    # EXISTS over the association table, served by the unique index on
+    # Genre.name and the (genre_id, <model>_id) index.
+    return model.genres.any(Genre.name == genre)
+
+#----------------------------------------------------------------------------#
+# Entity resolver.
+#----------------------------------------------------------------------------#
+
+RESOLVE_BATCH_SIZE = 500
+
+
+def resolved_entities(model):
+    # the entities of model resolved so far in this request. g belongs to
+    # the app context, which outlives the request when it was pushed first
+    # (commands, tests), so the cache is tied to the request as well.
+    if not has_request_context():
+        return {}
+    current = request._get_current_object()
+    if g.get('_resolved_request') is not current:
+        g._resolved_request, g._resolved = current, {}
+    return g._resolved.setdefault(model, {})
+
+
+def resolve(model, ids):
+    # {id: entity} for the ids, e.g. the venues of a page of shows. the ids
+    # not resolved earlier in the request are loaded with one IN query per
+    # RESOLVE_BATCH_SIZE of them, and kept on g for the rest of the request.
+    # unknown ids are left out.
+    resolved = resolved_entities(model)
+    ids = {int(id) for id in ids if id is not None}
+    missing = sorted(ids - set(resolved))
+    for offset in range(0, len(missing), RESOLVE_BATCH_SIZE):
+        batch = missing[offset:offset + RESOLVE_BATCH_SIZE]
+        for entity in model.query.filter(model.id.in_(batch)):
+            resolved[entity.id] = entity
+        for id in batch:
+            resolved.setdefault(id, None)
+    return {id: resolved[id] for id in ids if resolved[id] is not None}
+
+#----------------------------------------------------------------------------#
+# Recommendations.
+#----------------------------------------------------------------------------#
+
+def get_similar(model, entity_id):
+    # the similar venues of a venue or artists of an artist, precomputed by
+    # recommendations.py: one lookup on the (id, rank) primary key
+    table = venue_similarities if model is Venue else artist_similarities
+    key = table.c.venue_id if model is Venue else table.c.artist_id
+    rows = db.session.query(model.id, model.name, model.image_link, table.c.shared).\
+        join(table, table.c.similar_id == model.id).\
+        filter(key == entity_id).order_by(table.c.rank).all()
+    return similar_details(rows)
+
+
+def similar_details(rows):
+    # rows of (id, name, image_link, shared)
+    return [{
+        "id": id,
+        "name": name,
+        "image_link": image_link,
+        "shared": shared,
+    } for id, name, image_link, shared in rows]
+
+#----------------------------------------------------------------------------#
+# Venues.
+#----------------------------------------------------------------------------#
+
+def get_venues_by_cities(genre=None):
+    # one query for the whole directory, upcoming counts come from the
+    # counter column: rows come back ordered by (city, state) so the
+    # nested structure is built in a single pass.
+    query = db.session.query(
+        Venue.city,
+        Venue.state,
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count
+    )
+    if genre:
+        query = query.filter(has_genre(Venue, genre))
+    return group_venues_by_city(query.order_by(Venue.city, Venue.state, Venue.id).all())
+
+
+def group_venues_by_city(rows):
+    # (city, state, id, name, upcoming count) rows, ordered by city and state
+    data = []
+    area = None
+    for city, state, venue_id, name, num_upcoming_shows in rows:
+        if area is None or (area['city'], area['state']) != (city, state):
+            area = {'city': city, 'state': state, 'venues': []}
+            data.append(area)
+        area['venues'].append({
+            'id': venue_id,
+            'name': name,
+            'num_upcoming_shows': num_upcoming_shows
+        })
+    return data
+
+
+def get_venue_details(venue_id, now=None, past_limit=None):
+    # everything the venue page shows, None when there is no such venue
+    venue = Venue.query.options(selectinload(Venue.genres)).filter_by(id=venue_id).first()
+    if venue is None:
+        return None
+    past_shows, upcoming_shows, past_shows_count = get_past_and_upcoming_shows(
+        Artist, Show.venue_id, venue_id, now, past_limit)
+    data = venue_details(venue, [genre.name for genre in venue.genres],
+                       past_shows, upcoming_shows, past_shows_count)
+    data['similar_venues'] = get_similar(Venue, venue_id)
+    return data
+
+
+def venue_details(venue, genres, past_shows, upcoming_shows, past_shows_count):
+    # the venue page data; shows are (artist, show) pairs. anything with
+    # attribute access will do, the async views pass database records.
+    data = {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": genres,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "seeking_talent": bool(venue.seeking_talent),
+        "past_shows": [{
+            "artist_id": artist.id,
+            "artist_name": artist.name,
+            "artist_image_link": artist.image_link,
+            "start_time": show.start_time
+        } for artist, show in past_shows],
+        "upcoming_shows": [{
+            "artist_id": artist.id,
+            "artist_name": artist.name,
+            "artist_image_link": artist.image_link,
+            "start_time": show.start_time
+        } for artist, show in upcoming_shows],
+        "past_shows_count": past_shows_count,
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+    if venue.address:
+        data['address'] = venue.address
+    if venue.facebook_link:
+        data['facebook_link'] = venue.facebook_link
+    if venue.image_link:
+        data['image_link'] = venue.image_link
+    if venue.website_link:
+        data['website'] = venue.website_link
+    if venue.seeking_talent:
+        data['seeking_description'] = venue.seeking_description
+    if venue.latitude is not None:
+        data['latitude'] = venue.latitude
+        data['longitude'] = venue.longitude
+    return data
+
+#----------------------------------------------------------------------------#
+# Artists.
+#----------------------------------------------------------------------------#
+
+def get_artists(genre=None):
+    query = db.session.query(Artist.id, Artist.name)
+    if genre:
+        query = query.filter(has_genre(Artist, genre))
+    return [{"id": id, "name": name} for id, name in query.all()]
+
+
+def get_artist_details(artist_id, now=None, past_limit=None):
+    # everything the artist page shows, None when there is no such artist
+    artist = Artist.query.options(selectinload(Artist.genres)).filter_by(id=artist_id).first()
+    if artist is None:
+        return None
+    past_shows, upcoming_shows, past_shows_count = get_past_and_upcoming_shows(
+        Venue, Show.artist_id, artist_id, now, past_limit)
+    data = artist_details(artist, [genre.name for genre in artist.genres],
+                        past_shows, upcoming_shows, past_shows_count)
+    data['similar_artists'] = get_similar(Artist, artist_id)
+    return data
+
+
+def artist_details(artist, genres, past_shows, upcoming_shows, past_shows_count):
+    # the artist page data; shows are (venue, show) pairs
+    data = {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": genres,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "seeking_venue": bool(artist.seeking_venue),
+        "past_shows": [{
+            "venue_id": venue.id,
+            "venue_name": venue.name,
+            "venue_image_link": venue.image_link,
+            "start_time": show.start_time
+        } for venue, show in past_shows],
+        "upcoming_shows": [{
+            "venue_id": venue.id,
+            "venue_name": venue.name,
+            "venue_image_link": venue.image_link,
+            "start_time": show.start_time
+        } for venue, show in upcoming_shows],
+        "past_shows_count": past_shows_count,
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+    if artist.facebook_link:
+        data['facebook_link'] = artist.facebook_link
+    if artist.image_link:
+        data['image_link'] = artist.image_link
+    if artist.website_link:
+        data['website'] = artist.website_link
+    if artist.seeking_venue:
+        data['seeking_description'] = artist.seeking_description
+    return data
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+def encode_show_cursor(show):
+    return '{}_{}'.format(show.start_time.isoformat(), show.id)
+
+
+def decode_show_cursor(cursor):
+    # raises ValueError on a malformed cursor
+    start_time, show_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+
+
+def parse_date_arg(args, name):
+    # the date of a request argument or None, ValueError on a malformed one
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return dateutil.parser.parse(value)
+    except OverflowError:
+        raise ValueError(value)
+
+
+def parse_shows_args(args, page_size, max_page_size):
+    # (after, limit, filters) of a shows listing request, ValueError on a
+    # malformed cursor or date
+    after = decode_show_cursor(args['after']) if args.get('after') else None
+    limit = max(1, min(args.get('limit', page_size, type=int), max_page_size))
+    filters = {
+        'start': parse_date_arg(args, 'start'),
+        'end': parse_date_arg(args, 'end'),
+        'venue_id': args.get('venue_id', type=int),
+        'artist_id': args.get('artist_id', type=int),
+    }
+    return after, limit, filters
+
+
+def get_shows_page(after=None, limit=30, start=None, end=None,
+                   venue_id=None, artist_id=None):
+    # keyset pagination on (start_time, id): a page costs one query no
+    # matter how deep into the listing it is. returns the shows of the page
+    # and the cursor of the next one (None on the last page).
+    query = Show.query
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    if venue_id is not None:
+        query = query.filter(Show.venue_id == venue_id)
+    if artist_id is not None:
+        query = query.filter(Show.artist_id == artist_id)
+    if after is not None:
+        after_time, after_id = after
+        query = query.filter(or_(Show.start_time > after_time,
+                                 and_(Show.start_time == after_time, Show.id > after_id)))
+    shows = query.order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(shows) > limit:
+        shows = shows[:limit]
+        next_cursor = encode_show_cursor(shows[-1])
+    return shows, next_cursor
+
+
+def get_past_and_upcoming_shows(counterpart, key, entity_id, now=None, past_limit=None):
+    # the shows of one venue (key=Show.venue_id, counterpart=Artist) or one
+    # artist (key=Show.artist_id, counterpart=Venue), split on one reference
+    # time, in one query. upcoming shows come soonest first; past shows most
+    # recent first, numbered and counted by window functions over the past
+    # partition and cut to past_limit by the database. the total number of
+    # past shows is returned as well.
+    now = now or datetime.now()
+    counterpart_key = Show.artist_id if counterpart is Artist else Show.venue_id
+    past = case([(Show.start_time < now, 1)], else_=0)
+    numbered = db.session.query(
+        Show.id.label('id'),
+        past.label('past'),
+        func.row_number().over(partition_by=past,
+                               order_by=(Show.start_time.desc(), Show.id.desc())).label('number'),
+        func.count().over(partition_by=past).label('count')).\
+        filter(key == entity_id).subquery()
+    query = db.session.query(counterpart, Show, numbered.c.past, numbered.c.count).\
+        join(Show, counterpart_key == counterpart.id).\
+        join(numbered, numbered.c.id == Show.id)
+    if past_limit is not None:
+        # one past row at least, it carries the count
+        query = query.filter(or_(numbered.c.past == 0, numbered.c.number <= max(past_limit, 1)))
+    past_shows, upcoming, past_count = [], [], 0
+    for entity, show, is_past, count in query.order_by(Show.start_time, Show.id):
+        if is_past:
+            past_shows.append((entity, show))
+            past_count = count
+        else:
+            upcoming.append((entity, show))
+    past_shows.reverse()
+    return past_shows[:past_limit], upcoming, past_count
+
+
+def get_shows_listing(after=None, limit=30, **filters):
+    # one page of the /shows listing as plain dicts, and the next cursor.
+    # the venues and artists of the page are resolved once each.
+    shows, next_cursor = get_shows_page(after, limit, **filters)
+    venues = resolve(Venue, [show.venue_id for show in shows])
+    artists = resolve(Artist, [show.artist_id for show in shows])
+    return [{
+        "venue_id": show.venue_id,
+        "venue_name": venues[show.venue_id].name,
+        "artist_id": show.artist_id,
+        "artist_name": artists[show.artist_id].name,
+        "artist_image_link": artists[show.artist_id].image_link,
+        "start_time": show.start_time
+    } for show in shows if show.venue_id in venues and show.artist_id in artists], next_cursor
+
+#----------------------------------------------------------------------------#
+# Calendar.
+#----------------------------------------------------------------------------#
+
+# buckets start at midnight, weeks on Monday like Postgres' date_trunc.
+# the buckets before the current one only change when a show is listed in
+# the past or deleted, which invalidates the 'calendar' tag; until then
+# they are cached for CALENDAR_PAST_TTL, which only the redis cache can
+# make longer than the pages' TTL.
+CALENDAR_BUCKETS = ('day', 'week', 'month')
+
+# buckets shown without an end date
+CALENDAR_DEFAULT_SPANS = {'day': 31, 'week': 12, 'month': 12}
+
+
+def truncate(value, bucket):
+    # the start of the bucket holding value
+    day = datetime(value.year, value.month, value.day)
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def previous_bucket(start, bucket):
+    return truncate(start - timedelta(days=1), bucket)
+
+
+def iter_buckets(start, end, bucket):
+    while start < end:
+        yield start
+        start = next_bucket(start, bucket)
+
+
+def parse_calendar_args(args, max_buckets):
+    # (bucket, start, end, filters) of a calendar request, the range widened
+    # to whole buckets. ValueError on a malformed argument or a range of
+    # more than max_buckets.
+    bucket = args.get('bucket', 'week')
+    if bucket not in CALENDAR_BUCKETS:
+        raise ValueError(bucket)
+    start = truncate(parse_date_arg(args, 'start') or datetime.now(), bucket)
+    end = parse_date_arg(args, 'end')
+    if end is None:
+        end = start
+        for _ in range(CALENDAR_DEFAULT_SPANS[bucket]):
+            end = next_bucket(end, bucket)
+    elif truncate(end, bucket) < end:
+        end = next_bucket(truncate(end, bucket), bucket)
+    if end <= start:
+        raise ValueError(end)
+    if end > start + timedelta(days=31 * max_buckets) or \
+            len(list(iter_buckets(start, end, bucket))) > max_buckets:
+        raise ValueError(end)
+    filters = {
+        'venue_id': args.get('venue_id', type=int),
+        'artist_id': args.get('artist_id', type=int),
+    }
+    return bucket, start, end, filters
+
+
+def bucket_column(bucket):
+    # the bucket of Show.start_time, computed by the database
+    if db.engine.dialect.name == 'postgresql':
+        return func.date_trunc(bucket, Show.start_time)
+    if bucket == 'week':
+        return func.date(Show.start_time, 'weekday 0', '-6 days')
+    if bucket == 'month':
+        return func.strftime('%Y-%m-01', Show.start_time)
+    return func.date(Show.start_time)
+
+
+def count_buckets(bucket, start, end, venue_id=None, artist_id=None):
+    # {bucket start: (shows, venues, artists)} of the buckets with shows in
+    # [start, end): one grouped range scan on the start_time index, or on
+    # (venue_id, start_time) / (artist_id, start_time) with a filter
+    query = db.session.query(bucket_column(bucket).label('bucket'), func.count(Show.id),
+                             func.count(distinct(Show.venue_id)),
+                             func.count(distinct(Show.artist_id))).\
+        filter(Show.start_time >= start, Show.start_time < end)
+    if venue_id is not None:
+        query = query.filter(Show.venue_id == venue_id)
+    if artist_id is not None:
+        query = query.filter(Show.artist_id == artist_id)
+    counts = {}
+    for key, shows, venues, artists in query.group_by('bucket'):
+        # SQLite returns the date as text
+        if not isinstance(key, datetime):
+            key = datetime.strptime(key[:10], '%Y-%m-%d')
+        counts[key] = (shows, venues, artists)
+    return counts
+
+
+def get_calendar(bucket, start, end, venue_id=None, artist_id=None, now=None, past_ttl=None):
+    # every bucket of [start, end), empty ones included, as plain dicts.
+    # the part of the range before the current bucket is cached, the rest
+    # is counted on every call.
+    current = truncate(now or datetime.now(), bucket)
+    past_end = min(max(current, start), end)
+    counts = {}
+    if start < past_end:
+        key = 'calendar:{}:{}:{}:{}:{}'.format(bucket, venue_id, artist_id,
+                                               start.isoformat(), past_end.isoformat())
+        counts.update(cache.get_or_set(
+            key, ['calendar'],
+            lambda: count_buckets(bucket, start, past_end, venue_id, artist_id),
+            past_ttl))
+    if past_end < end:
+        counts.update(count_buckets(bucket, past_end, end, venue_id, artist_id))
+
+    buckets = []
+    for bucket_start in iter_buckets(start, end, bucket):
+        shows, venues, artists = counts.get(bucket_start, (0, 0, 0))
+        buckets.append({
+            "start": bucket_start,
+            "end": next_bucket(bucket_start, bucket),
+            "past": bucket_start < current,
+            "num_shows": shows,
+            "num_venues": venues,
+            "num_artists": artists,
+        })
+    return buckets
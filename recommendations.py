@@ -0,0 +1,282 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from cache import cache
+from counters import get_watermark, set_watermark
+from models import (db, Artist, Show, Venue, artist_genres, venue_genres,
+                    artist_similarities, venue_similarities)
+
+#----------------------------------------------------------------------------#
+# Recommendations.
+#----------------------------------------------------------------------------#
+
+# the similar venues of a venue ("artists who played here also played
+# at...") and the similar artists of an artist are precomputed into
+# venue_similarities and artist_similarities, so a detail page reads them
+# with one primary key lookup.
+#
+# a venue is a vector over the artists that played there (1 + log of the
+# number of shows) and a vector over its genres; the similarity of two
+# venues is a weighted sum of the cosines of both, artists the other way
+# around. the job needs NumPy and SciPy (requirements-recommendations.txt),
+# the pages do not.
+#
+# `build` recomputes every list. `refresh` recomputes the lists the shows
+# and entities written since its last run can change: those of the changed
+# entities, those holding a changed entity and those a changed entity now
+# beats the last entry of. deleted shows leave no trace to refresh from,
+# only `build` catches up with them.
+
+JOB_NAME = 'recommendations'
+
+# (model, similarity table, Show column of the entity, Show column of the
+# counterpart, genre association table)
+KINDS = {
+    'venue': (Venue, venue_similarities, Show.venue_id, Show.artist_id, venue_genres),
+    'artist': (Artist, artist_similarities, Show.artist_id, Show.venue_id, artist_genres),
+}
+
+# cells of the dense score blocks, 4M float64s are 32 MB
+BLOCK_CELLS = 1 << 22
+
+# scores of the same pair computed from either side may differ by rounding
+SCORE_TOLERANCE = 1e-9
+
+# rows per insert and ids per IN list
+WRITE_BATCH_SIZE = 1000
+
+
+class Matrices(object):
+    # the rows of every entity of one kind, in id order: bookings and genres
+    # normalised for the cosines, shared as 0/1 for the counts in common
+
+    def __init__(self, conn, kind):
+        import numpy as np
+        from scipy import sparse
+
+        model, _, key, counterpart, association = KINDS[kind]
+        self.ids = np.array([id for id, in conn.execute(select([model.id]).order_by(model.id))],
+                            dtype=np.int64)
+        size = len(self.ids)
+
+        pairs = np.array(fetch_tuples(conn, select([key, counterpart, func.count()])
+                                      .group_by(key, counterpart)),
+                         dtype=np.int64).reshape(-1, 3)
+        columns, inverse = np.unique(pairs[:, 1], return_inverse=True)
+        rows = np.searchsorted(self.ids, pairs[:, 0])
+        shape = (size, len(columns))
+        self.shared = sparse.csr_matrix((np.ones(len(pairs)), (rows, inverse)), shape=shape)
+        self.bookings = normalize_rows(sparse.csr_matrix(
+            (1 + np.log(pairs[:, 2]), (rows, inverse)), shape=shape))
+
+        association_key = association.c[key.name]
+        genres = np.array(fetch_tuples(conn, select([association_key, association.c.genre_id])),
+                          dtype=np.int64).reshape(-1, 2)
+        genre_columns, genre_inverse = np.unique(genres[:, 1], return_inverse=True)
+        self.genres = normalize_rows(sparse.csr_matrix(
+            (np.ones(len(genres)), (np.searchsorted(self.ids, genres[:, 0]), genre_inverse)),
+            shape=(size, len(genre_columns))))
+
+    def rows(self, ids):
+        # the rows of the given ids, the ones without a row are dropped
+        import numpy as np
+        ids = np.asarray(sorted(ids), dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == ids[found]
+        return rows[found]
+
+    def blocks(self, rows, genre_weight):
+        # (rows, scores, shared) of the given rows against every entity, as
+        # dense blocks of at most BLOCK_CELLS; self-similarity is zeroed
+        import numpy as np
+        step = max(1, BLOCK_CELLS // max(1, len(self.ids)))
+        for start in range(0, len(rows), step):
+            block = rows[start:start + step]
+            scores = (1 - genre_weight) * (self.bookings[block] @ self.bookings.T) + \
+                genre_weight * (self.genres[block] @ self.genres.T)
+            scores = scores.toarray()
+            scores[np.arange(len(block)), block] = 0
+            yield block, scores, (self.shared[block] @ self.shared.T).toarray()
+
+
+def fetch_tuples(conn, query):
+    # NumPy reads plain tuples much faster than result rows
+    return [tuple(row) for row in conn.execute(query)]
+
+
+def normalize_rows(matrix):
+    import numpy as np
+    from scipy import sparse
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def top_similar(matrices, rows, k, genre_weight):
+    # {id: [(similar id, score, shared)]} of the given rows, best first,
+    # ties by id; only positive scores
+    import numpy as np
+    results = {}
+    size = len(matrices.ids)
+    count = min(k, size)
+    for block, scores, shared in matrices.blocks(rows, genre_weight):
+        # the k-th best score of each row; everything scoring as much is a
+        # candidate, so that ties are broken by id and not by the partition
+        kth = np.partition(scores, size - count, axis=1)[:, size - count] if count else \
+            np.full(len(block), np.inf)
+        for i, row in enumerate(block):
+            candidates = np.flatnonzero((scores[i] >= kth[i]) & (scores[i] > 0))
+            candidates = candidates[np.lexsort((matrices.ids[candidates], -scores[i, candidates]))]
+            results[int(matrices.ids[row])] = [
+                (int(matrices.ids[j]), float(scores[i, j]), int(shared[i, j]))
+                for j in candidates[:count]]
+    return results
+
+
+def store(conn, kind, results, replace_all=False):
+    # replaces the stored lists of the results' ids (of every id)
+    _, table, key, _, _ = KINDS[kind]
+    source = table.c[key.name]
+    if replace_all:
+        conn.execute(table.delete())
+    else:
+        ids = sorted(results)
+        for start in range(0, len(ids), WRITE_BATCH_SIZE):
+            conn.execute(table.delete().where(source.in_(ids[start:start + WRITE_BATCH_SIZE])))
+    rows = [{key.name: id, 'rank': rank, 'similar_id': similar_id, 'score': score, 'shared': shared}
+            for id, similar in results.items()
+            for rank, (similar_id, score, shared) in enumerate(similar)]
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        conn.execute(table.insert(), rows[start:start + WRITE_BATCH_SIZE])
+
+
+def build(conn, kind, k, genre_weight):
+    # every list of one kind, returns the number of lists
+    import numpy as np
+    matrices = Matrices(conn, kind)
+    results = top_similar(matrices, np.arange(len(matrices.ids)), k, genre_weight)
+    store(conn, kind, results, replace_all=True)
+    return len(results)
+
+
+def changed_ids(conn, kind, since):
+    # the entities written since, or with a show written since
+    model, _, key, _, _ = KINDS[kind]
+    ids = {id for id, in conn.execute(select([model.id]).where(model.updated_at > since))}
+    ids.update(id for id, in conn.execute(select([key]).where(Show.updated_at > since).distinct()))
+    return ids
+
+
+def stale_ids(conn, kind, matrices, changed, k, genre_weight):
+    # the entities whose list a changed entity is in, or would now enter
+    import numpy as np
+    _, table, key, _, _ = KINDS[kind]
+    source = table.c[key.name]
+    changed = sorted(changed)
+    stale = set()
+    for start in range(0, len(changed), WRITE_BATCH_SIZE):
+        stale.update(id for id, in conn.execute(select([source]).where(
+            table.c.similar_id.in_(changed[start:start + WRITE_BATCH_SIZE])).distinct()))
+
+    # the score of the last entry of every list, 0 for a list not full
+    threshold = np.zeros(len(matrices.ids))
+    lists = np.array(fetch_tuples(conn, select([source, func.count(), func.min(table.c.score)])
+                                  .group_by(source)), dtype=np.float64).reshape(-1, 3)
+    lists = lists[(lists[:, 1] >= k) & np.isin(lists[:, 0].astype(np.int64), matrices.ids)]
+    # rows() sorts the ids
+    threshold[matrices.rows(lists[:, 0])] = lists[np.argsort(lists[:, 0]), 2]
+    best = np.zeros(len(matrices.ids))
+    for _, scores, _ in matrices.blocks(matrices.rows(changed), genre_weight):
+        best = np.maximum(best, scores.max(axis=0))
+    # a tie with the last entry may win on the id
+    stale.update(int(id) for id in matrices.ids[(best > 0) & (best >= threshold - SCORE_TOLERANCE)])
+    return stale
+
+
+def refresh(conn, kind, since, k, genre_weight):
+    # the lists of one kind the writes since can change, returns their ids
+    matrices = Matrices(conn, kind)
+    changed = changed_ids(conn, kind, since)
+    if not changed:
+        return set()
+    dirty = changed | stale_ids(conn, kind, matrices, changed, k, genre_weight)
+    results = top_similar(matrices, matrices.rows(dirty), k, genre_weight)
+    # entities deleted since have no row, their lists went with them
+    store(conn, kind, results)
+    return set(results)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def job_options():
+    config = current_app.config
+    return config['RECOMMENDATIONS_TOP_K'], config['RECOMMENDATIONS_GENRE_WEIGHT']
+
+
+@click.group('recommendations')
+def recommendations_command():
+    """Similar venues and artists of the detail pages."""
+
+
+@recommendations_command.command('build')
+@with_appcontext
+def build_command():
+    """Recompute every list.
+
+    Run it nightly or so: deleted shows are only accounted for here.
+    """
+    k, genre_weight = job_options()
+    started = datetime.utcnow()
+    with db.engine.begin() as conn:
+        for kind in KINDS:
+            click.echo('{} {} lists'.format(build(conn, kind, k, genre_weight), kind))
+        set_watermark(conn, started, name=JOB_NAME)
+    # the cached detail pages catch up within CACHE_DEFAULT_TTL
+
+
+@recommendations_command.command('refresh')
+@with_appcontext
+def refresh_command():
+    """Recompute the lists changed shows, venues and artists affect.
+
+    Run it periodically, e.g. from cron every few minutes, unless the
+    job queue runs it after new shows; the first run builds every list.
+    """
+    results = refresh_all()
+    for kind, ids in results.items():
+        if ids is None:
+            click.echo('every {} list built'.format(kind))
+        else:
+            click.echo('{} {} lists refreshed'.format(len(ids), kind))
+    cache.invalidate(*refreshed_tags(results))
+
+
+def refresh_all():
+    # {kind: ids of the refreshed lists, None when every list was built}
+    k, genre_weight = job_options()
+    overlap = timedelta(seconds=current_app.config['RECOMMENDATIONS_REFRESH_OVERLAP'])
+    started = datetime.utcnow()
+    results = {}
+    with db.engine.begin() as conn:
+        watermark = get_watermark(conn, for_update=True, name=JOB_NAME)
+        for kind in KINDS:
+            if watermark is None:
+                build(conn, kind, k, genre_weight)
+                results[kind] = None
+                continue
+            # rows written by transactions still open at the last run carry
+            # an earlier updated_at, the overlap reads them again
+            results[kind] = refresh(conn, kind, watermark - overlap, k, genre_weight)
+        set_watermark(conn, started, name=JOB_NAME)
+    return results
+
+
+def refreshed_tags(results):
+    # the cache tags of the refreshed lists' pages
+    return ['{}:{}'.format(kind, id) for kind, ids in results.items() for id in ids or ()]
@@ -0,0 +1,66 @@
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+def use_replica():
+    # reads go to a replica for the endpoints in DB_REPLICA_ENDPOINTS,
+    # unless this client wrote less than DB_READ_YOUR_WRITES seconds ago
+    if not has_request_context() or request.endpoint not in current_app.config['DB_REPLICA_ENDPOINTS']:
+        return False
+    return time.time() >= session.get('_db_primary_until', 0)
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        # flushes always go to the primary
+        replicas = current_app.extensions.get('db_replicas')
+        if replicas and not self._flushing and use_replica():
+            if '_db_replica' not in g:
+                # one replica for the whole request, reads stay consistent
+                g._db_replica = random.choice(replicas)
+            return g._db_replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+def mark_write(session, flush_context):
+    if has_request_context():
+        g._db_wrote = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    # db.session routes reads to DB_REPLICA_URLS, see RoutingSession
+
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        event.listen(factory, 'after_flush', mark_write)
+        return factory
+
+    def init_app(self, app):
+        app.config.setdefault('DB_REPLICA_URLS', [])
+        app.config.setdefault('DB_REPLICA_ENDPOINTS', ())
+        app.config.setdefault('DB_READ_YOUR_WRITES', 5)
+        SQLAlchemy.init_app(self, app)
+
+        primary = app.config['SQLALCHEMY_DATABASE_URI']
+        replicas = []
+        for url in app.config['DB_REPLICA_URLS']:
+            # the pool options only apply to the primary's dialect
+            same_dialect = url.split(':')[0] == primary.split(':')[0]
+            options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}) if same_dialect else {}
+            replicas.append(create_engine(url, **options))
+        app.extensions['db_replicas'] = replicas
+        app.after_request(self._read_your_writes)
+
+    @staticmethod
+    def _read_your_writes(response):
+        if g.get('_db_wrote') and current_app.extensions.get('db_replicas'):
+            session['_db_primary_until'] = time.time() + current_app.config['DB_READ_YOUR_WRITES']
+        return response
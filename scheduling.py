@@ -0,0 +1,195 @@
+import bisect
+from datetime import datetime, timedelta
+
+import click
+import dateutil.parser
+from flask.cli import with_appcontext
+from sqlalchemy import and_, func, select
+
+from models import db, Artist, Show, Venue, DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#----------------------------------------------------------------------------#
+
+# a show books its venue and its artist from start_time to end_time, and
+# two bookings of the same venue or artist must not overlap. on Postgres
+# the exclusion constraints of the Show table enforce it; the checks below
+# come first on every database, so that a conflict is reported with the
+# show it overlaps rather than as an integrity error.
+#
+# the bookings already stored may overlap (SQLite has no constraint), so a
+# booking overlaps [start, end) when it starts before end and ends after
+# start, whichever started last. on Postgres the GiST index of the
+# exclusion constraint finds it; elsewhere no booking is longer than
+# MAX_SHOW_DURATION, which bounds the range of the (venue_id, start_time)
+# index to read. in memory it is a binary search on the starts and the
+# latest end among the bookings starting before end.
+
+# (kind, Show column of the booked venue or artist)
+BOOKED = (('venue', Show.venue_id), ('artist', Show.artist_id))
+
+
+def show_end_time(start_time, duration=None):
+    # duration in minutes, the default duration without one
+    duration = timedelta(minutes=duration) if duration else DEFAULT_SHOW_DURATION
+    return start_time + duration
+
+
+class Conflict(object):
+
+    def __init__(self, kind, key, show_id, start_time, end_time):
+        self.kind = kind
+        self.key = key
+        self.show_id = show_id
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def __str__(self):
+        message = 'the {} is booked from {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M}'.format(
+            self.kind, self.start_time, self.end_time)
+        if self.show_id is not None:
+            message += ' (show {})'.format(self.show_id)
+        return message
+
+
+def lock_bookings(conn, venue_id, artist_id):
+    # locks the rows of the venue and the artist until the transaction ends,
+    # so that two requests booking either cannot both find the slot free.
+    # always venue first, then artist. SQLite has no row locks, FOR UPDATE
+    # is left out there.
+    for model, key in ((Venue, venue_id), (Artist, artist_id)):
+        conn.execute(select([model.id]).where(model.id == key).with_for_update())
+
+
+def find_conflict(conn, venue_id, artist_id, start_time, end_time, exclude_id=None):
+    # the first booking of the venue or the artist overlapping [start_time,
+    # end_time) as a Conflict, or None. conn is a connection or a session.
+    for kind, column in BOOKED:
+        key = venue_id if kind == 'venue' else artist_id
+        if db.engine.dialect.name == 'postgresql':
+            overlaps = func.tsrange(Show.start_time, Show.end_time).op('&&')(func.tsrange(start_time, end_time))
+        else:
+            overlaps = and_(Show.start_time < end_time, Show.start_time > start_time - MAX_SHOW_DURATION,
+                            Show.end_time > start_time)
+        query = select([Show.id, Show.start_time, Show.end_time]).where(and_(column == key, overlaps))
+        if exclude_id is not None:
+            query = query.where(Show.id != exclude_id)
+        row = conn.execute(query.order_by(Show.start_time, Show.id).limit(1)).first()
+        if row is not None:
+            return Conflict(kind, key, row.id, row.start_time, row.end_time)
+    return None
+
+
+class IntervalIndex(object):
+    # the bookings of each (kind, key), sorted by start, and for each
+    # position the booking ending last up to it. a key is loaded with
+    # load(kind, key) the first time it is looked up, then bookings are
+    # added as they are accepted.
+
+    def __init__(self, load=None):
+        self.load = load
+        self.starts = {}
+        self.latest = {}
+
+    def _get(self, kind, key):
+        if (kind, key) not in self.starts:
+            bookings = sorted(self.load(kind, key)) if self.load else []
+            latest = []
+            for booking in bookings:
+                latest.append(booking if not latest or booking[1] > latest[-1][1] else latest[-1])
+            self.starts[(kind, key)] = [booking[0] for booking in bookings]
+            self.latest[(kind, key)] = latest
+        return self.starts[(kind, key)], self.latest[(kind, key)]
+
+    def find(self, kind, key, start_time, end_time):
+        # the overlapping booking ending last as a Conflict, or None
+        starts, latest = self._get(kind, key)
+        i = bisect.bisect_left(starts, end_time)
+        if i and latest[i - 1][1] > start_time:
+            booked_start, booked_end, show_id = latest[i - 1]
+            return Conflict(kind, key, show_id, booked_start, booked_end)
+        return None
+
+    def add(self, kind, key, start_time, end_time, show_id=None):
+        starts, latest = self._get(kind, key)
+        booking = (start_time, end_time, show_id)
+        i = bisect.bisect_right(starts, start_time)
+        starts.insert(i, start_time)
+        latest.insert(i, booking if not i or end_time > latest[i - 1][1] else latest[i - 1])
+        # the later positions ending before it now end with it
+        for j in range(i + 1, len(latest)):
+            if latest[j][1] >= end_time:
+                break
+            latest[j] = booking
+
+    def book(self, venue_id, artist_id, start_time, end_time, show_id=None):
+        # adds the show unless it overlaps a booking of its venue or artist,
+        # returns the Conflict then
+        for kind, key in (('venue', venue_id), ('artist', artist_id)):
+            conflict = self.find(kind, key, start_time, end_time)
+            if conflict:
+                return conflict
+        self.add('venue', venue_id, start_time, end_time, show_id)
+        self.add('artist', artist_id, start_time, end_time, show_id)
+        return None
+
+
+def load_bookings(conn):
+    # an IntervalIndex loader reading the bookings of one venue or artist
+    columns = dict(BOOKED)
+
+    def load(kind, key):
+        return [tuple(row) for row in conn.execute(
+            select([Show.start_time, Show.end_time, Show.id]).where(columns[kind] == key))]
+    return load
+
+
+def find_conflicts(conn, since=None):
+    # every show overlapping an earlier booking of its venue or artist, as
+    # (kind, key, earlier show id, show id, overlap start, overlap end). one
+    # ordered pass over the shows per kind: a show conflicts when it starts
+    # before the latest end seen so far for its venue or artist.
+    for kind, column in BOOKED:
+        query = select([column, Show.id, Show.start_time, Show.end_time])
+        if since:
+            query = query.where(Show.end_time > since)
+        current, latest = None, None
+        rows = conn.execution_options(stream_results=True).execute(
+            query.order_by(column, Show.start_time, Show.id))
+        for key, show_id, start_time, end_time in rows:
+            if key != current:
+                current, latest = key, None
+            elif start_time < latest[1]:
+                yield kind, key, latest[0], show_id, start_time, min(end_time, latest[1])
+            if latest is None or end_time > latest[1]:
+                latest = (show_id, end_time)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.group('shows')
+def shows_command():
+    """Show scheduling."""
+
+
+@shows_command.command('conflicts')
+@click.option('--since', help='Only bookings ending after this time, e.g. now.')
+@with_appcontext
+def conflicts_command(since):
+    """Report overlapping bookings of a venue or an artist, exits with 1 if any."""
+    if since == 'now':
+        since = datetime.now()
+    elif since:
+        since = dateutil.parser.parse(since)
+    count = 0
+    with db.engine.connect() as conn:
+        for kind, key, earlier_id, show_id, start_time, end_time in find_conflicts(conn, since):
+            count += 1
+            click.echo('{} {}: show {} overlaps show {} from {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M}'.format(
+                kind, key, show_id, earlier_id, start_time, end_time))
+    if not count:
+        click.echo('no conflicts')
+    else:
+        raise click.exceptions.Exit(1)
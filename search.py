@@ -0,0 +1,91 @@
+from flask import current_app
+from sqlalchemy import case, func, or_, select, union
+from models import db, Genre, Venue, Artist, artist_genres, venue_genres
+from queries import has_genre
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# the first column is the name, it weighs more than the others when ranking.
+# every column here, and Genre.name, has a trigram GIN index on Postgres
+# (see migrations).
+SEARCH_FIELDS = {
+    Venue: (Venue.name, Venue.city, Venue.state),
+    Artist: (Artist.name, Artist.city, Artist.state),
+}
+
+# the association table column linking a genre to each model
+GENRE_KEYS = {
+    Venue: venue_genres.c.venue_id,
+    Artist: artist_genres.c.artist_id,
+}
+
+NAME_WEIGHT = 2
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _postgres_rank(columns, term):
+    name, *others = columns
+    return func.word_similarity(term, func.coalesce(name, '')) * NAME_WEIGHT + \
+        func.greatest(*[func.word_similarity(term, func.coalesce(column, '')) for column in others])
+
+
+def _fallback_rank(columns, term):
+    # sqlite has no trigram support: exact name, name prefix, name substring
+    # and then any other field.
+    name = columns[0]
+    escaped = escape_like(term)
+    return case([
+        (func.lower(name) == term.lower(), 4),
+        (name.ilike(escaped + '%', escape='\\'), 3),
+        (name.ilike('%' + escaped + '%', escape='\\'), 2),
+    ], else_=1)
+
+
+def matching_ids(model, pattern):
+    # ids matching the pattern on a field or on a genre name. a UNION rather
+    # than an EXISTS OR-ed with the fields: Postgres runs a correlated EXISTS
+    # inside an OR as a filter on every row, which rules out combining the
+    # trigram indexes of the fields; each side of the UNION uses its own.
+    key = GENRE_KEYS[model]
+    by_field = select([model.id]).where(
+        or_(*[column.ilike(pattern, escape='\\') for column in SEARCH_FIELDS[model]]))
+    by_genre = select([key]).select_from(key.table.join(Genre, Genre.id == key.table.c.genre_id)).\
+        where(Genre.name.ilike(pattern, escape='\\'))
+    return union(by_field, by_genre)
+
+
+def search(model, term, limit=None, genre=None):
+    # returns (id, name, upcoming_shows_count) rows matching the term on
+    # any of the indexed fields or on a genre name, best matches first.
+    # genre restricts the results to one genre.
+    columns = SEARCH_FIELDS[model]
+    term = (term or '').strip()
+    limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 50)
+
+    query = db.session.query(model.id, model.name, model.upcoming_shows_count)
+    if genre:
+        query = query.filter(has_genre(model, genre))
+    if term:
+        pattern = '%{}%'.format(escape_like(term))
+        query = query.filter(model.id.in_(matching_ids(model, pattern)))
+        if db.engine.dialect.name == 'postgresql':
+            rank = _postgres_rank(columns, term)
+        else:
+            rank = _fallback_rank(columns, term)
+        query = query.order_by(rank.desc(), model.name, model.id)
+    else:
+        query = query.order_by(model.name, model.id)
+    return query.limit(limit).all()
+
+
+def search_venues(term, limit=None, genre=None):
+    return search(Venue, term, limit, genre)
+
+
+def search_artists(term, limit=None, genre=None):
+    return search(Artist, term, limit, genre)
@@ -0,0 +1,93 @@
+import hashlib
+import json
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import cache
+from jobs import enqueue, task
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Follow-up work of the write handlers.
+#----------------------------------------------------------------------------#
+
+# a write bumps the cache tags of the pages it changes directly (e.g. its
+# venue's page and the listings) as its transaction commits, so the page the
+# user is redirected to is fresh. the pages it changes through shows (the
+# pages of the artists that played at an edited venue) take a query and a
+# bump each, that fan-out is left to a 'cache.invalidate' job, or done in
+# the request with JOBS_INLINE.
+
+
+def related_tags(venues=(), artists=()):
+    # the cached pages showing the venues and artists through their shows:
+    # those of the artists that played at the venues and of the venues the
+    # artists played at
+    tags = []
+    if venues:
+        rows = db.session.query(Show.artist_id).filter(Show.venue_id.in_(venues)).distinct()
+        tags += ['artist:{}'.format(artist_id) for artist_id, in rows]
+    if artists:
+        rows = db.session.query(Show.venue_id).filter(Show.artist_id.in_(artists)).distinct()
+        tags += ['venue:{}'.format(venue_id) for venue_id, in rows]
+    return tags
+
+
+def invalidate_on_commit(*tags, session=None):
+    # bumps the tags once the session's transaction commits, not at all if
+    # it rolls back
+    session = session or db.session
+    session.info.setdefault('cache_tags', set()).update(tags)
+
+
+def payload_key(name, payload):
+    # an idempotency key: the same job queued twice is run once
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return '{}:{}'.format(name, digest)
+
+
+def invalidate_later(tags=(), venues=(), artists=(), session=None):
+    # bumps the tags and the related tags of the venues and artists after
+    # the commit, from a job unless JOBS_INLINE
+    if current_app.config['JOBS_INLINE']:
+        invalidate_on_commit(*tags, *related_tags(venues, artists), session=session)
+        return
+    payload = {'tags': sorted(set(tags)), 'venues': sorted(set(venues)), 'artists': sorted(set(artists))}
+    enqueue('cache.invalidate', payload, key=payload_key('cache.invalidate', payload), session=session)
+
+
+def refresh_recommendations_later(session=None):
+    # one refresh for the shows written within RECOMMENDATIONS_REFRESH_DELAY,
+    # unless refreshes are left to cron (no delay configured)
+    delay = current_app.config['RECOMMENDATIONS_REFRESH_DELAY']
+    if delay is not None:
+        enqueue('recommendations.refresh', key='recommendations.refresh', delay=delay, session=session)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        cache.invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_rolled_back(session):
+    session.info.pop('cache_tags', None)
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+
+@task('cache.invalidate')
+def invalidate_task(tags=(), venues=(), artists=()):
+    cache.invalidate(*tags, *related_tags(venues, artists))
+
+
+@task('recommendations.refresh')
+def refresh_recommendations_task():
+    # NumPy and SciPy are only needed by the workers
+    from recommendations import refresh_all, refreshed_tags
+    cache.invalidate(*refreshed_tags(refresh_all()))
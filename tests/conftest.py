@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import event
+
+import config
+from app import create_app
+from models import db
+
+
+def make_config(database_url, **settings):
+    # config.py against a throwaway SQLite database, without the page cache
+    # or CSRF; settings override the rest
+    values = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    values.update(
+        SQLALCHEMY_DATABASE_URI=database_url,
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        SQLALCHEMY_CLI_ENGINE_OPTIONS={},
+        DB_REPLICA_URLS=[],
+        CACHE_TYPE='null',
+        SQL_PROFILER=False,
+        GAZETTEER_PATH=None,
+        WTF_CSRF_ENABLED=False,
+        TESTING=True,
+    )
+    values.update(settings)
+    return type('TestConfig', (object,), values)
+
+
+class QueryCounter(object):
+    # counts the statements run on one engine
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.incr)
+
+    def incr(self, *args):
+        self.count += 1
+
+    def close(self):
+        event.remove(self.engine, 'before_cursor_execute', self.incr)
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return 'sqlite:///{}'.format(tmp_path / 'fyyur.db')
+
+
+@pytest.fixture
+def app(database_url):
+    app = create_app(make_config(database_url))
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    counter = QueryCounter(db.engine)
+    yield counter
+    counter.close()
@@ -0,0 +1,34 @@
+import pytest
+
+from benchmarks.datagen import seed
+from models import db, Venue
+
+
+@pytest.fixture
+def catalog(app):
+    seed(db.engine, 10, 10, 40)
+
+
+def test_matching_etag_is_not_modified(catalog, client):
+    response = client.get('/api/v1/venues')
+    assert response.status_code == 200
+    again = client.get('/api/v1/venues', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_delete_is_not_hidden_by_if_modified_since(catalog, client):
+    response = client.get('/api/v1/venues')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    # the latest updated_at stays, only the count goes down
+    latest = Venue.query.order_by(Venue.updated_at.desc()).first()
+    db.session.delete(Venue.query.filter(Venue.id != latest.id).first())
+    db.session.commit()
+
+    after = client.get('/api/v1/venues', headers={'If-Modified-Since': last_modified})
+    assert after.status_code == 200
+    assert after.headers['Last-Modified'] == last_modified
+    after = client.get('/api/v1/venues', headers={'If-None-Match': etag,
+                                                 'If-Modified-Since': last_modified})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != etag
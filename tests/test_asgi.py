@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip('asyncpg')
+pytest.importorskip('starlette')
+
+from starlette.responses import PlainTextResponse
+from starlette.testclient import TestClient
+
+import asgi
+
+
+@pytest.fixture
+def handed_over(monkeypatch):
+    # the requests the async views hand over to Flask
+    requests = []
+
+    async def wsgi_app(scope, receive, send):
+        requests.append((scope['method'], scope['path']))
+        await PlainTextResponse('flask')(scope, receive, send)
+
+    monkeypatch.setattr(asgi, 'wsgi_app', wsgi_app)
+    return requests
+
+
+@pytest.mark.parametrize('method, path', [
+    ('DELETE', '/venues/1'),
+    ('POST', '/venues/1'),
+    ('PUT', '/artists/1'),
+    ('POST', '/venues'),
+])
+def test_writes_reach_flask(handed_over, method, path):
+    response = TestClient(asgi.app).request(method, path)
+    assert response.text == 'flask'
+    assert handed_over == [(method, path)]
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from app import create_app
+from benchmarks.datagen import seed
+from cache import cache, SimpleCache
+from models import db, Show, Venue
+from tests.conftest import make_config
+
+
+@pytest.fixture
+def app(database_url):
+    app = create_app(make_config(database_url, CACHE_TYPE='simple'))
+    with app.app_context():
+        db.create_all()
+        seed(db.engine, 10, 20, 200)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def cached(app, path):
+    # whether GET path was served from the cache; a fresh client each time,
+    # pages are not cached while a flashed message is pending
+    hits = cache.stats()['total']['hits']
+    response = app.test_client().get(path)
+    assert response.status_code == 200
+    response.get_data()
+    return cache.stats()['total']['hits'] > hits
+
+
+def test_venue_edit_invalidates_its_pages(app):
+    related = Show.query.filter_by(venue_id=1).first().artist_id
+    unrelated = Show.query.filter(~Show.artist_id.in_(
+        db.session.query(Show.artist_id).filter_by(venue_id=1))).first().artist_id
+    pages = ['/venues', '/venues/1', '/artists/{}'.format(related), '/shows']
+    untouched = ['/artists', '/artists/{}'.format(unrelated)]
+    for path in pages + untouched:
+        cached(app, path)
+    assert all(cached(app, path) for path in pages + untouched)
+
+    venue = Venue.query.get(1)
+    response = app.test_client().post('/venues/1/edit', data={
+        'name': 'Renamed Hall', 'city': venue.city, 'state': venue.state, 'genres': 'Jazz'})
+    assert response.status_code < 400
+    db.session.remove()
+
+    assert not any(cached(app, path) for path in pages)
+    assert all(cached(app, path) for path in untouched)
+    assert b'Renamed Hall' in app.test_client().get('/venues/1').data
+
+
+def test_healthz_counts_hits_and_misses(app):
+    # the counters are kept per process, across apps
+    before = app.test_client().get('/healthz/cache').get_json().get('venues', {'hits': 0, 'misses': 0})
+    cached(app, '/venues')
+    cached(app, '/venues')
+    after = app.test_client().get('/healthz/cache').get_json()['venues']
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (1, 1)
+
+
+def test_flask_pages_are_shared_with_the_async_views(app):
+    pytest.importorskip('asyncpg')
+    pytest.importorskip('starlette')
+    from starlette.testclient import TestClient
+    import asgi
+
+    html = app.test_client().get('/venues/1').get_data()
+    # a miss would query the async pool, which is not connected
+    assert TestClient(asgi.app).get('/venues/1').content == html
+
+
+def test_lru_evicts_the_least_recently_used():
+    backend = SimpleCache(max_entries=2)
+    backend.set('a', 1, 60)
+    backend.set('b', 2, 60)
+    assert backend.get('a') == 1
+    backend.set('c', 3, 60)
+    assert (backend.get('a'), backend.get('b'), backend.get('c')) == (1, None, 3)
+
+
+def test_entries_expire(monkeypatch):
+    backend = SimpleCache()
+    backend.set('a', 1, 60)
+    now = time.monotonic()
+    monkeypatch.setattr('cache.time.monotonic', lambda: now + 61)
+    assert backend.get('a') is None
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from benchmarks.datagen import seed
+from cache import cache
+from models import db, Show
+from queries import get_calendar, iter_buckets, truncate
+from tests.conftest import make_config
+
+NOW = datetime.now()
+
+
+@pytest.fixture
+def app(database_url):
+    app = create_app(make_config(database_url, CACHE_TYPE='simple'))
+    with app.app_context():
+        db.create_all()
+        seed(db.engine, 5, 10, 300)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def brute_force(bucket, start, end, venue_id=None, artist_id=None):
+    # [(bucket start, shows, venues, artists)] counted in Python
+    shows, venues, artists = defaultdict(int), defaultdict(set), defaultdict(set)
+    for show in Show.query:
+        if not start <= show.start_time < end or \
+                venue_id not in (None, show.venue_id) or artist_id not in (None, show.artist_id):
+            continue
+        key = truncate(show.start_time, bucket)
+        shows[key] += 1
+        venues[key].add(show.venue_id)
+        artists[key].add(show.artist_id)
+    return [(key, shows[key], len(venues[key]), len(artists[key]))
+            for key in iter_buckets(start, end, bucket)]
+
+
+def counted(buckets):
+    return [(b['start'], b['num_shows'], b['num_venues'], b['num_artists']) for b in buckets]
+
+
+@pytest.mark.parametrize('bucket', ['day', 'week', 'month'])
+@pytest.mark.parametrize('filters', [{}, {'venue_id': 1}, {'artist_id': 2}])
+def test_buckets_match_brute_force(app, bucket, filters):
+    # ranges past, current and future, twice so the cached past is read back
+    total = 0
+    for start, spans in ((NOW - timedelta(days=400), 40), (NOW - timedelta(days=60), 20),
+                         (NOW + timedelta(days=3), 10)):
+        start = truncate(start, bucket)
+        end = start
+        for _ in range(spans if bucket != 'day' else spans * 3):
+            end = end + timedelta(days=1) if bucket == 'day' else end + timedelta(days=31)
+        end = truncate(end, bucket)
+        expected = brute_force(bucket, start, end, **filters)
+        for _ in range(2):
+            assert counted(get_calendar(bucket, start, end, now=NOW, past_ttl=60, **filters)) == expected
+        total += sum(count for _, count, _, _ in expected)
+    assert total > 0
+
+
+def test_past_show_invalidates_the_cached_buckets(app, client):
+    start, end = truncate(NOW - timedelta(days=90), 'month'), truncate(NOW, 'month')
+    before = counted(get_calendar('month', start, end, now=NOW, past_ttl=60))
+    day = NOW - timedelta(days=40)
+    # written behind the cache's back: the cached counts are still served
+    db.session.add(Show(venue_id=1, artist_id=1, start_time=datetime(day.year, day.month, day.day, 9),
+                        end_time=datetime(day.year, day.month, day.day, 10)))
+    db.session.commit()
+    assert counted(get_calendar('month', start, end, now=NOW, past_ttl=60)) == before
+    # listed through the form, which invalidates them
+    response = client.post('/shows/create', data={
+        'venue_id': 2, 'artist_id': 2,
+        'start_time': datetime(day.year, day.month, day.day, 6).isoformat(' '), 'duration': '60'})
+    assert b'Show was successfully listed' in response.data
+    after = counted(get_calendar('month', start, end, now=NOW, past_ttl=60))
+    assert after == brute_force('month', start, end)
+    assert sum(b[1] for b in after) == sum(b[1] for b in before) + 2
+
+
+def test_long_past_ttl_needs_the_shared_cache(database_url):
+    with pytest.raises(ValueError):
+        create_app(make_config(database_url, CACHE_TYPE='simple', CALENDAR_PAST_TTL=24 * 3600))
+    app = create_app(make_config(database_url, CACHE_TYPE='simple', CALENDAR_PAST_TTL=60))
+    assert app.extensions['cache'] is cache
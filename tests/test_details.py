@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+
+from benchmarks.datagen import seed
+from models import db, Artist, Show, Venue
+from queries import get_past_and_upcoming_shows
+
+
+@pytest.fixture
+def catalog(app):
+    seed(db.engine, 20, 40, 600)
+
+
+@pytest.mark.parametrize('past_limit', [None, 0, 1, 5, 1000])
+def test_past_shows_are_limited_and_counted(catalog, past_limit):
+    now = datetime.now()
+    for counterpart, key, model in ((Artist, Show.venue_id, Venue), (Venue, Show.artist_id, Artist)):
+        entity_id = 1
+        shows = Show.query.filter(key == entity_id).order_by(Show.start_time, Show.id).all()
+        expected_past = [show.id for show in reversed(shows) if show.start_time < now]
+        expected_upcoming = [show.id for show in shows if show.start_time >= now]
+
+        past, upcoming, past_count = get_past_and_upcoming_shows(
+            counterpart, key, entity_id, now, past_limit)
+        assert past_count == len(expected_past)
+        assert [show.id for _, show in past] == expected_past[:past_limit]
+        assert [show.id for _, show in upcoming] == expected_upcoming
+        assert all(isinstance(entity, counterpart) for entity, _ in past + upcoming)
+
+
+def test_venue_page_renders_the_past_limit(catalog, client):
+    response = client.get('/venues/1?past_limit=3')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('past_limit', [None, 0, 3])
+def test_shows_are_loaded_in_one_query(catalog, queries, past_limit):
+    queries.count = 0
+    get_past_and_upcoming_shows(Artist, Show.venue_id, 1, datetime.now(), past_limit)
+    assert queries.count == 1
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from app import create_app
+from cache import cache
+from geo import distance, encode, geocode_command, get_nearby_venues
+from models import db, Venue
+from tests.conftest import make_config
+from tests.test_cache import cached
+
+# clusters of venues: anywhere, around both poles, across the antimeridian
+CENTERS = [(40.7, -74.0), (-33.9, 151.2), (89.6, 0.0), (-89.8, 120.0),
+           (12.0, 179.9), (-41.0, -179.8), (65.0, 180.0)]
+
+
+def scatter(rng, latitude, longitude, spread):
+    latitude = max(-90.0, min(90.0, latitude + rng.gauss(0, spread)))
+    if abs(latitude) > 88:
+        longitude = rng.uniform(-180, 180)
+    else:
+        longitude = (longitude + rng.gauss(0, spread) + 180) % 360 - 180
+    return latitude, longitude
+
+
+def brute_force(latitude, longitude, radius, limit):
+    found = sorted((distance(latitude, longitude, venue.latitude, venue.longitude), venue.id)
+                   for venue in Venue.query if venue.geohash is not None)
+    return [venue_id for km, venue_id in found if km <= radius][:limit]
+
+
+@pytest.fixture
+def venues(app):
+    rng = random.Random(3)
+    rows = [{'id': 1, 'name': 'Unlocated'}]
+    for latitude, longitude in CENTERS:
+        for spread in (0.05, 1.0, 4.0):
+            for _ in range(40):
+                point = scatter(rng, latitude, longitude, spread)
+                rows.append({'id': len(rows) + 1, 'name': 'Venue', 'latitude': point[0],
+                             'longitude': point[1], 'geohash': encode(*point)})
+    db.session.execute(Venue.__table__.insert(), rows)
+    db.session.commit()
+    return rng
+
+
+def test_nearby_venues_match_brute_force(venues):
+    rng = venues
+    for _ in range(200):
+        center = rng.choice(CENTERS)
+        latitude, longitude = scatter(rng, center[0], center[1], rng.choice((0.01, 0.5, 3.0)))
+        radius = rng.choice((0.5, 5, 25, 100, 500)) * rng.uniform(0.5, 1)
+        limit = rng.choice((1, 5, 20, 100))
+        found = get_nearby_venues(latitude, longitude, radius, limit)
+        assert [venue['id'] for venue in found] == brute_force(latitude, longitude, radius, limit)
+
+
+@pytest.mark.parametrize('latitude, longitude', [(90.0, 0.0), (-90.0, 0.0), (12.0, 180.0), (12.0, -180.0)])
+def test_nearby_venues_at_the_edges_of_the_map(venues, latitude, longitude):
+    for radius in (10, 100, 500):
+        found = get_nearby_venues(latitude, longitude, radius, 100)
+        assert [venue['id'] for venue in found] == brute_force(latitude, longitude, radius, 100)
+
+
+@pytest.fixture
+def cached_app(database_url):
+    app = create_app(make_config(database_url, CACHE_TYPE='simple'))
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Venue(name='Moving', city='Springfield', state='IL'),
+                            Venue(name='Staying', city='Chicago', state='IL', latitude=41.88,
+                                  longitude=-87.63, geohash=encode(41.88, -87.63))])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_geocode_invalidates_the_pages_of_the_venues_it_moves(cached_app, tmp_path):
+    gazetteer = tmp_path / 'places.csv'
+    gazetteer.write_text('city,state,latitude,longitude\n'
+                         'Springfield,IL,39.80,-89.64\nChicago,IL,41.88,-87.63\n')
+    for path in ('/venues/1', '/venues/2'):
+        cached(cached_app, path)
+    result = cached_app.test_cli_runner().invoke(geocode_command, ['--gazetteer', str(gazetteer), '--all'])
+    assert result.exit_code == 0, result.output
+    assert '2 venues located' in result.output
+    assert not cached(cached_app, '/venues/1')
+    assert cached(cached_app, '/venues/2')
+    db.session.expire_all()
+    assert Venue.query.get(1).geohash == encode(39.80, -89.64)
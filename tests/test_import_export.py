@@ -0,0 +1,115 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from benchmarks.datagen import seed
+from exporter import iter_export, parse_since
+from importer import Importer, read_rows
+from models import db, Artist, Show, Venue, import_ids
+from tests.conftest import make_config
+
+KINDS = ('venues', 'artists', 'shows')
+
+
+def catalog(model):
+    # what an import must reproduce, without the ids it renumbers
+    if model is Show:
+        return sorted((show.venue.name, show.artist.name, show.start_time, show.end_time)
+                      for show in Show.query.all())
+    return sorted((entity.name, entity.city, entity.phone, tuple(sorted(genre.name for genre in entity.genres)))
+                  for entity in model.query.all())
+
+
+@pytest.mark.parametrize('format', ['jsonl', 'csv'])
+def test_export_then_import_round_trips(app, tmp_path, format):
+    seed(db.engine, 15, 20, 60)
+    # exported as ISO 8601 with microseconds
+    Show.query.first().start_time += timedelta(microseconds=250)
+    db.session.commit()
+    expected = {model: catalog(model) for model in (Venue, Artist, Show)}
+    for kind in KINDS:
+        with open(tmp_path / '{}.{}'.format(kind, format), 'wb') as f:
+            for chunk in iter_export(kind, format, batch_size=7):
+                f.write(chunk)
+    # the scoped session outlives the app context, not its identity map
+    db.session.remove()
+
+    target = create_app(make_config('sqlite:///{}'.format(tmp_path / 'target.db')))
+    with target.app_context():
+        db.create_all()
+        for kind in KINDS:
+            path = str(tmp_path / '{}.{}'.format(kind, format))
+            importer = Importer(kind, path, path + '.errors.jsonl', batch_size=10)
+            importer.load(resume=False)
+            importer.run(read_rows(path, format))
+            assert importer.state['rejected'] == 0, open(importer.errors_path).read()
+        for model in (Venue, Artist, Show):
+            assert catalog(model) == expected[model]
+        db.session.remove()
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    # a server clock far from UTC
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2020-06-01T12:00:00+02:00', datetime(2020, 6, 1, 10)),
+    ('2020-06-01T12:00:00Z', datetime(2020, 6, 1, 12)),
+    ('2020-06-01 12:00:00', datetime(2020, 6, 1, 12)),
+])
+def test_since_is_utc_whatever_the_server_timezone(local_timezone, value, expected):
+    assert parse_since(value) == expected
+
+
+def test_resume_after_a_failed_batch(app, tmp_path, monkeypatch):
+    # 25 venues in batches of 10, lines 3 and 15 invalid; the second batch
+    # fails once its rows are inserted
+    path = str(tmp_path / 'venues.jsonl')
+    with open(path, 'w') as f:
+        for number in range(1, 26):
+            row = {'id': 'v{}'.format(number), 'name': 'Venue {}'.format(number), 'city': 'Austin',
+                   'state': 'TX', 'address': '1 Main St', 'phone': '512-555-0100', 'genres': 'Jazz',
+                   'facebook_link': 'https://www.facebook.com/venue'}
+            if number in (3, 15):
+                row['name'] = ''
+            f.write(json.dumps(row) + '\n')
+
+    def run(resume):
+        importer = Importer('venues', path, path + '.errors.jsonl', batch_size=10)
+        importer.load(resume)
+        importer.run(read_rows(path, 'jsonl'))
+        return importer
+
+    save = Importer.save
+    calls = []
+
+    def failing_save(self, conn):
+        calls.append(self.state['line'])
+        if len(calls) == 2:
+            raise RuntimeError('crash')
+        save(self, conn)
+
+    monkeypatch.setattr(Importer, 'save', failing_save)
+    with pytest.raises(RuntimeError):
+        run(resume=False)
+    monkeypatch.setattr(Importer, 'save', save)
+    assert Venue.query.count() == 10
+
+    importer = run(resume=True)
+    assert sorted(venue.name for venue in Venue.query) == sorted(
+        'Venue {}'.format(number) for number in range(1, 26) if number not in (3, 15))
+    assert importer.state == {'line': 25, 'inserted': 23, 'rejected': 2}
+    with open(importer.errors_path) as f:
+        assert [json.loads(line)['line'] for line in f] == [3, 15]
+    ids = dict(db.session.query(import_ids.c.source_id, import_ids.c.id))
+    assert {Venue.query.get(id).name for id in ids.values()} == {venue.name for venue in Venue.query}
+    assert len(ids) == 23
@@ -0,0 +1,102 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from app import create_app
+from models import db, Artist, Job, Venue
+from tests.conftest import make_config
+
+START_TIME = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def make_app(database_url, **settings):
+    app = create_app(make_config(database_url, **settings))
+    with app.app_context():
+        db.create_all()
+        venue, artist = Venue(name='Hall'), Artist(name='Band')
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        db.session.remove()
+    return app
+
+
+def counts(model):
+    db.session.remove()
+    return model.query.with_entities(model.upcoming_shows_count, model.past_shows_count).one()
+
+
+def queued():
+    return sorted(task for task, in db.session.query(Job.task))
+
+
+def list_show(app):
+    response = app.test_client().post('/shows/create', data={
+        'venue_id': 1, 'artist_id': 1, 'start_time': START_TIME})
+    assert b'Show was successfully listed!' in response.data
+
+
+def test_simple_cache_needs_inline_jobs(database_url):
+    with pytest.raises(ValueError):
+        create_app(make_config(database_url, CACHE_TYPE='simple', JOBS_INLINE=False))
+
+
+def test_inline_counters(database_url):
+    app = make_app(database_url, JOBS_INLINE=True)
+    with app.app_context():
+        list_show(app)
+        assert counts(Venue) == (1, 0)
+        assert queued() == ['recommendations.refresh']
+        db.session.remove()
+
+
+def test_counters_are_left_to_a_job(database_url):
+    app = make_app(database_url, JOBS_INLINE=False)
+    with app.app_context():
+        list_show(app)
+        assert counts(Venue) == counts(Artist) == (0, 0)
+        assert queued() == ['counters.recount', 'recommendations.refresh']
+
+        jobs.work('test', 10, 0, once=True)
+        assert counts(Venue) == counts(Artist) == (1, 0)
+        db.session.remove()
+
+
+def test_deleted_venue_queues_its_artists(database_url):
+    # the venue's shows go with it (ON DELETE CASCADE, not enforced by
+    # SQLite here), its artists lose them
+    app = make_app(database_url, JOBS_INLINE=False)
+    with app.app_context():
+        list_show(app)
+        jobs.work('test', 10, 0, once=True)
+
+        app.test_client().delete('/venues/1')
+        job = Job.query.filter_by(task='counters.recount', status='queued').one()
+        assert json.loads(job.payload) == {'venues': [1], 'artists': [1]}
+        db.session.remove()
+
+
+def test_related_pages_are_invalidated_by_a_job(database_url):
+    app = make_app(database_url, JOBS_INLINE=False)
+    with app.app_context():
+        response = app.test_client().post('/venues/1/edit', data={'name': 'Hall', 'genres': 'Jazz'})
+        assert response.status_code < 400
+        assert 'cache.invalidate' in queued()
+        db.session.remove()
+
+
+def test_recount_job_changes_the_api_etag(database_url):
+    app = make_app(database_url, JOBS_INLINE=False)
+    with app.app_context():
+        list_show(app)
+        client = app.test_client()
+        before = client.get('/api/v1/venues')
+        assert before.get_json()['data'][0]['venues'][0]['num_upcoming_shows'] == 0
+
+        jobs.work('test', 10, 0, once=True)
+        after = client.get('/api/v1/venues', headers={'If-None-Match': before.headers['ETag']})
+        assert after.status_code == 200
+        assert after.headers['ETag'] != before.headers['ETag']
+        assert after.get_json()['data'][0]['venues'][0]['num_upcoming_shows'] == 1
+        db.session.remove()
@@ -0,0 +1,35 @@
+import pytest
+
+from app import create_app
+from models import db
+from profiler import QueryBudgetExceeded
+from tests.conftest import make_config
+
+
+@pytest.fixture
+def profiled_app(database_url):
+    def create(**settings):
+        app = create_app(make_config(database_url, SQL_PROFILER=True, **settings))
+        with app.app_context():
+            db.create_all()
+        return app
+    return create
+
+
+def test_queries_are_counted_once_with_several_apps(profiled_app):
+    for _ in range(3):
+        app = profiled_app()
+    response = app.test_client().get('/venues')
+    assert response.status_code == 200
+    assert response.headers['Server-Timing'].endswith('"1 queries"')
+
+
+def test_over_budget_raises_when_testing(profiled_app):
+    app = profiled_app(SQL_QUERY_BUDGETS={'pages.venues': 0})
+    with pytest.raises(QueryBudgetExceeded, match='pages.venues ran 1 queries, over its budget of 0'):
+        app.test_client().get('/venues')
+
+
+def test_within_budget_passes(profiled_app):
+    app = profiled_app(SQL_QUERY_BUDGETS={'pages.venues': 1})
+    assert app.test_client().get('/venues').status_code == 200
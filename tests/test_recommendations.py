@@ -0,0 +1,117 @@
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from sqlalchemy import select
+
+from models import db, Artist, Genre, Show, Venue, venue_genres, artist_similarities, venue_similarities
+from recommendations import build, refresh, refresh_command
+
+# the artists each venue booked once: venues 1 and 2 share three artists,
+# 1 and 3 two, 1 and 4 one, venue 5 none with the others
+BOOKINGS = {1: [1, 2, 3], 2: [1, 2, 3], 3: [1, 2], 4: [3], 5: [4, 5]}
+LONG_AGO = datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def bookings(app):
+    db.session.add_all([Venue(id=id, name='Venue {}'.format(id), updated_at=LONG_AGO) for id in range(1, 6)] +
+                       [Artist(id=id, name='Artist {}'.format(id), updated_at=LONG_AGO) for id in range(1, 6)])
+    db.session.flush()
+    day = datetime(2030, 1, 1, 20)
+    for venue_id, artist_ids in BOOKINGS.items():
+        for artist_id in artist_ids:
+            day += timedelta(days=1)
+            db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=day,
+                                end_time=day + timedelta(hours=2), updated_at=LONG_AGO))
+    db.session.commit()
+
+
+def stored(table, key):
+    # {id: [(similar id, score, shared)]} as stored, best first
+    lists = {}
+    for id, similar_id, score, shared in db.session.execute(
+            select([table.c[key], table.c.similar_id, table.c.score, table.c.shared])
+            .order_by(table.c[key], table.c.rank)):
+        lists.setdefault(id, []).append((similar_id, round(score, 6), shared))
+    return lists
+
+
+def cosine(shared, size, other, weight=1.0):
+    # the booking cosine of two entities of size and other bookings
+    return round(weight * shared / math.sqrt(size * other), 6)
+
+
+def test_build_ranks_by_shared_artists(bookings):
+    with db.engine.begin() as conn:
+        assert build(conn, 'venue', 6, 0.0) == 5
+        build(conn, 'artist', 6, 0.0)
+    assert stored(venue_similarities, 'venue_id') == {
+        1: [(2, cosine(3, 3, 3), 3), (3, cosine(2, 3, 2), 2), (4, cosine(1, 3, 1), 1)],
+        2: [(1, cosine(3, 3, 3), 3), (3, cosine(2, 3, 2), 2), (4, cosine(1, 3, 1), 1)],
+        # ties are ranked by id
+        3: [(1, cosine(2, 2, 3), 2), (2, cosine(2, 2, 3), 2)],
+        4: [(1, cosine(1, 1, 3), 1), (2, cosine(1, 1, 3), 1)],
+    }
+    assert stored(artist_similarities, 'artist_id') == {
+        1: [(2, cosine(3, 3, 3), 3), (3, cosine(2, 3, 3), 2)],
+        2: [(1, cosine(3, 3, 3), 3), (3, cosine(2, 3, 3), 2)],
+        3: [(1, cosine(2, 3, 3), 2), (2, cosine(2, 3, 3), 2)],
+        4: [(5, cosine(1, 1, 1), 1)],
+        5: [(4, cosine(1, 1, 1), 1)],
+    }
+
+
+def test_build_keeps_the_top_k_and_weighs_genres(bookings):
+    # venues 4 and 5 share their only genre, and no artist
+    db.session.add(Genre(id=1, name='Jazz'))
+    db.session.flush()
+    db.session.execute(venue_genres.insert(), [{'venue_id': 4, 'genre_id': 1}, {'venue_id': 5, 'genre_id': 1}])
+    db.session.commit()
+    with db.engine.begin() as conn:
+        build(conn, 'venue', 2, 0.5)
+    lists = stored(venue_similarities, 'venue_id')
+    assert lists[1] == [(2, cosine(3, 3, 3, 0.5), 3), (3, cosine(2, 3, 2, 0.5), 2)]
+    assert lists[4] == [(5, 0.5, 0), (1, cosine(1, 1, 3, 0.5), 1)]
+    assert lists[5] == [(4, 0.5, 0)]
+
+
+def test_refresh_matches_a_build(bookings):
+    with db.engine.begin() as conn:
+        build(conn, 'venue', 3, 0.0)
+        build(conn, 'artist', 3, 0.0)
+    # venue 5 books artists 1 and 3: venues 3 and 4 see it in their lists
+    # without a write of their own
+    since = datetime.utcnow() - timedelta(seconds=1)
+    day = datetime(2031, 1, 1, 20)
+    db.session.add_all([Show(venue_id=5, artist_id=1, start_time=day, end_time=day + timedelta(hours=2)),
+                        Show(venue_id=5, artist_id=3, start_time=day + timedelta(days=1),
+                             end_time=day + timedelta(days=1, hours=2))])
+    db.session.commit()
+    with db.engine.begin() as conn:
+        refreshed = refresh(conn, 'venue', since, 3, 0.0)
+        refresh(conn, 'artist', since, 3, 0.0)
+    assert {3, 4, 5} <= refreshed
+    venues, artists = stored(venue_similarities, 'venue_id'), stored(artist_similarities, 'artist_id')
+    assert venues[4] == [(1, cosine(1, 1, 3), 1), (2, cosine(1, 1, 3), 1), (5, cosine(1, 1, 4), 1)]
+    with db.engine.begin() as conn:
+        build(conn, 'venue', 3, 0.0)
+        build(conn, 'artist', 3, 0.0)
+    assert venues == stored(venue_similarities, 'venue_id')
+    assert artists == stored(artist_similarities, 'artist_id')
+
+
+def test_refresh_command_builds_first(app, bookings):
+    runner = app.test_cli_runner()
+    result = runner.invoke(refresh_command)
+    assert result.exit_code == 0, result.output
+    assert 'every venue list built' in result.output
+    built = stored(venue_similarities, 'venue_id')
+    result = runner.invoke(refresh_command)
+    assert result.exit_code == 0, result.output
+    assert 'venue lists refreshed' in result.output
+    assert stored(venue_similarities, 'venue_id') == built
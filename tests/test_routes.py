@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app import create_app
+from benchmarks.datagen import seed
+from benchmarks.routes import LATENCY_BUDGET_MS, ROUTES, request
+from models import db
+from tests.conftest import make_config
+
+VENUES, ARTISTS, SHOWS = 100, 200, 2000
+ROUNDS = 10
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # one catalog for every route, the writes run last; the profiler raises
+    # QueryBudgetExceeded on a route over its SQL_QUERY_BUDGETS entry
+    database_url = 'sqlite:///{}'.format(tmp_path_factory.mktemp('routes') / 'bench.db')
+    seed(create_engine(database_url), VENUES, ARTISTS, SHOWS)
+    app = create_app(make_config(database_url, SQL_PROFILER=True))
+    with app.app_context():
+        yield app.test_client()
+        db.session.remove()
+
+
+@pytest.mark.parametrize('method, path, data', [route[1:] for route in ROUTES],
+                         ids=[route[0] for route in ROUTES])
+def test_route(benchmark, client, method, path, data):
+    status = benchmark.pedantic(request, args=(client, method, path, data),
+                                rounds=ROUNDS, warmup_rounds=1)
+    assert status < 400
+    # no stats with --benchmark-disable
+    if benchmark.stats:
+        assert benchmark.stats['min'] * 1000 <= LATENCY_BUDGET_MS
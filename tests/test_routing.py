@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+import routing
+from app import create_app
+from models import db, Venue
+from tests.conftest import make_config
+
+VENUE = {'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'phone': '512-555-0100',
+         'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/venue'}
+
+
+def add_venue(engine, name):
+    values = {key: value for key, value in VENUE.items() if key != 'genres'}
+    engine.execute(Venue.__table__.insert(), dict(values, name=name))
+
+
+@pytest.fixture
+def replicated_app(tmp_path):
+    # two SQLite files told apart by a venue of their own; nothing copies
+    # the primary to the replica, so a read shows where it went
+    primary_url = 'sqlite:///{}'.format(tmp_path / 'primary.db')
+    replica_url = 'sqlite:///{}'.format(tmp_path / 'replica.db')
+    app = create_app(make_config(primary_url, DB_REPLICA_URLS=[replica_url], DB_READ_YOUR_WRITES=5))
+    replica = create_engine(replica_url)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(replica)
+        add_venue(db.engine, 'Primary Hall')
+        add_venue(replica, 'Replica Hall')
+        yield app
+        db.session.remove()
+    replica.dispose()
+
+
+def test_reads_go_to_the_replica(replicated_app):
+    response = replicated_app.test_client().get('/venues')
+    assert b'Replica Hall' in response.data
+    assert b'Primary Hall' not in response.data
+
+
+def test_writes_go_to_the_primary_and_pin_the_client_to_it(replicated_app):
+    client = replicated_app.test_client()
+    client.post('/venues/create', data=dict(VENUE, name='New Hall'))
+    assert Venue.query.filter_by(name='New Hall').count() == 1
+    assert replicated_app.extensions['db_replicas'][0].execute(
+        Venue.__table__.select().where(Venue.name == 'New Hall')).fetchall() == []
+
+    # read-your-writes: the same client reads the primary for a while
+    response = client.get('/venues')
+    assert b'New Hall' in response.data
+    assert b'Replica Hall' not in response.data
+    # other clients still read the replica
+    assert b'Replica Hall' in replicated_app.test_client().get('/venues').data
+
+
+def test_reads_return_to_the_replica_after_the_window(replicated_app, monkeypatch):
+    client = replicated_app.test_client()
+    client.post('/venues/create', data=dict(VENUE, name='New Hall'))
+    assert b'New Hall' in client.get('/venues').data
+
+    later = time.time() + replicated_app.config['DB_READ_YOUR_WRITES'] + 1
+    monkeypatch.setattr(routing.time, 'time', lambda: later)
+    response = client.get('/venues')
+    assert b'Replica Hall' in response.data
+    assert b'New Hall' not in response.data
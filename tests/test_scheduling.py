@@ -0,0 +1,107 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Artist, Show, Venue, DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+from scheduling import IntervalIndex, find_conflict
+
+DAY = datetime(2030, 1, 1)
+
+
+def at(hour):
+    return DAY + timedelta(hours=hour)
+
+
+def overlapping(bookings, start_time, end_time):
+    return {show_id for booked_start, booked_end, show_id in bookings
+            if booked_start < end_time and booked_end > start_time}
+
+
+@pytest.fixture
+def venue(app):
+    # one venue and artist booked 10:00-16:00, and 11:00-12:00 overlapping
+    # it, as SQLite lets it be stored
+    venue, artist = Venue(name='Hall'), Artist(name='Band')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add_all([
+        Show(venue_id=venue.id, artist_id=artist.id, start_time=at(10), end_time=at(16)),
+        Show(venue_id=venue.id, artist_id=artist.id, start_time=at(11), end_time=at(12)),
+    ])
+    db.session.commit()
+    return venue
+
+
+def test_find_conflict_sees_past_stored_overlaps(venue):
+    conflict = find_conflict(db.session, venue.id, venue.id, at(13), at(14))
+    assert conflict is not None
+    assert (conflict.start_time, conflict.end_time) == (at(10), at(16))
+    assert find_conflict(db.session, venue.id, venue.id, at(16), at(17)) is None
+
+
+def test_interval_index_sees_past_stored_overlaps():
+    index = IntervalIndex(lambda kind, key: [(at(10), at(16), 1), (at(11), at(12), 2)])
+    conflict = index.find('venue', 1, at(13), at(14))
+    assert conflict is not None and conflict.show_id == 1
+    assert index.find('venue', 1, at(16), at(17)) is None
+
+
+def test_interval_index_matches_brute_force():
+    rng = random.Random(7)
+    bookings = [(at(start), at(start + rng.randint(1, 8)), id)
+                for id, start in enumerate(rng.randint(0, 100) for _ in range(40))]
+    index = IntervalIndex(lambda kind, key: bookings[:20])
+    for booking in bookings[20:]:
+        index.add('venue', 1, *booking)
+    for _ in range(300):
+        start = rng.randint(-5, 110)
+        start_time, end_time = at(start), at(start + rng.randint(1, 8))
+        conflict = index.find('venue', 1, start_time, end_time)
+        expected = overlapping(bookings, start_time, end_time)
+        if expected:
+            assert conflict is not None and conflict.show_id in expected
+        else:
+            assert conflict is None
+
+
+def test_find_conflict_matches_brute_force(venue):
+    # bookings up to MAX_SHOW_DURATION long, so the bounded scan must
+    # still reach the ones starting a full day before the new show
+    rng = random.Random(11)
+    bookings = [(at(10), at(16), 1), (at(11), at(12), 2)]
+    for start in (rng.randint(20, 400) for _ in range(40)):
+        show = Show(venue_id=venue.id, artist_id=venue.id, start_time=at(start),
+                    end_time=at(start) + rng.choice([timedelta(hours=1), timedelta(hours=5), MAX_SHOW_DURATION]))
+        db.session.add(show)
+        db.session.flush()
+        bookings.append((show.start_time, show.end_time, show.id))
+    db.session.commit()
+    for _ in range(300):
+        start = rng.randint(0, 430)
+        start_time, end_time = at(start), at(start + rng.randint(1, 8))
+        conflict = find_conflict(db.session, venue.id, venue.id, start_time, end_time)
+        expected = overlapping(bookings, start_time, end_time)
+        if expected:
+            assert conflict is not None and conflict.show_id in expected
+        else:
+            assert conflict is None
+
+
+@pytest.mark.parametrize('duration', ['0', '-30', 'abc', '100000', '1441'])
+def test_invalid_duration_is_rejected(venue, client, duration):
+    response = client.post('/shows/create', data={
+        'venue_id': venue.id, 'artist_id': venue.id,
+        'start_time': '2030-01-02 20:00:00', 'duration': duration})
+    assert b'Show was not listed' in response.data
+    assert Show.query.count() == 2
+
+
+@pytest.mark.parametrize('duration, length', [('', DEFAULT_SHOW_DURATION), ('45', timedelta(minutes=45))])
+def test_show_is_listed(venue, client, duration, length):
+    response = client.post('/shows/create', data={
+        'venue_id': venue.id, 'artist_id': venue.id,
+        'start_time': '2030-01-02 20:00:00', 'duration': duration})
+    assert b'Show was successfully listed!' in response.data
+    show = Show.query.filter(Show.start_time == datetime(2030, 1, 2, 20)).one()
+    assert show.end_time - show.start_time == length
@@ -0,0 +1,26 @@
+import pytest
+
+from benchmarks.datagen import seed
+from models import db, Artist, Venue
+from search import SEARCH_FIELDS, search
+
+
+@pytest.fixture
+def catalog(app):
+    seed(db.engine, 60, 80, 100)
+
+
+@pytest.mark.parametrize('model', [Venue, Artist])
+@pytest.mark.parametrize('term', ['blue', 'Jazz', 'hop', 'CA', 'san', 'trio', 'zzz', '%'])
+def test_search_matches_fields_and_genres(catalog, model, term):
+    expected = {entity.id for entity in model.query.all()
+                if any(term.lower() in (getattr(entity, column.key) or '').lower()
+                       for column in SEARCH_FIELDS[model])
+                or any(term.lower() in genre.name.lower() for genre in entity.genres)}
+    assert {row.id for row in search(model, term, limit=1000)} == expected
+
+
+def test_search_keeps_the_genre_filter(catalog):
+    rows = search(Venue, 'a', limit=1000, genre='Jazz')
+    assert rows
+    assert all('Jazz' in [genre.name for genre in Venue.query.get(row.id).genres] for row in rows)
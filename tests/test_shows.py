@@ -0,0 +1,38 @@
+import pytest
+
+from benchmarks.datagen import seed
+from models import db, Artist, Show, Venue
+from queries import get_shows_listing, resolve
+
+
+@pytest.fixture
+def catalog(app):
+    seed(db.engine, 10, 20, 200)
+
+
+def test_resolve_loads_each_id_once_per_request(catalog, app, queries):
+    with app.test_request_context():
+        queries.count = 0
+        venues = resolve(Venue, [1, 2, 1, '2', 1])
+        assert sorted(venues) == [1, 2] and queries.count == 1
+        assert resolve(Venue, [2, 1]) == venues and queries.count == 1
+        assert sorted(resolve(Venue, [1, 3, 999])) == [1, 3] and queries.count == 2
+        # one cache per model
+        resolve(Artist, [1])
+        assert queries.count == 3
+    with app.test_request_context():
+        resolve(Venue, [1])
+        assert queries.count == 4
+
+
+@pytest.mark.parametrize('limit', [5, 100])
+def test_listing_resolves_venues_and_artists(catalog, app, queries, limit):
+    expected = [(show.venue.name, show.artist.name, show.artist.image_link, show.start_time)
+                for show in Show.query.order_by(Show.start_time, Show.id).limit(limit)]
+    db.session.remove()
+    with app.test_request_context():
+        queries.count = 0
+        shows, _ = get_shows_listing(limit=limit)
+        assert queries.count == 3
+    assert [(show['venue_name'], show['artist_name'], show['artist_image_link'], show['start_time'])
+            for show in shows] == expected
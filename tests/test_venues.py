@@ -0,0 +1,17 @@
+from benchmarks.datagen import seed
+from models import db, Venue
+
+VENUES = 30
+
+
+def test_venues_directory_is_one_query_at_any_size(app, client, queries):
+    counts = []
+    for venues in (VENUES, VENUES * 10):
+        seed(db.engine, venues, 50, venues * 5)
+        name = Venue.query.get(venues).name
+        queries.count = 0
+        response = client.get('/venues')
+        assert response.status_code == 200
+        assert name.encode() in response.data
+        counts.append(queries.count)
+    assert counts == [1, 1]
@@ -0,0 +1,485 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import sys
+from datetime import datetime
+import dateutil.parser
+from flask import (Blueprint, render_template, request, Response, flash, redirect, url_for,
+                   abort, jsonify, stream_with_context, current_app)
+from models import db, Artist, Venue, Show
+from cache import cache
+from pool import ping, pool_stats
+from queries import (get_venues_by_cities, get_shows_listing,
+                     parse_shows_args, get_venue_details, get_artist_details, get_artists,
+                     get_or_create_genres, parse_calendar_args, get_calendar,
+                     next_bucket, previous_bucket)
+from scheduling import find_conflict, lock_bookings, show_end_time
+import search
+from geo import get_nearby_venues, locate, parse_nearby_args
+from tasks import (invalidate_on_commit, invalidate_later, related_tags,
+                   refresh_recommendations_later)
+
+# the forms build long choice lists when imported, the views that render
+# one import it on first use.
+
+pages = Blueprint('pages', __name__)
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@pages.route('/')
+def index():
+  return render_template('pages/home.html')
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@pages.route('/venues')
+@cache.cached_view('venues')
+def venues():
+  # num_shows should be aggregated based on number of upcoming shows per venue.
+  data = get_venues_by_cities(genre=request.args.get('genre'))
+  return render_template('pages/venues.html', areas=data);
+
+@pages.route('/venues/search', methods=['POST'])
+def search_venues():
+  # seach for Hop should return "The Musical Hop".
+  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+  search_key = request.form.get("search_term","")
+  search_res = search.search_venues(search_key, genre=request.values.get('genre'))
+  venues = [{
+    'id' : venue.id,
+    'name' : venue.name,
+    'num_upcoming_shows' : venue.upcoming_shows_count
+  }
+    for venue in search_res
+  ]
+  response={
+    "count": len(venues),
+    "data": venues
+  }
+  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+
+def get_past_limit():
+  # how many past shows a detail page renders, ?past_limit= overrides it
+  limit = request.args.get('past_limit', current_app.config['PAST_SHOWS_LIMIT'], type=int)
+  return max(0, limit)
+
+@pages.route('/venues/nearby')
+def venues_nearby():
+  # the venues nearest to ?lat=&lon=, within ?radius= km
+  if 'lat' not in request.args and 'lon' not in request.args:
+    return render_template('pages/venues_nearby.html', venues=None)
+  try:
+    latitude, longitude, radius, limit = parse_nearby_args(request.args, current_app.config)
+  except (KeyError, ValueError):
+    abort(400)
+  return render_template('pages/venues_nearby.html', radius=radius,
+                         venues=get_nearby_venues(latitude, longitude, radius, limit))
+
+@pages.route('/venues/<int:venue_id>')
+@cache.cached_view('venue:{venue_id}')
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+  data = get_venue_details(venue_id, past_limit=get_past_limit())
+  if data is None:
+    abort(404)
+  return render_template('pages/show_venue.html', venue=data)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@pages.route('/venues/create', methods=['GET'])
+def create_venue_form():
+  from forms import VenueForm
+  form = VenueForm()
+  return render_template('forms/new_venue.html', form=form)
+
+@pages.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+  error = False
+  data = request.form
+  try:
+    venue = Venue(name = data.get('name'),
+                  city = data.get('city'),
+                  state = data.get('state'),
+                  address = data.get('address'),
+                  phone = data.get('phone'),
+                  facebook_link = data.get('facebook_link'),
+                  image_link = data.get('image_link'),
+                  website_link = data.get('website_link'),
+                  genres = get_or_create_genres(data.getlist('genres')),
+                  seeking_talent = (data.get('seeking') == 'on'),
+                  seeking_description = data.get('seeking_des')
+                  )
+    locate(venue)
+    db.session.add(venue)
+    invalidate_on_commit('venues')
+    db.session.commit()
+  except:
+    print(sys.exc_info())
+    error = True
+    db.session.rollback()
+
+  if not error:
+    # on successful db insert, flash success
+    flash('Venue ' + request.form['name'] + ' was successfully listed!')
+  else:
+    flash('Venue ' + request.form['name'] + ' was not listed! there is a problem!')
+
+  return render_template('pages/home.html')
+
+@pages.route('/venues/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+  error = False
+  try:
+    db_venue = Venue.query.get(int(venue_id))
+    if not db_venue:
+      raise Exception()
+    invalidate_on_commit('calendar', 'venues', 'shows', 'venue:{}'.format(db_venue.id))
+    # its shows go with it, the artists they were of are looked up first
+    invalidate_later(tags=related_tags(venues=[db_venue.id]))
+    db.session.delete(db_venue)
+    db.session.commit()
+  except:
+    print(sys.exc_info())
+    error = True
+    db.session.rollback()
+  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  # clicking that button delete it from the db then redirect the user to the homepage
+  return redirect(url_for('.index'), code = 200)
+
+#  Artists
+#  ----------------------------------------------------------------
+@pages.route('/artists')
+@cache.cached_view('artists')
+def artists():
+  data = get_artists(genre=request.args.get('genre'))
+  return render_template('pages/artists.html', artists=data)
+
+
+@pages.route('/artists/search', methods=['POST'])
+def search_artists():
+  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
+  # search for "band" should return "The Wild Sax Band".
+  search_key = request.form.get("search_term","")
+  search_res = search.search_artists(search_key, genre=request.values.get('genre'))
+  artists = [{
+    'id' : artist.id,
+    'name' : artist.name,
+    'num_upcoming_shows' : artist.upcoming_shows_count
+  }
+    for artist in search_res
+  ]
+  response={
+    "count": len(artists),
+    "data": artists
+  }
+  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+
+@pages.route('/artists/<int:artist_id>')
+@cache.cached_view('artist:{artist_id}')
+def show_artist(artist_id):
+  # shows the venue page with the given venue_id
+  data = get_artist_details(artist_id, past_limit=get_past_limit())
+  if data is None:
+    abort(404)
+  return render_template('pages/show_artist.html', artist=data)
+
+#  Update
+#  ----------------------------------------------------------------
+@pages.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+  from forms import ArtistForm
+  form = ArtistForm()
+  db_artist = Artist.query.get(int(artist_id))
+  artist = {}
+
+  try:
+    if not db_artist :
+      raise Exception()
+    artist={
+      "id": db_artist.id,
+      "name": db_artist.name,
+      "genres": [genre.name for genre in db_artist.genres],
+      "city": db_artist.city,
+      "state": db_artist.state,
+      "phone": db_artist.phone,
+      "website": db_artist.website_link,
+      "facebook_link": db_artist.facebook_link,
+      "seeking_venue": bool(db_artist.seeking_venue),
+      "seeking_description":  db_artist.seeking_description,
+      "image_link": db_artist.image_link
+    }
+  except:
+    print(sys.exc_info())
+    pass;
+  return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+@pages.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+  # artist record with ID <artist_id> using the new attributes
+  error = False
+  data = request.form
+  try:
+    artist = Artist.query.get(int(artist_id))
+    if not artist:
+      raise Exception()
+    artist.name = data.get('name')
+    artist.city = data.get('city')
+    artist.state = data.get('state')
+    artist.phone = data.get('phone')
+    artist.facebook_link = data.get('facebook_link')
+    artist.image_link = data.get('image_link')
+    artist.website_link = data.get('website_link')
+    artist.genres = get_or_create_genres(data.getlist('genres'))
+    artist.seeking_description = data.get('seeking_des')
+    artist.seeking_venue = (data.get('seeking') == 'on')
+    invalidate_on_commit('artists', 'shows', 'artist:{}'.format(artist.id))
+    invalidate_later(artists=[artist.id])
+    db.session.commit()
+  except:
+    print(sys.exc_info())
+    error = True
+    db.session.rollback()
+  return redirect(url_for('.show_artist', artist_id=artist_id))
+
+@pages.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+  from forms import VenueForm
+  form = VenueForm()
+  db_venue = Venue.query.get(int(venue_id))
+  venue = {}
+  error = False
+  try:
+    if not db_venue :
+      raise Exception()
+    venue = {
+      "id": venue_id,
+      "name":db_venue.name,
+      "genres": [genre.name for genre in db_venue.genres],
+      "address": db_venue.address,
+      "city": db_venue.city,
+      "state": db_venue.state,
+      "phone": db_venue.phone,
+      "website": db_venue.website_link,
+      "facebook_link": db_venue.facebook_link,
+      "seeking_talent": bool(db_venue.seeking_talent),
+      "seeking_description": db_venue.seeking_description,
+      "image_link": db_venue.image_link
+    }
+  except:
+    print(sys.exc_info())
+    pass;
+  # venue record with ID <venue_id> using the new attributes
+  return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+@pages.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+  error = False
+  data = request.form
+  try:
+    venue = Venue.query.get(int(venue_id))
+    if not venue:
+      raise Exception()
+    moved = (venue.city, venue.state) != (data.get('city'), data.get('state'))
+    venue.name = data.get('name')
+    venue.city = data.get('city')
+    venue.state = data.get('state')
+    if moved:
+      locate(venue)
+    venue.address = data.get('address')
+    venue.phone = data.get('phone')
+    venue.facebook_link = data.get('facebook_link')
+    venue.image_link = data.get('image_link')
+    venue.website_link = data.get('website_link')
+    venue.genres = get_or_create_genres(data.getlist('genres'))
+    venue.seeking_talent = (data.get('seeking') == 'on')
+    venue.seeking_description = data.get('seeking_des')
+    invalidate_on_commit('venues', 'shows', 'venue:{}'.format(venue.id))
+    invalidate_later(venues=[venue.id])
+    db.session.commit()
+  except:
+    error = True
+    print(sys.exc_info())
+    db.session.rollback()
+    pass    
+  # on successful db modification, flash success
+  if not error:
+    flash('Venue ' + request.form['name'] + ' was successfully listed!')
+  else:
+    # on unsuccessful db insert, flash an error instead.
+    flash('Venue ' + request.form['name'] + ' was not listed! there is a problem!')
+  # venue record with ID <venue_id> using the new attributes
+  return redirect(url_for('.show_venue', venue_id=venue_id))
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@pages.route('/artists/create', methods=['GET'])
+def create_artist_form():
+  from forms import ArtistForm
+  form = ArtistForm()
+  return render_template('forms/new_artist.html', form=form)
+
+@pages.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+  # called upon submitting the new artist listing form
+  error = False
+  data = request.form
+  try:
+    artist = Artist(name = data.get('name'),
+                    city = data.get('city'),
+                    state = data.get('state'),
+                    phone = data.get('phone'),
+                    genres = get_or_create_genres(data.getlist('genres')),
+                    facebook_link = data.get('facebook_link'),
+                    image_link = data.get('image_link'),
+                    website_link = data.get('website_link'),
+                    seeking_venue = (data.get('seeking') == 'on'),
+                    seeking_description = data.get('seeking_des'))
+    db.session.add(artist)
+    invalidate_on_commit('artists')
+    db.session.commit()
+  except:
+    print(sys.exc_info())
+    error = True
+    db.session.rollback()
+
+  if not error:
+    # on successful db insert, flash success
+    flash('Artist ' + request.form['name'] + ' was successfully listed!')
+  else:
+    flash('Artist ' + request.form['name'] + ' was not listed! due to some error(s)')
+
+  return render_template('pages/home.html')
+
+
+#  Shows
+#  ----------------------------------------------------------------
+def stream_template(template_name, **context):
+  # like render_template, but yields the page in chunks as it renders
+  current_app.update_template_context(context)
+  stream = current_app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(current_app.config['TEMPLATE_STREAM_BUFFER'])
+  return stream
+
+@pages.route('/shows')
+def shows():
+  # displays list of shows at /shows, one keyset page at a time
+  try:
+    after, limit, filters = parse_shows_args(request.args, current_app.config['SHOWS_PAGE_SIZE'],
+                                             current_app.config['SHOWS_MAX_PAGE_SIZE'])
+  except ValueError:
+    abort(400)
+
+  data, next_cursor = cache.get_or_set('shows:' + request.full_path, ['shows'],
+                                       lambda: get_shows_listing(after, limit, **filters))
+
+  next_url = None
+  if next_cursor:
+    args = request.args.to_dict()
+    args['after'] = next_cursor
+    next_url = url_for('.shows', **args)
+  return Response(stream_with_context(
+    stream_template('pages/shows.html', shows=data, next_url=next_url)))
+
+@pages.route('/calendar')
+def calendar():
+  # number of shows per day, week or month of a date range, optionally of
+  # one venue or artist
+  try:
+    bucket, start, end, filters = parse_calendar_args(request.args,
+                                                      current_app.config['CALENDAR_MAX_BUCKETS'])
+  except ValueError:
+    abort(400)
+  buckets = get_calendar(bucket, start, end, past_ttl=current_app.config['CALENDAR_PAST_TTL'],
+                         **filters)
+  # the ranges of as many buckets before and after this one
+  previous_start = start
+  for _ in buckets:
+    previous_start = previous_bucket(previous_start, bucket)
+  next_end = end
+  for _ in buckets:
+    next_end = next_bucket(next_end, bucket)
+  args = {name: value for name, value in filters.items() if value is not None}
+  return render_template('pages/calendar.html', bucket=bucket, buckets=buckets,
+                         start=start, end=end, filters=args,
+                         max_shows=max([b['num_shows'] for b in buckets] + [1]),
+                         previous_url=url_for('.calendar', bucket=bucket, start=previous_start.date(),
+                                              end=start.date(), **args),
+                         next_url=url_for('.calendar', bucket=bucket, start=end.date(),
+                                          end=next_end.date(), **args))
+
+@pages.route('/shows/create')
+def create_shows():
+  # renders form. do not touch.
+  from forms import ShowForm
+  form = ShowForm()
+  return render_template('forms/new_show.html', form=form)
+
+@pages.route('/shows/create', methods=['POST'])
+def create_show_submission():
+  # called to create new shows in the db, upon submitting new show listing form
+  from forms import ShowForm
+  error = False
+  conflict = None
+  data = request.form
+  form = ShowForm()
+  if not form.duration.validate(form):
+    flash('Show was not listed, duration: {}'.format(' '.join(form.duration.errors)))
+    return render_template('pages/home.html')
+  try:
+    start_time = dateutil.parser.parse(data.get('start_time'))
+    end_time = show_end_time(start_time, form.duration.data)
+    lock_bookings(db.session, int(data.get('venue_id')), int(data.get('artist_id')))
+    conflict = find_conflict(db.session, int(data.get('venue_id')), int(data.get('artist_id')),
+                             start_time, end_time)
+    if conflict is None:
+      show = Show(artist_id = data.get('artist_id'),
+                  venue_id = data.get('venue_id'),
+                  start_time = start_time,
+                  end_time = end_time)
+      db.session.add(show)
+      invalidate_on_commit('shows', 'venues', 'venue:{}'.format(show.venue_id),
+                           'artist:{}'.format(show.artist_id))
+      # a show in a past calendar bucket changes a cached count
+      if start_time < datetime.now():
+        invalidate_on_commit('calendar')
+      refresh_recommendations_later()
+      db.session.commit()
+  except:
+    print(sys.exc_info())
+    error = True
+    db.session.rollback()
+  if conflict is not None:
+    flash('Show was not listed, {}.'.format(conflict))
+  elif not error:
+    # on successful db insert, flash success
+    flash('Show was successfully listed!')
+  else:
+    flash('Show was not listed! due to an Error(s)!')
+
+  return render_template('pages/home.html')
+
+#  Cache
+#  ----------------------------------------------------------------
+
+@pages.route('/healthz/cache')
+def cache_stats():
+  return jsonify(cache.stats())
+
+@pages.route('/healthz/db')
+def db_stats():
+  status = {}
+  try:
+    status['pool'] = pool_stats.status(db.engine)
+    status['ping_ms'] = ping(db.engine)
+  except:
+    print(sys.exc_info())
+    status['error'] = 'database unreachable'
+    return jsonify(status), 503
+  return jsonify(status)
@@ -0,0 +1,9 @@
+from app import create_app
+
+# the entry point of the web workers:
+#
+#   gunicorn -w 4 wsgi:app
+#
+# the flask command builds its own app through app.create_app.
+
+app = create_app()